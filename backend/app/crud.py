@@ -5,11 +5,13 @@ from app import schemas, models
 from datetime import datetime
 from uuid import UUID
 from typing import List, Optional
-from sqlalchemy import func, desc, and_
+from sqlalchemy import func, desc, and_, or_
 
 # from app.models.courses import Course, CourseModule, UserCourseEnrollment, UserModuleProgress
 from app import schemas
-from datetime import datetime
+from app.services import user_context
+from app.services.change_events import change_notifier, MESSAGES_CHANNEL
+from datetime import datetime, timedelta
 from uuid import UUID
 from typing import List, Optional
 
@@ -27,6 +29,8 @@ def create_user(db: Session, user: schemas.UserCreate):
         created_at=datetime.utcnow(),
     )
     db.add(db_user)
+    db.flush()
+    user_context.record_specialty(db, db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -40,7 +44,9 @@ def update_user(db: Session, user_id: int, updates: schemas.UserUpdate):
         if value is not None:
             setattr(user, var, value)
     user.updated_at = datetime.utcnow()
+    user_context.record_specialty(db, user)
     db.commit()
+    user_context.user_context_cache.invalidate(user.id)
     db.refresh(user)
     return user
 
@@ -48,7 +54,10 @@ def update_user(db: Session, user_id: int, updates: schemas.UserUpdate):
 def create_mood(db: Session, mood: schemas.MoodCreate):
     db_mood = models.MoodEntry(**mood.dict())
     db.add(db_mood)
+    db.flush()
+    user_context.record_mood(db, db_mood)
     db.commit()
+    user_context.user_context_cache.invalidate(db_mood.user_id)
     db.refresh(db_mood)
     return db_mood
 
@@ -59,7 +68,10 @@ def get_user_moods(db: Session, user_id: UUID):
 def create_micro_assessment(db: Session, micro: schemas.MicroAssessmentCreate):
     db_micro = models.MicroAssessment(**micro.dict())
     db.add(db_micro)
+    db.flush()
+    user_context.record_micro_assessment(db, db_micro)
     db.commit()
+    user_context.user_context_cache.invalidate(db_micro.user_id)
     db.refresh(db_micro)
     return db_micro
 
@@ -101,7 +113,9 @@ def create_mbi_assessment_with_answers(db: Session, user_id: UUID, answers_data:
         )
         db.add(db_answer)
     
+    user_context.record_mbi_assessment(db, db_assessment)
     db.commit()
+    user_context.user_context_cache.invalidate(user_id)
     db.refresh(db_assessment)
     return db_assessment
 
@@ -113,7 +127,7 @@ def get_mbi_assessment_by_id(db: Session, assessment_id: UUID):
 
 
 # JOURNAL
-def create_journal_entry(db: Session, entry: schemas.JournalEntryCreate, analysis: str):
+def create_journal_entry(db: Session, entry: schemas.JournalEntryCreate, analysis: str, commit: bool = True):
     # Convert pydantic model to dict
     entry_dict = entry.dict()
     # Add analysis field
@@ -122,6 +136,10 @@ def create_journal_entry(db: Session, entry: schemas.JournalEntryCreate, analysi
     # Create the database entry
     db_entry = models.JournalEntry(**entry_dict)
     db.add(db_entry)
+    if not commit:
+        # The caller commits it together with its own changes
+        db.flush()
+        return db_entry
     db.commit()
     db.refresh(db_entry)
     return db_entry
@@ -191,8 +209,26 @@ def delete_conversation(db: Session, conversation_id: UUID):
     return False
 
 # Message
-def create_message(db: Session, message: schemas.MessageCreate):
-    db_message = models.Message(**message.dict())
+def _next_message_time(db: Session, conversation_id: UUID) -> datetime:
+    """
+    Now, but never before the conversation's latest message: replies are
+    stamped by the job worker and user messages by the API, whose clocks may
+    disagree, and since-cursors rely on the order holding.
+    """
+    now = datetime.utcnow()
+    latest = db.query(func.max(models.Message.created_at)).filter(
+        models.Message.conversation_id == conversation_id
+    ).scalar()
+    if latest is not None and now <= latest:
+        return latest + timedelta(microseconds=1)
+    return now
+
+def create_message(db: Session, message: schemas.MessageCreate, model_name: str = None):
+    db_message = models.Message(
+        **message.dict(),
+        model_name=model_name,
+        created_at=_next_message_time(db, message.conversation_id)
+    )
     db.add(db_message)
     db.commit()
     db.refresh(db_message)
@@ -202,15 +238,62 @@ def create_message(db: Session, message: schemas.MessageCreate):
         db_conversation.updated_at = datetime.utcnow()
         db.commit()
     
+    # Wake long-polling readers of this conversation
+    change_notifier.publish(MESSAGES_CHANNEL, message.conversation_id)
     return db_message
 
 def get_conversation_messages(db: Session, conversation_id: UUID):
     return db.query(models.Message).filter(models.Message.conversation_id == conversation_id).order_by(models.Message.created_at).all()
 
-def get_conversation_with_messages(db: Session, conversation_id: UUID):
+def get_conversation_messages_since(db: Session, conversation_id: UUID, message_id: Optional[UUID] = None, created_after: Optional[datetime] = None):
+    """
+    Messages newer than a cursor: a message id (unknown ids return everything,
+    so the client resyncs) or a creation time.
+    """
+    query = db.query(models.Message).filter(models.Message.conversation_id == conversation_id)
+    anchor = None
+    if message_id is not None:
+        anchor = db.query(models.Message.created_at, models.Message.id).filter(
+            models.Message.conversation_id == conversation_id,
+            models.Message.id == message_id
+        ).first()
+    if anchor is not None:
+        # (created_at, id) order, so messages sharing the anchor's timestamp are not skipped
+        query = query.filter(or_(
+            models.Message.created_at > anchor.created_at,
+            and_(models.Message.created_at == anchor.created_at, models.Message.id > anchor.id)
+        ))
+    elif created_after is not None:
+        query = query.filter(models.Message.created_at > created_after)
+    return query.order_by(models.Message.created_at, models.Message.id).all()
+
+def get_conversation_messages_range(db: Session, conversation_id: UUID, offset: int, limit: int):
+    return db.query(models.Message).filter(
+        models.Message.conversation_id == conversation_id
+    ).order_by(models.Message.created_at).offset(offset).limit(limit).all()
+
+def update_conversation_summary(db: Session, conversation_id: UUID, summary: str, message_count: int, summarized_from: Optional[int] = None):
+    """
+    Store a new rolling summary. With `summarized_from`, only if the stored
+    summary still ends there, so a refresh that lost a race is dropped.
+    """
+    query = db.query(models.Conversation).filter(models.Conversation.id == conversation_id)
+    if summarized_from is not None:
+        query = query.filter(func.coalesce(models.Conversation.summary_message_count, 0) == summarized_from)
+    updated = query.update(
+        {models.Conversation.summary: summary, models.Conversation.summary_message_count: message_count},
+        synchronize_session=False
+    )
+    db.commit()
+    return get_conversation(db, conversation_id) if updated else None
+
+def get_conversation_with_messages(db: Session, conversation_id: UUID, since_message_id: Optional[UUID] = None, created_after: Optional[datetime] = None):
     conversation = get_conversation(db, conversation_id)
     if conversation:
-        messages = get_conversation_messages(db, conversation_id)
+        if since_message_id is not None or created_after is not None:
+            messages = get_conversation_messages_since(db, conversation_id, since_message_id, created_after)
+        else:
+            messages = get_conversation_messages(db, conversation_id)
         # Don't return a dictionary, just attach the messages to the conversation object
         setattr(conversation, "messages", messages)
         return conversation
@@ -40,7 +40,7 @@ from app import models
 from app.database import engine
 from app.routes import (
     users, moods, micro_assessments, mbi_assessments, 
-    journal, chatbot, goals, wellness, courses
+    journal, chatbot, goals, wellness, courses, metrics
 )
 
 from dotenv import load_dotenv
@@ -74,6 +74,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Refuse oversized journal uploads before the multipart parser spools them
+# (the form fields get 1 MB on top of the audio limit)
+from app.services.audio_storage import AUDIO_MAX_BYTES
+from app.utils.body_limit import BodySizeLimitMiddleware
+app.add_middleware(BodySizeLimitMiddleware, limits={("POST", "/journals/"): AUDIO_MAX_BYTES + 1024 * 1024})
+
 # Create uploads directory if it doesn't exist
 os.makedirs("uploads/audio", exist_ok=True)
 
@@ -87,6 +93,7 @@ app.include_router(chatbot.router, prefix="/chatbot", tags=["Chatbot"])
 app.include_router(goals.router, prefix="/goals", tags=["Goals"])
 app.include_router(wellness.router, prefix="/wellness", tags=["Wellness Activities"])
 app.include_router(courses.router, prefix="/courses", tags=["Courses"])
+app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
 
 # Serve static files (for uploaded audio files)
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
@@ -143,6 +150,26 @@ async def startup_event():
     """Initialize services on startup"""
     logger.info("WellMed API starting up...")
     
+    # Open the shared Ollama connection pool
+    from app.services.http_client import ollama_http
+    await ollama_http.start()
+    
+    # Probe every Ollama backend and keep health-checking them
+    from app.services.ollama_pool import ollama_pool
+    await ollama_pool.start()
+    
+    # Write per-call LLM telemetry to the llm_calls table in batches
+    from app.services.llm_telemetry import llm_ledger
+    await llm_ledger.start()
+    
+    # Wake long-polling and streaming reads, across processes when on Postgres
+    from app.services.change_events import change_notifier
+    await change_notifier.start()
+    
+    # Load the models now so the first chat does not pay for it, then keep them warm
+    from app.services.model_residency import model_residency
+    await model_residency.start()
+    
     # Check Ollama availability
     try:
         from app.services.ollama_service import ollama_service
@@ -154,12 +181,39 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Failed to check Ollama availability: {str(e)}")
     
+    # Run queued AI jobs in this process unless a separate worker handles them
+    if os.getenv("RUN_JOB_WORKER_IN_API", "true").lower() == "true":
+        from app.services import ai_jobs, bulk_reanalysis  # registers the job handlers
+        from app.services.job_queue import job_worker
+        await job_worker.start()
+    
     logger.info("WellMed API startup complete")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("WellMed API shutting down...")
+    
+    from app.services.job_queue import job_worker
+    await job_worker.stop()
+    
+    from app.services.transcription import transcription_pool
+    transcription_pool.stop()
+    
+    from app.services.model_residency import model_residency
+    await model_residency.stop()
+    
+    from app.services.change_events import change_notifier
+    await change_notifier.stop()
+    
+    from app.services.ollama_pool import ollama_pool
+    await ollama_pool.stop()
+    
+    from app.services.llm_telemetry import llm_ledger
+    await llm_ledger.stop()
+    
+    from app.services.http_client import ollama_http
+    await ollama_http.close()
 
 if __name__ == "__main__":
     import uvicorn
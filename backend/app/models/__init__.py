@@ -15,6 +15,13 @@ from .courses import Course
 from .course_modules import CourseModule
 from .user_module_progress import UserModuleProgress
 from .user_course_progress import UserCourseProgress
+from .journal_analysis_cache import JournalAnalysisCache
+from .jobs import Job
+from .reanalysis_runs import ReanalysisRun
+from .llm_calls import LLMCall
+from .course_chunks import CourseChunk
+from .user_context_snapshots import UserContextSnapshot
+from .audio_uploads import AudioUpload
 from app.database import Base
 
 # Optional: list all for easy access
@@ -37,4 +44,11 @@ __all__ = [
     "UserModuleProgress"
     "Course",
     "CourseModule",
+    "JournalAnalysisCache",
+    "Job",
+    "ReanalysisRun",
+    "LLMCall",
+    "CourseChunk",
+    "UserContextSnapshot",
+    "AudioUpload",
 ]
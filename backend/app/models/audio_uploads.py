@@ -0,0 +1,26 @@
+from sqlalchemy import Column, String, Integer, DateTime, JSON, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime
+
+from app.database import Base
+
+
+class AudioUpload(Base):
+    """A resumable audio journal upload, assembled from chunks written at arbitrary offsets"""
+    __tablename__ = 'audio_uploads'
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    filename = Column(String, nullable=True)
+    total_bytes = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=True)  # Declared by the client, checked on finalize
+    received_ranges = Column(JSON, nullable=False, default=list)  # Sorted, merged [start, end) byte ranges
+    status = Column(String, nullable=False, default="open")  # 'open', 'complete' or 'expired'
+    journal_entry_id = Column(UUID(as_uuid=True), ForeignKey('journal_entries.id'), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_audio_uploads_status_expires', 'status', 'expires_at'),
+    )
@@ -15,6 +15,9 @@ class Conversation(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     deleted = Column(Boolean, default=False)
+    # Rolling summary of the oldest `summary_message_count` messages
+    summary = Column(Text, nullable=True)
+    summary_message_count = Column(Integer, default=0)
     
     user = relationship("User", back_populates="conversations")
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
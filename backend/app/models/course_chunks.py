@@ -0,0 +1,25 @@
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text, LargeBinary, Index
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime
+
+from app.database import Base
+
+
+class CourseChunk(Base):
+    """A passage of a course module and its embedding, for retrieval in chat"""
+    __tablename__ = 'course_chunks'
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    module_id = Column(UUID(as_uuid=True), ForeignKey('course_modules.id', ondelete='CASCADE'), nullable=False)
+    course_id = Column(String, ForeignKey('courses.id', ondelete='CASCADE'), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+    embedding = Column(LargeBinary, nullable=False)  # Unit-length float32 vector
+    dimensions = Column(Integer, nullable=False)
+    embed_model = Column(String, nullable=False)
+    content_hash = Column(String(64), nullable=False)  # Of the module text it was cut from; unchanged modules are skipped
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_course_chunks_module_id', 'module_id'),
+    )
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text, JSON, Index
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime
+
+from app.database import Base
+
+
+class Job(Base):
+    __tablename__ = 'jobs'
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    job_type = Column(String, nullable=False)  # e.g. 'chat_reply', 'analyze_journal'
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String, nullable=False, default="queued")  # 'queued', 'running', 'done' or 'failed'
+    priority = Column(Integer, nullable=False, default=1)  # lower runs first (see llm_scheduler.Priority)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String, nullable=True)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # Covers the claim query: queued jobs of a type that are due, best priority first
+        Index('ix_jobs_claim', 'status', 'job_type', 'priority', 'run_after'),
+    )
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, Integer, DateTime, Text
+from datetime import datetime
+
+from app.database import Base
+
+
+class JournalAnalysisCache(Base):
+    __tablename__ = 'journal_analysis_cache'
+    # sha256 of normalized text + user context fingerprint + model + prompt version
+    cache_key = Column(String(64), primary_key=True)
+    model_name = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    analysis = Column(Text, nullable=False)
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_hit_at = Column(DateTime, nullable=True)
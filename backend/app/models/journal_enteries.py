@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, Text, Date, Time
+from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, Text, Date, Time, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -13,7 +13,20 @@ class JournalEntry(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey('users.id'))
     text_content = Column(Text, nullable=False)
     audio_path = Column(Text, nullable=True)
+    audio_size_bytes = Column(Integer, nullable=True)
+    audio_sha256 = Column(String(64), nullable=True, index=True)  # Identical recordings share one stored file
+    audio_duration_seconds = Column(Float, nullable=True)
     analysis = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Model and prompt version that produced `analysis` (None for placeholders and fallbacks)
+    analysis_model = Column(String, nullable=True)
+    analysis_prompt_version = Column(String, nullable=True)
+    # 'pending' until a job stores the analysis, then 'complete' (or 'fallback' when Ollama gave up)
+    analysis_status = Column(String, nullable=False, default='pending')
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     user = relationship("User", back_populates="journal_entries")
+
+    __table_args__ = (
+        # A user's entries and their pending analyses
+        Index('ix_journal_entries_user_status', 'user_id', 'analysis_status'),
+    )
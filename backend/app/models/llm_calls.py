@@ -0,0 +1,30 @@
+from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, Index
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime
+
+from app.database import Base
+
+
+class LLMCall(Base):
+    """One Ollama generation, with the timings needed to tell load, prompt eval and generation apart"""
+    __tablename__ = 'llm_calls'
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    endpoint = Column(String, nullable=False)  # 'chat' or 'generate'
+    model = Column(String, nullable=True)
+    backend = Column(String, nullable=True)  # Ollama server that served the call
+    streamed = Column(Boolean, default=False)
+    status = Column(String, nullable=False)  # HTTP status code, or 'error' when no response arrived
+    queue_wait_ms = Column(Float, nullable=True)
+    ttft_ms = Column(Float, nullable=True)
+    total_ms = Column(Float, nullable=True)  # Client-side, from request to last byte
+    load_ms = Column(Float, nullable=True)
+    prompt_eval_ms = Column(Float, nullable=True)
+    eval_ms = Column(Float, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    eval_tokens = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index('ix_llm_calls_created_at', 'created_at'),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, Text, Date, Time
+from sqlalchemy import Column, String, Integer, Float, DateTime, Boolean, ForeignKey, Text, Date, Time, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -13,6 +13,12 @@ class Message(Base):
     conversation_id = Column(UUID(as_uuid=True), ForeignKey('conversations.id'))
     content = Column(Text)
     role = Column(String)  # 'user' or 'assistant'
+    model_name = Column(String, nullable=True)  # Ollama model that generated an assistant message
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
+    conversation = relationship("Conversation", back_populates="messages")
+
+    __table_args__ = (
+        # Conversation history and since-cursor reads
+        Index('ix_messages_conversation_created', 'conversation_id', 'created_at'),
+    )
\ No newline at end of file
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, String, Integer, Float, DateTime, Text, JSON
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from datetime import datetime
+
+from app.database import Base
+
+
+class ReanalysisRun(Base):
+    __tablename__ = 'reanalysis_runs'
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    filters = Column(JSON, nullable=False, default=dict)
+    status = Column(String, nullable=False, default="running")  # 'running', 'cancelled', 'done' or 'failed'
+    # Keyset checkpoint: the last journal entry handled, in (created_at, id) order
+    last_created_at = Column(DateTime, nullable=True)
+    last_entry_id = Column(UUID(as_uuid=True), nullable=True)
+    # Bumped on resume; batch jobs queued for an earlier generation are dropped
+    generation = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    succeeded = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    # Time spent processing batches (excludes waiting for the off-peak window)
+    active_seconds = Column(Float, default=0.0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import UUID
+from datetime import datetime
+
+from app.database import Base
+
+
+class UserContextSnapshot(Base):
+    """The latest mood, check-in and burnout risk of a user, kept current on write for prompt building"""
+    __tablename__ = 'user_context_snapshots'
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    specialty = Column(String, nullable=True)
+    recent_mood = Column(String, nullable=True)
+    mood_at = Column(DateTime, nullable=True)
+    stress_level = Column(Integer, nullable=True)
+    fatigue_level = Column(Integer, nullable=True)
+    micro_at = Column(DateTime, nullable=True)
+    burnout_risk = Column(String, nullable=True)  # 'Low', 'Medium' or 'High', from MBI emotional exhaustion
+    mbi_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
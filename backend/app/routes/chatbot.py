@@ -1,10 +1,32 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+import asyncio
+import json
+import logging
+from fastapi import APIRouter, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from app.models import User
-from app.utils.token import get_current_user
+from app.utils.token import get_current_user, decode_access_token
 from uuid import UUID
-from typing import List
-from app.database import get_db
+from datetime import datetime, timezone
+from typing import List, Optional
+from app.database import get_db, SessionLocal
+from app.utils.sse import format_sse, SSE_HEADERS
+from app.services.context_window import prepare_conversation_history
+from app.services.ai_jobs import enqueue_chat_reply
+from app.services.model_router import model_router, QUICK_TASK
+from app.services.semantic_cache import semantic_cache, context_bucket
+from app.services.change_events import change_notifier, MESSAGES_CHANNEL, LONG_POLL_MAX_WAIT
+from app.services.metrics import metrics
+from app.services.chat_connections import (
+    chat_connections,
+    ChatConnection,
+    format_frame,
+    WS_MAX_MESSAGE_BYTES,
+    WS_POLICY_VIOLATION,
+    WS_MESSAGE_TOO_BIG,
+    WS_TRY_AGAIN_LATER
+)
 from app.schemas import (
     ConversationCreate, 
     ConversationUpdate, 
@@ -21,12 +43,20 @@ from app.crud import (
     delete_conversation,
     create_message,
     get_conversation_messages,
+    get_conversation_messages_since,
     get_conversation_with_messages
 )
-from app.services.chatbot import generate_ai_response, get_user_context_from_db, test_ollama_connection
+from app.services.chatbot import (
+    try_generate_ai_response,
+    stream_ai_response,
+    get_user_context_from_db,
+    test_ollama_connection
+)
 
 router = APIRouter()
 
+logger = logging.getLogger(__name__)
+
 # Health check for Ollama
 @router.get("/health")
 async def check_ollama_health():
@@ -37,6 +67,21 @@ async def check_ollama_health():
     else:
         return {"status": "unhealthy", "message": "Ollama is not accessible"}
 
+def _parse_since(since: str):
+    """A `since` cursor is a message id or an ISO timestamp; returns (message_id, created_after)"""
+    try:
+        return UUID(since), None
+    except ValueError:
+        pass
+    try:
+        created_after = datetime.fromisoformat(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be a message id or an ISO timestamp")
+    if created_after.tzinfo is not None:
+        # Message times are stored as naive UTC
+        created_after = created_after.astimezone(timezone.utc).replace(tzinfo=None)
+    return None, created_after
+
 # Conversation routes
 @router.post("/conversations/", response_model=Conversation)
 def create_new_conversation(
@@ -63,11 +108,15 @@ def get_user_chat_history(
 @router.get("/conversations/{conversation_id}", response_model=ConversationWithMessages)
 def get_single_conversation(
     conversation_id: UUID, 
+    since: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get a specific conversation with all messages"""
-    conversation = get_conversation_with_messages(db, conversation_id=conversation_id)
+    """Get a specific conversation with all messages, or only those after `since` (message id or ISO timestamp)"""
+    since_message_id, created_after = _parse_since(since) if since else (None, None)
+    conversation = get_conversation_with_messages(
+        db, conversation_id=conversation_id, since_message_id=since_message_id, created_after=created_after
+    )
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
@@ -118,7 +167,6 @@ def delete_single_conversation(
 @router.post("/messages/", response_model=Message)
 async def send_message(
     message: MessageCreate, 
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -138,89 +186,283 @@ async def send_message(
     # Save the user message
     user_message = create_message(db=db, message=message)
     
-    # Generate AI response in the background
-    background_tasks.add_task(
-        process_ai_response,
-        conversation_id=message.conversation_id,
-        user_message=message.content,
-        user_id=current_user.id,
-        db=db
-    )
+    # Queue the AI response; a job worker generates and saves it
+    enqueue_chat_reply(db, message.conversation_id, current_user.id)
     
     return user_message
 
-async def process_ai_response(conversation_id: UUID, user_message: str, user_id: UUID, db: Session):
-    """Process AI response using Ollama"""
+FALLBACK_REPLY = "I'm having trouble processing your message right now. As a healthcare professional, remember that it's important to take breaks and practice self-care. Please try again in a moment."
+
+async def _reply_events(conversation_id: UUID, message_history, summary, user_context, user_id: str, model: str):
+    """
+    Stream one assistant reply as (event, data) pairs.
+    
+    `token` pairs while Ollama generates, an `error` pair if generation broke
+    off, then `done` with the persisted assistant message. A reply that broke
+    off is saved as FALLBACK_REPLY, not as its partial text, so the history
+    never shows a truncated reply as a complete one. Shared by the SSE and
+    WebSocket channels.
+    """
+    chunks = []
+    interrupted = False
     try:
-        print(f"Processing AI response for conversation {conversation_id}")
-        
-        # Get conversation history for context
-        messages = get_conversation_messages(db, conversation_id)
-        print(f"Found {len(messages)} existing messages in conversation")
-        
-        # Format messages for AI context (limit to last 10 messages to avoid token limits)
-        message_history = []
-        for msg in messages[-10:]:  # Get last 10 messages
-            message_history.append({
-                "role": msg.role, 
-                "content": msg.content
-            })
-        
-        print(f"Prepared {len(message_history)} messages for AI context")
-        
-        # Get user context for personalized responses
-        user_context = await get_user_context_from_db(db, str(user_id))
-        print(f"User context: {user_context}")
-        
-        # Generate AI response using Ollama
-        print("Calling Ollama for AI response...")
-        ai_response = await generate_ai_response(message_history, user_context)
-        print(f"AI response received: {ai_response[:100]}...")
-        
-        # Save AI response to database
-        assistant_message = MessageCreate(
-            conversation_id=conversation_id,
-            content=ai_response,
-            role="assistant"
-        )
-        
-        saved_message = create_message(db=db, message=assistant_message)
-        print(f"AI response saved to database with ID: {saved_message.id}")
-        
-        print(f"AI response generated and saved for conversation {conversation_id}")
-        
+        async for token in stream_ai_response(
+            message_history,
+            user_context,
+            user_id=user_id,
+            summary=summary,
+            model=model,
+            conversation_id=str(conversation_id)
+        ):
+            chunks.append(token)
+            yield "token", {"content": token}
     except Exception as e:
-        print(f"Error processing AI response: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        # Save fallback response
-        fallback_response = "I'm having trouble processing your message right now. As a healthcare professional, remember that it's important to take breaks and practice self-care. Please try again in a moment."
-        
-        assistant_message = MessageCreate(
-            conversation_id=conversation_id,
-            content=fallback_response,
-            role="assistant"
+        logger.warning(f"Error streaming AI response: {e}")
+        interrupted = True
+        yield "error", {"detail": "AI response was interrupted"}
+    
+    ai_response = "".join(chunks).strip()
+    model_name = model if ai_response and not interrupted else None
+    if interrupted or not ai_response:
+        ai_response = FALLBACK_REPLY
+    
+    # The request-scoped session is not guaranteed to outlive the response,
+    # so the final write uses its own session
+    stream_db = SessionLocal()
+    try:
+        ai_message = create_message(
+            db=stream_db,
+            message=MessageCreate(
+                conversation_id=conversation_id,
+                content=ai_response,
+                role="assistant"
+            ),
+            model_name=model_name
         )
-        
-        saved_message = create_message(db=db, message=assistant_message)
-        print(f"Fallback response saved with ID: {saved_message.id}")
+        yield "done", Message.from_orm(ai_message)
+    finally:
+        stream_db.close()
 
-@router.get("/messages/{conversation_id}", response_model=List[Message])
-def get_messages(
-    conversation_id: UUID,
+def _hand_off_reply(conversation_id: UUID, user_id: str) -> None:
+    db = SessionLocal()
+    try:
+        enqueue_chat_reply(db, conversation_id, user_id)
+    finally:
+        db.close()
+
+@router.post("/messages/stream")
+async def stream_message(
+    message: MessageCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all messages in a conversation"""
+    """
+    Send a message and stream the AI response as Server-Sent Events.
+    
+    Emits `token` events while Ollama generates, then a single `done` event
+    carrying the persisted assistant message (or `error` on failure).
+    """
+    conversation = get_conversation(db, message.conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    if conversation.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="You can only send messages to your own conversations")
+    
+    if message.role != "user":
+        raise HTTPException(status_code=400, detail="Only user messages can be sent through this endpoint")
+    
+    user_message = create_message(db=db, message=message)
+    messages = get_conversation_messages(db, message.conversation_id)
+    message_history, summary = prepare_conversation_history(conversation, messages)
+    user_context = await get_user_context_from_db(db, str(current_user.id))
+    model = model_router.chat_model(message_history, summary)
+    
+    async def event_stream():
+        answered = False
+        try:
+            yield format_sse("user_message", Message.from_orm(user_message))
+            async for event, data in _reply_events(
+                message.conversation_id, message_history, summary, user_context, str(current_user.id), model
+            ):
+                answered = answered or event == "done"
+                yield format_sse(event, data)
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away mid-reply: the job worker writes the reply so a reload still finds it
+            if not answered:
+                _hand_off_reply(message.conversation_id, str(current_user.id))
+            raise
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def _socket_user(db: Session, token: str):
+    """User for a WebSocket's `token` query parameter; browsers cannot set headers on a socket"""
+    payload = decode_access_token(token)
+    if payload is None or "sub" not in payload:
+        return None
+    return db.query(User).filter(User.id == UUID(payload["sub"])).first()
+
+async def _answer_over_socket(connection: ChatConnection, conversation_id: UUID, content: str):
+    """Save a user message from a socket and push the reply to every socket on the conversation"""
+    user_message = None
+    answered = False
+    try:
+        # Short-lived sessions: an open socket must not hold a pooled connection
+        db = SessionLocal()
+        try:
+            conversation = get_conversation(db, conversation_id)
+            user_message = create_message(
+                db=db,
+                message=MessageCreate(conversation_id=conversation_id, content=content, role="user")
+            )
+            chat_connections.publish(conversation_id, "user_message", Message.from_orm(user_message))
+            messages = get_conversation_messages(db, conversation_id)
+            message_history, summary = prepare_conversation_history(conversation, messages)
+            user_context = await get_user_context_from_db(db, connection.user_id)
+        finally:
+            db.close()
+        
+        model = model_router.chat_model(message_history, summary)
+        async for event, data in _reply_events(
+            conversation_id, message_history, summary, user_context, connection.user_id, model
+        ):
+            chat_connections.publish(conversation_id, event, data)
+            answered = answered or event == "done"
+    except asyncio.CancelledError:
+        # The socket closed mid-reply: the job worker writes the reply so a reconnect still finds it
+        if user_message is not None and not answered:
+            _hand_off_reply(conversation_id, connection.user_id)
+        raise
+    except Exception as e:
+        logger.warning(f"Error answering over WebSocket: {e}")
+        connection.send("error", {"detail": "Failed to process message"})
+    finally:
+        connection.busy = False
+
+@router.websocket("/ws/{conversation_id}")
+async def chat_socket(
+    websocket: WebSocket,
+    conversation_id: UUID,
+    token: str = Query(...),
+    last_message_id: Optional[UUID] = None
+):
+    """
+    Chat over one WebSocket per conversation.
+    
+    Client frames: `{"type": "message", "content": "..."}`. Server frames are
+    `{"event": ..., "data": ...}` with the same events as /messages/stream
+    (`user_message`, `token`, `done`, `error`), plus `message` for each
+    message replayed after `last_message_id` on connect and a periodic `ping`.
+    """
+    db = SessionLocal()
+    try:
+        user = _socket_user(db, token)
+        conversation = get_conversation(db, conversation_id) if user else None
+        if not conversation or conversation.user_id != user.id:
+            await websocket.close(code=WS_POLICY_VIOLATION)
+            return
+        missed = get_conversation_messages_since(db, conversation_id, last_message_id) if last_message_id else []
+        missed = [Message.from_orm(m) for m in missed]
+    finally:
+        db.close()
+    
+    await websocket.accept()
+    connection = ChatConnection(websocket, str(user.id), str(conversation_id))
+    refused = chat_connections.register(connection)
+    if refused:
+        await websocket.send_text(format_frame("error", {"detail": refused}))
+        await websocket.close(code=WS_TRY_AGAIN_LATER)
+        return
+    
+    connection.start()
+    try:
+        for message in missed:
+            connection.send("message", message)
+        
+        while not connection.closed:
+            raw = await websocket.receive_text()
+            if len(raw.encode("utf-8")) > WS_MAX_MESSAGE_BYTES:
+                connection.close(WS_MESSAGE_TOO_BIG)
+                break
+            try:
+                frame = json.loads(raw)
+            except ValueError:
+                connection.send("error", {"detail": "Frames must be JSON"})
+                continue
+            
+            kind = frame.get("type") if isinstance(frame, dict) else None
+            if kind == "pong":
+                continue
+            content = frame.get("content") if kind == "message" else None
+            if not isinstance(content, str) or not content.strip():
+                connection.send("error", {"detail": "Expected {\"type\": \"message\", \"content\": \"...\"}"})
+                continue
+            if connection.busy:
+                connection.send("error", {"detail": "Please wait for the current reply to finish"})
+                continue
+            
+            connection.busy = True
+            connection.run(_answer_over_socket(connection, conversation_id, content))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        chat_connections.unregister(connection)
+        await connection.finish()
+
+def _check_own_conversation(db: Session, conversation_id: UUID, current_user: User) -> None:
     conversation = get_conversation(db, conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     if conversation.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only access your own conversation messages")
+
+def _read_messages_since(conversation_id: UUID, since_message_id: Optional[UUID], created_after: Optional[datetime]) -> List[Message]:
+    """One short-lived session per read, so a waiting long-poll holds no pooled connection"""
+    db = SessionLocal()
+    try:
+        messages = get_conversation_messages_since(db, conversation_id, since_message_id, created_after)
+        return [Message.from_orm(m) for m in messages]
+    finally:
+        db.close()
+
+@router.get("/messages/{conversation_id}", response_model=List[Message])
+async def get_messages(
+    conversation_id: UUID,
+    since: Optional[str] = None,
+    wait: float = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get messages in a conversation
+    
+    With `since` (the last message id the client has, or an ISO timestamp)
+    only newer messages are returned. With `wait` as well, an empty result is
+    held for up to `wait` seconds and returned as soon as a message arrives.
+    """
+    # Database calls go to the threadpool; only the wait for a new message runs on the event loop
+    await run_in_threadpool(_check_own_conversation, db, conversation_id, current_user)
     
-    return get_conversation_messages(db, conversation_id)
+    if since is None:
+        return await run_in_threadpool(get_conversation_messages, db, conversation_id)
+    
+    since_message_id, created_after = _parse_since(since)
+    await run_in_threadpool(db.close)
+    # Subscribe before reading so a message committed in between still wakes us
+    waiter = change_notifier.subscribe(MESSAGES_CHANNEL, conversation_id) if wait > 0 else None
+    try:
+        messages = await run_in_threadpool(_read_messages_since, conversation_id, since_message_id, created_after)
+        if messages or waiter is None:
+            return messages
+        
+        if await change_notifier.wait(waiter, min(wait, LONG_POLL_MAX_WAIT)):
+            metrics.incr("message_long_poll_wakeups_total")
+            messages = await run_in_threadpool(_read_messages_since, conversation_id, since_message_id, created_after)
+        return messages
+    finally:
+        if waiter is not None:
+            change_notifier.unsubscribe(MESSAGES_CHANNEL, conversation_id, waiter)
 
 # Quick message endpoint for simple interactions
 @router.post("/quick-message")
@@ -240,9 +482,23 @@ async def quick_message(
         # Format as message history
         message_history = [{"role": "user", "content": message}]
         
-        # Generate response
-        print("Generating AI response for quick message...")
-        ai_response = await generate_ai_response(message_history, user_context)
+        # Near-identical questions from users in the same context bucket share an answer
+        bucket = context_bucket(user_context)
+        # Bounded by SEMANTIC_CACHE_EMBED_TIMEOUT; a slow embedding is a miss
+        prompt_vector = await semantic_cache.embed(message)
+        ai_response = semantic_cache.match(bucket, prompt_vector)
+        
+        if ai_response is None:
+            # Generate response
+            print("Generating AI response for quick message...")
+            # Quick one-off turns always go to the small model
+            model = model_router.choose(QUICK_TASK)
+            success, ai_response = await try_generate_ai_response(
+                message_history, user_context, user_id=str(current_user.id), model=model, task=QUICK_TASK,
+                query_vector=prompt_vector
+            )
+            if success:
+                semantic_cache.store(bucket, prompt_vector, message, ai_response)
         print(f"Quick message AI response: {ai_response}")
         
         return {
@@ -288,13 +544,21 @@ async def send_sync_message(
         
         # Get conversation history
         messages = get_conversation_messages(db, message.conversation_id)
-        message_history = [{"role": msg.role, "content": msg.content} for msg in messages[-10:]]
+        message_history, summary = prepare_conversation_history(conversation, messages)
         
         # Get user context
         user_context = await get_user_context_from_db(db, str(current_user.id))
         
         # Generate AI response
-        ai_response = await generate_ai_response(message_history, user_context)
+        model = model_router.chat_model(message_history, summary)
+        success, ai_response = await try_generate_ai_response(
+            message_history,
+            user_context,
+            user_id=str(current_user.id),
+            conversation_id=str(message.conversation_id),
+            summary=summary,
+            model=model
+        )
         print(f"AI response generated: {ai_response[:100]}...")
         
         # Save AI response
@@ -303,7 +567,7 @@ async def send_sync_message(
             content=ai_response,
             role="assistant"
         )
-        ai_message = create_message(db=db, message=assistant_message)
+        ai_message = create_message(db=db, message=assistant_message, model_name=model if success else None)
         print(f"AI message saved: {ai_message.id}")
         
         return {
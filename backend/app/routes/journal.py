@@ -1,61 +1,62 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from app.models import User
+from app.models import User, JournalEntry, AudioUpload
 from app.utils.token import get_current_user
+from app.utils.sse import format_sse, SSE_HEADERS, SSE_KEEPALIVE
 import uuid
+import time
 from datetime import datetime
 import os
-from app.database import get_db
-from app.schemas import JournalEntryCreate, JournalEntryResponseOut, JournalEntryBase
+from app.database import get_db, SessionLocal
+from app.schemas import (
+    JournalEntryCreate,
+    JournalEntryResponseOut,
+    JournalAnalysisStatus,
+    AudioUploadCreate,
+    AudioUploadFinalize,
+    AudioUploadStatus
+)
 from app.crud import create_journal_entry, get_all_user_journals, get_user_journal
-from app.services.chatbot import analyze_journal_entry, get_user_context_from_db
+from app.services.ai_jobs import (
+    enqueue_journal_analysis,
+    enqueue_audio_transcription,
+    needs_transcription,
+    publish_analysis_status,
+    ANALYSIS_PENDING_TEXT,
+    TRANSCRIPTION_PENDING_TEXT,
+    REANALYSIS_PENDING_TEXT,
+    ANALYSIS_STATUS_PENDING
+)
+from app.services.change_events import change_notifier, JOURNAL_ANALYSIS_CHANNEL, LONG_POLL_MAX_WAIT
+from app.services.audio_storage import save_audio_upload, AudioTooLarge, StoredAudio
+from app.services.audio_uploads import (
+    create_upload,
+    write_chunk,
+    assemble_upload,
+    claim_upload,
+    reset_upload,
+    upload_status,
+    missing_ranges,
+    is_expired,
+    UploadRangeError,
+    UploadChecksumMismatch,
+    UploadClosed,
+    UPLOAD_COMPLETE
+)
 from typing import Optional, Union
 import asyncio
 
 router = APIRouter()
 
-async def analyze_and_update_journal(entry_id: str, text_content: str, user_id: str, db: Session):
-    """Background task to analyze journal entry and update the database"""
-    try:
-        print(f"Starting background analysis for journal entry: {entry_id}")
-        
-        # Get user context for better AI analysis
-        user_context = await get_user_context_from_db(db, user_id)
-        print(f"User context gathered for analysis: {user_context}")
-        
-        # Analyze journal entry with Ollama
-        analysis = await analyze_journal_entry(text_content, user_context)
-        print(f"AI Analysis completed: {analysis[:100]}...")
-        
-        # Update the journal entry with the analysis
-        journal_entry = get_user_journal(db, entry_id)
-        if journal_entry:
-            journal_entry.analysis = analysis
-            db.commit()
-            print(f"Journal entry {entry_id} updated with analysis")
-        else:
-            print(f"Warning: Journal entry {entry_id} not found for analysis update")
-            
-    except Exception as e:
-        print(f"Error in background journal analysis: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        # Update with fallback analysis
-        try:
-            journal_entry = get_user_journal(db, entry_id)
-            if journal_entry:
-                word_count = len(text_content.split())
-                fallback_analysis = f"Thank you for taking time to reflect and journal. Your {word_count}-word entry shows commitment to your mental wellness. Regular journaling is an excellent practice for healthcare professionals to process experiences and maintain emotional balance."
-                journal_entry.analysis = fallback_analysis
-                db.commit()
-                print(f"Journal entry {entry_id} updated with fallback analysis")
-        except Exception as fallback_error:
-            print(f"Error updating journal entry with fallback analysis: {fallback_error}")
-
-@router.post("/", response_model=JournalEntryBase)
+# How long one analysis event stream stays open; clients reconnect after it ends
+JOURNAL_EVENTS_MAX_SECONDS = float(os.getenv("JOURNAL_EVENTS_MAX_SECONDS", "300"))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+@router.post("/", response_model=JournalEntryResponseOut)
 async def add_journal_entry(
-    background_tasks: BackgroundTasks,
     user_id: uuid.UUID = Form(...),
     text_content: Optional[str] = Form(None),
     audio_file: Union[UploadFile, str, None] = File(default=None),
@@ -77,54 +78,194 @@ async def add_journal_entry(
     
     print(f"Journal text content: {text_content}")
 
-    audio_path = None
+    stored_audio = None
     
-    # Process audio file if provided
+    # Stream the audio file to storage if provided
     if audio_file and audio_file.filename:
-        upload_dir = "uploads/audio"
-        os.makedirs(upload_dir, exist_ok=True)
+        try:
+            stored_audio = await save_audio_upload(audio_file)
+        except AudioTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        if stored_audio.size_bytes == 0:
+            raise HTTPException(status_code=400, detail="Audio file is empty")
+        
+        print(f"Audio file saved at: {stored_audio.path} ({stored_audio.size_bytes} bytes, deduplicated={stored_audio.deduplicated})")
+    
+    return _save_journal_entry(db, user_id, text_content, stored_audio)
 
-        audio_path = f"{upload_dir}/{user_id}{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.wav"
-        contents = await audio_file.read()
+def _new_journal_entry(db: Session, user_id: uuid.UUID, text_content: Optional[str], stored_audio: Optional[StoredAudio]) -> JournalEntry:
+    """Add an entry with placeholder analysis to the session; the caller commits it"""
+    entry_data = JournalEntryCreate(
+        user_id=user_id,
+        text_content=text_content or TRANSCRIPTION_PENDING_TEXT,
+        audio_path=stored_audio.path if stored_audio else None,
+        audio_size_bytes=stored_audio.size_bytes if stored_audio else None,
+        audio_sha256=stored_audio.sha256 if stored_audio else None,
+        audio_duration_seconds=stored_audio.duration_seconds if stored_audio else None,
+        created_at=datetime.utcnow()
+    )
+    return create_journal_entry(db=db, entry=entry_data, analysis=ANALYSIS_PENDING_TEXT, commit=False)
+
+def _queue_journal_entry(db: Session, db_entry: JournalEntry) -> None:
+    """Queue the real analysis of a committed entry (after transcription for audio-only entries)"""
+    if db_entry.text_content == TRANSCRIPTION_PENDING_TEXT and needs_transcription(None, db_entry.audio_path):
+        enqueue_audio_transcription(db, db_entry.id, db_entry.user_id)
+        print(f"Transcription job queued for journal entry: {db_entry.id}")
+    else:
+        enqueue_journal_analysis(db, db_entry.id, db_entry.user_id)
+        print(f"Analysis job queued for journal entry: {db_entry.id}")
+    publish_analysis_status(db_entry)
+
+def _save_journal_entry(db: Session, user_id: uuid.UUID, text_content: Optional[str], stored_audio: Optional[StoredAudio]):
+    """Save an entry with placeholder analysis and queue the real analysis"""
+    try:
+        db_entry = _new_journal_entry(db, user_id, text_content, stored_audio)
+        db.commit()
+        db.refresh(db_entry)
+        print(f"Journal entry saved to database: {db_entry.id}")
         
-        with open(audio_path, "wb") as f:
-            f.write(contents)
+        # Queue AI analysis; a job worker fills it in
+        _queue_journal_entry(db, db_entry)
+        return db_entry
         
-        # TODO: Add speech-to-text conversion here if needed
-        if not text_content:
-            text_content = "Audio journal entry (transcription pending)"
+    except Exception as e:
+        print(f"Error saving journal entry: {e}")
+        raise HTTPException(status_code=422, detail=f"Failed to save journal entry: {str(e)}")
+
+def _get_own_upload(db: Session, upload_id: uuid.UUID, current_user: User) -> AudioUpload:
+    upload = db.query(AudioUpload).filter(AudioUpload.id == upload_id).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if upload.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="You can only access your own uploads")
+    return upload
+
+@router.post("/uploads", response_model=AudioUploadStatus)
+def start_audio_upload(
+    upload_in: AudioUploadCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Start a resumable audio upload.
     
-    print(f"Audio file saved at: {audio_path}")
+    Send the bytes with PUT /uploads/{id}?offset=N in any order and size,
+    check GET /uploads/{id} after a dropped connection to see what is
+    still missing, then POST /uploads/{id}/finalize to create the entry.
+    """
+    if upload_in.total_bytes <= 0:
+        raise HTTPException(status_code=400, detail="Audio file is empty")
     
-    # Create entry object with placeholder analysis
     try:
-        entry_data = JournalEntryCreate(
-            user_id=user_id,
-            text_content=text_content,
-            audio_path=audio_path,
-            created_at=datetime.utcnow()
-        )
-        
-        # Save to database with temporary analysis
-        temporary_analysis = "Your journal entry is being analyzed by Carely. Refresh to see the insights!"
-        db_entry = create_journal_entry(db=db, entry=entry_data, analysis=temporary_analysis)
-        print(f"Journal entry saved to database: {db_entry.id}")
+        upload = create_upload(db, current_user.id, upload_in.total_bytes, upload_in.filename, upload_in.sha256)
+    except AudioTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return upload_status(upload)
+
+@router.get("/uploads/{upload_id}", response_model=AudioUploadStatus)
+def get_audio_upload(
+    upload_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Received and missing byte ranges of an upload, for resuming it"""
+    return upload_status(_get_own_upload(db, upload_id, current_user))
+
+def _open_upload_for_chunk(db: Session, upload_id: uuid.UUID, current_user: User) -> AudioUpload:
+    upload = _get_own_upload(db, upload_id, current_user)
+    if upload.status == UPLOAD_COMPLETE:
+        raise HTTPException(status_code=409, detail="Upload is already finalized")
+    if is_expired(upload):
+        raise HTTPException(status_code=410, detail="Upload has expired, start a new one")
+
+    # Hand the pooled connection back while the body streams in
+    db.expunge(upload)
+    db.close()
+    return upload
+
+@router.put("/uploads/{upload_id}", response_model=AudioUploadStatus)
+async def put_audio_chunk(
+    upload_id: uuid.UUID,
+    request: Request,
+    offset: int = Query(..., ge=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Write the raw request body at `offset`; the response says what is still missing"""
+    upload = await run_in_threadpool(_open_upload_for_chunk, db, upload_id, current_user)
+    try:
+        return await write_chunk(upload, offset, request.stream())
+    except UploadRangeError as e:
+        raise HTTPException(status_code=416, detail=str(e))
+    except AudioTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadClosed as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+def _start_finalize(db: Session, upload_id: uuid.UUID, current_user: User):
+    """Claim an upload for finalizing: (upload, None) when claimed, (upload, entry) when it was already finalized"""
+    upload = _get_own_upload(db, upload_id, current_user)
+    if upload.status != UPLOAD_COMPLETE:
+        if is_expired(upload):
+            raise HTTPException(status_code=410, detail="Upload has expired, start a new one")
         
-        # Add background task for AI analysis
-        background_tasks.add_task(
-            analyze_and_update_journal,
-            str(db_entry.id),
-            text_content,
-            str(user_id),
-            db
-        )
-        print(f"Background analysis task added for journal entry: {db_entry.id}")
+        missing = missing_ranges(upload.received_ranges or [], upload.total_bytes)
+        if missing:
+            raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "missing_ranges": missing})
         
-        return db_entry
+        if claim_upload(db, upload.id):
+            return upload, None
         
+        # Another finalize got there first; return its entry once it has committed
+        db.rollback()
+        if upload.status != UPLOAD_COMPLETE:
+            raise HTTPException(status_code=409, detail="Upload is no longer open")
+    return upload, get_user_journal(db, entry_id=upload.journal_entry_id)
+
+def _complete_finalize(db: Session, upload: AudioUpload, user_id: uuid.UUID, text_content: Optional[str], stored_audio: StoredAudio):
+    """Commit the entry together with the claimed upload, so a finalize creates at most one entry"""
+    try:
+        db_entry = _new_journal_entry(db, user_id, text_content, stored_audio)
+        upload.status = UPLOAD_COMPLETE
+        upload.journal_entry_id = db_entry.id
+        db.commit()
     except Exception as e:
-        print(f"Error saving journal entry: {e}")
+        db.rollback()
+        print(f"Error saving journal entry for upload {upload.id}: {e}")
         raise HTTPException(status_code=422, detail=f"Failed to save journal entry: {str(e)}")
+    db.refresh(db_entry)
+    print(f"Journal entry saved to database: {db_entry.id}")
+    
+    _queue_journal_entry(db, db_entry)
+    return db_entry
+
+@router.post("/uploads/{upload_id}/finalize", response_model=JournalEntryResponseOut)
+async def finalize_audio_upload(
+    upload_id: uuid.UUID,
+    finalize_in: Optional[AudioUploadFinalize] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Create the journal entry once every byte has arrived; repeating it returns the same entry"""
+    # Database calls run in the threadpool: a finalize waiting on another one's claim must not block the event loop
+    upload, db_entry = await run_in_threadpool(_start_finalize, db, upload_id, current_user)
+    if db_entry is not None:
+        return db_entry
+    
+    try:
+        stored_audio = await assemble_upload(upload)
+    except UploadChecksumMismatch as e:
+        # Which bytes are wrong is unknown, so the whole file has to be sent again
+        await run_in_threadpool(db.rollback)
+        await run_in_threadpool(reset_upload, db, upload.id)
+        raise HTTPException(status_code=422, detail=str(e))
+    except BaseException:
+        await run_in_threadpool(db.rollback)
+        raise
+    print(f"Audio upload {upload.id} assembled at: {stored_audio.path} ({stored_audio.size_bytes} bytes, deduplicated={stored_audio.deduplicated})")
+    
+    text_content = finalize_in.text_content if finalize_in else None
+    return await run_in_threadpool(_complete_finalize, db, upload, current_user.id, text_content, stored_audio)
 
 @router.get("/user/{user_id}", response_model=list[JournalEntryResponseOut])
 def get_journal_entries(
@@ -138,6 +279,120 @@ def get_journal_entries(
     
     return get_all_user_journals(db, user_id=user_id)
 
+def _analysis_statuses(user_id: uuid.UUID, tracked, created_from: datetime):
+    """
+    Analysis state of the user's entries worth reporting: pending ones, ones a
+    stream is tracking, and ones created since it opened.
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            JournalEntry.id, JournalEntry.analysis_status, JournalEntry.analysis, JournalEntry.analysis_model
+        ).filter(
+            JournalEntry.user_id == user_id,
+            or_(
+                JournalEntry.analysis_status == ANALYSIS_STATUS_PENDING,
+                JournalEntry.id.in_(list(tracked)),
+                JournalEntry.created_at >= created_from
+            )
+        ).all()
+        return [JournalAnalysisStatus.from_orm(row) for row in rows]
+    finally:
+        db.close()
+
+@router.get("/user/{user_id}/analysis-events")
+async def journal_analysis_events(
+    user_id: uuid.UUID,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stream analysis status changes of the user's journal entries as Server-Sent Events.
+    
+    On connect, one `analysis` event per entry still pending; afterwards an
+    `analysis` event (id, analysis_status, analysis, analysis_model) whenever
+    an entry is queued for or finishes analysis. The stream closes after
+    JOURNAL_EVENTS_MAX_SECONDS; reconnecting picks up where it left off.
+    """
+    if user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="You can only follow your own journal entries")
+    
+    async def event_stream():
+        started = datetime.utcnow()
+        deadline = time.monotonic() + JOURNAL_EVENTS_MAX_SECONDS
+        seen = {}
+        # Subscribe before the first read so nothing committed in between is missed
+        waiter = change_notifier.subscribe(JOURNAL_ANALYSIS_CHANNEL, user_id)
+        try:
+            changed = True
+            while True:
+                if changed:
+                    statuses = await run_in_threadpool(_analysis_statuses, user_id, list(seen), started)
+                    for status in statuses:
+                        if seen.get(status.id) != status.analysis_status:
+                            seen[status.id] = status.analysis_status
+                            yield format_sse("analysis", status)
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                changed = await change_notifier.wait(waiter, min(SSE_KEEPALIVE_SECONDS, remaining))
+                if not changed:
+                    yield SSE_KEEPALIVE
+        finally:
+            change_notifier.unsubscribe(JOURNAL_ANALYSIS_CHANNEL, user_id, waiter)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def _own_analysis_status(db: Session, entry_id: uuid.UUID, current_user: User) -> JournalAnalysisStatus:
+    entry = get_user_journal(db, entry_id=entry_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Journal entry not found")
+    
+    if entry.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="You can only access your own journal entries")
+    
+    return JournalAnalysisStatus.from_orm(entry)
+
+def _read_analysis_status(entry_id: uuid.UUID) -> JournalAnalysisStatus:
+    """One short-lived session per read, so a waiting long-poll holds no pooled connection"""
+    db = SessionLocal()
+    try:
+        return JournalAnalysisStatus.from_orm(get_user_journal(db, entry_id=entry_id))
+    finally:
+        db.close()
+
+@router.get("/{entry_id}/analysis", response_model=JournalAnalysisStatus)
+async def get_journal_analysis(
+    entry_id: uuid.UUID,
+    wait: float = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Analysis status of one entry, without its text
+    
+    With `wait`, a pending analysis is held for up to `wait` seconds and
+    returned as soon as it completes.
+    """
+    # Database calls go to the threadpool; only the wait for a change runs on the event loop
+    status = await run_in_threadpool(_own_analysis_status, db, entry_id, current_user)
+    if status.analysis_status != ANALYSIS_STATUS_PENDING or wait <= 0:
+        return status
+    
+    deadline = time.monotonic() + min(wait, LONG_POLL_MAX_WAIT)
+    waiter = change_notifier.subscribe(JOURNAL_ANALYSIS_CHANNEL, current_user.id)
+    await run_in_threadpool(db.close)
+    try:
+        # Re-read once subscribed, then after each wake-up for this user
+        while True:
+            status = await run_in_threadpool(_read_analysis_status, entry_id)
+            remaining = deadline - time.monotonic()
+            if status.analysis_status != ANALYSIS_STATUS_PENDING or remaining <= 0:
+                return status
+            await change_notifier.wait(waiter, remaining)
+    finally:
+        change_notifier.unsubscribe(JOURNAL_ANALYSIS_CHANNEL, current_user.id, waiter)
+
 @router.get("/{entry_id}", response_model=JournalEntryResponseOut)
 def get_journal_entry(
     entry_id: uuid.UUID, 
@@ -158,7 +413,6 @@ def get_journal_entry(
 @router.post("/{entry_id}/reanalyze")
 async def reanalyze_journal_entry(
     entry_id: uuid.UUID,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -170,21 +424,20 @@ async def reanalyze_journal_entry(
     if entry.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="You can only reanalyze your own journal entries")
     
+    if entry.text_content == TRANSCRIPTION_PENDING_TEXT and needs_transcription(None, entry.audio_path):
+        raise HTTPException(status_code=409, detail="Journal entry is still being transcribed; it is analyzed once that finishes")
+    
     try:
         # Update with temporary message
-        entry.analysis = "Your journal entry is being re-analyzed by Carely. Refresh to see the updated insights!"
+        entry.analysis = REANALYSIS_PENDING_TEXT
+        entry.analysis_status = ANALYSIS_STATUS_PENDING
         db.commit()
         
-        # Add background task for re-analysis
-        background_tasks.add_task(
-            analyze_and_update_journal,
-            str(entry_id),
-            entry.text_content,
-            str(current_user.id),
-            db
-        )
+        # Queue re-analysis
+        enqueue_journal_analysis(db, entry_id, current_user.id)
+        publish_analysis_status(entry)
         
-        return {"message": "Journal entry is being re-analyzed in the background. Refresh to see updated analysis."}
+        return {"message": "Journal entry is being re-analyzed in the background. The analysis-events stream reports when it is done."}
         
     except Exception as e:
         print(f"Error re-analyzing journal entry: {e}")
@@ -0,0 +1,36 @@
+import hmac
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from app.services.metrics import metrics
+
+# Bearer token scrapers must send
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Without a token, serve clients on this host only when explicitly allowed. Off by default:
+# behind a reverse proxy on the same host every request arrives from loopback.
+METRICS_ALLOW_LOOPBACK = os.getenv("METRICS_ALLOW_LOOPBACK", "false").lower() == "true"
+LOOPBACK_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+def require_metrics_access(request: Request):
+    """Metrics name internal backends and queue depths, so they are not public"""
+    if METRICS_TOKEN:
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    elif not METRICS_ALLOW_LOOPBACK:
+        raise HTTPException(status_code=403, detail="Metrics need METRICS_TOKEN (or METRICS_ALLOW_LOOPBACK=true for local clients)")
+    elif request.client is None or request.client.host not in LOOPBACK_HOSTS:
+        raise HTTPException(status_code=403, detail="Metrics are only served locally unless METRICS_TOKEN is set")
+
+router = APIRouter(dependencies=[Depends(require_metrics_access)])
+
+@router.get("/")
+def get_metrics():
+    """Runtime metrics for the AI services (Ollama pool, caches, queues)"""
+    return metrics.snapshot()
+
+@router.get("/prometheus", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """Counters and LLM latency histograms in Prometheus text format"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
@@ -115,6 +115,9 @@ class JournalEntryBase(BaseModel):
     user_id: UUID
     text_content: str
     audio_path: Optional[str] = None
+    audio_size_bytes: Optional[int] = None
+    audio_sha256: Optional[str] = None
+    audio_duration_seconds: Optional[float] = None
     created_at: Optional[datetime] = None
 
 class JournalEntryCreate(JournalEntryBase):
@@ -123,10 +126,39 @@ class JournalEntryCreate(JournalEntryBase):
 class JournalEntryResponseOut(JournalEntryBase):
     id: UUID
     analysis: str
+    analysis_status: Optional[str] = None  # 'pending', 'complete' or 'fallback'
 
     class Config:
         from_attributes = True
 
+class JournalAnalysisStatus(BaseModel):
+    id: UUID
+    analysis_status: str
+    analysis: str
+    analysis_model: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+# AUDIO UPLOAD
+class AudioUploadCreate(BaseModel):
+    total_bytes: int
+    filename: Optional[str] = None
+    sha256: Optional[str] = None  # Hex digest of the whole file, checked on finalize
+
+class AudioUploadFinalize(BaseModel):
+    text_content: Optional[str] = None
+
+class AudioUploadStatus(BaseModel):
+    id: UUID
+    status: str  # 'open', 'complete' or 'expired'
+    total_bytes: int
+    received_bytes: int
+    offset: int  # Bytes received without a gap; where a sequential client resumes
+    missing_ranges: List[List[int]]  # [start, end) byte ranges still to send
+    expires_at: datetime
+    journal_entry_id: Optional[UUID] = None
+
 # GOAL
 class GoalTypeEnum(str, Enum):
     PERSONAL = "Personal"
@@ -184,9 +216,10 @@ class Message(MessageBase):
     id: UUID
     conversation_id: UUID
     created_at: datetime
+    model_name: Optional[str] = None
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class ConversationWithMessages(Conversation):
     messages: List[Message]
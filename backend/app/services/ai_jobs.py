@@ -0,0 +1,228 @@
+from typing import Dict
+from uuid import UUID
+
+from sqlalchemy.orm import Session
+
+from app.crud import create_message, get_conversation, get_conversation_messages, get_user_journal
+from app.schemas import MessageCreate
+from app.services.analysis_cache import try_analyze_journal_entry_cached
+from app.services.change_events import change_notifier, JOURNAL_ANALYSIS_CHANNEL
+from app.services.chatbot import get_user_context_from_db, try_generate_ai_response, JOURNAL_PROMPT_VERSION
+from app.services.context_window import prepare_conversation_history
+from app.services.job_queue import enqueue_job, register_job_handler
+from app.services.llm_scheduler import Priority
+from app.services.model_router import model_router, JOURNAL_TASK
+from app.services.transcription import transcription_pool
+
+CHAT_REPLY_JOB = "chat_reply"
+ANALYZE_JOURNAL_JOB = "analyze_journal"
+TRANSCRIBE_AUDIO_JOB = "transcribe_audio"
+
+ANALYSIS_PENDING_TEXT = "Your journal entry is being analyzed by Carely. Insights will appear here in a moment."
+REANALYSIS_PENDING_TEXT = "Your journal entry is being re-analyzed by Carely. Updated insights will appear here in a moment."
+# Text of an audio-only entry until its transcript is stored
+TRANSCRIPTION_PENDING_TEXT = "Audio journal entry (transcription pending)"
+TRANSCRIPTION_EMPTY_TEXT = "Audio journal entry (no speech detected)"
+TRANSCRIPTION_FAILED_TEXT = "Audio journal entry (transcription unavailable)"
+ANALYSIS_FALLBACK_PREFIX = "Thank you for taking time to reflect and journal."
+
+# JournalEntry.analysis_status values
+ANALYSIS_STATUS_PENDING = "pending"
+ANALYSIS_STATUS_COMPLETE = "complete"
+ANALYSIS_STATUS_FALLBACK = "fallback"
+
+CHAT_FALLBACK_RESPONSE = "I'm having trouble processing your message right now. As a healthcare professional, remember that it's important to take breaks and practice self-care. Please try again in a moment."
+
+
+def enqueue_chat_reply(db: Session, conversation_id, user_id):
+    # A user is waiting on this one: run it first and give up sooner
+    return enqueue_job(
+        db,
+        CHAT_REPLY_JOB,
+        {"conversation_id": str(conversation_id), "user_id": str(user_id)},
+        priority=Priority.INTERACTIVE,
+        max_attempts=3
+    )
+
+
+def publish_analysis_status(journal_entry) -> None:
+    """Wake the owner's analysis status streams and long-polls; call after committing"""
+    change_notifier.publish(JOURNAL_ANALYSIS_CHANNEL, journal_entry.user_id)
+
+
+def enqueue_journal_analysis(db: Session, entry_id, user_id):
+    return enqueue_job(
+        db,
+        ANALYZE_JOURNAL_JOB,
+        {"entry_id": str(entry_id), "user_id": str(user_id)},
+        priority=Priority.BACKGROUND
+    )
+
+
+def enqueue_audio_transcription(db: Session, entry_id, user_id):
+    # Transcription queues the analysis itself once the text is known
+    return enqueue_job(
+        db,
+        TRANSCRIBE_AUDIO_JOB,
+        {"entry_id": str(entry_id), "user_id": str(user_id)},
+        priority=Priority.BACKGROUND,
+        max_attempts=3
+    )
+
+
+def needs_transcription(text_content, audio_path) -> bool:
+    """Audio-only entries are transcribed before analysis when a backend is configured (it runs on the worker)"""
+    return bool(audio_path) and not text_content and transcription_pool.configured
+
+
+async def process_ai_response(db: Session, payload: Dict) -> None:
+    """Generate and save the assistant reply to the latest message in a conversation"""
+    conversation_id = UUID(payload["conversation_id"])
+    user_id = payload["user_id"]
+    print(f"Processing AI response for conversation {conversation_id}")
+
+    conversation = get_conversation(db, conversation_id)
+    if not conversation:
+        print(f"Conversation {conversation_id} no longer exists, skipping AI response")
+        return
+
+    # Format messages for AI context (newest turns within the token budget, older ones summarized)
+    messages = get_conversation_messages(db, conversation_id)
+    message_history, summary = prepare_conversation_history(conversation, messages)
+    print(f"Prepared {len(message_history)} of {len(messages)} messages for AI context")
+
+    # Get user context for personalized responses
+    user_context = await get_user_context_from_db(db, user_id)
+
+    model = model_router.chat_model(message_history, summary)
+    success, ai_response = await try_generate_ai_response(
+        message_history,
+        user_context,
+        user_id=user_id,
+        conversation_id=str(conversation_id),
+        summary=summary,
+        model=model
+    )
+    if not success:
+        # Raise so the job is retried with backoff
+        raise RuntimeError(f"Ollama did not produce a reply: {ai_response}")
+
+    saved_message = create_message(db=db, message=MessageCreate(
+        conversation_id=conversation_id,
+        content=ai_response,
+        role="assistant"
+    ), model_name=model)
+    print(f"AI response saved to database with ID: {saved_message.id}")
+
+
+async def save_fallback_response(db: Session, payload: Dict, error: str) -> None:
+    conversation_id = UUID(payload["conversation_id"])
+    if not get_conversation(db, conversation_id):
+        return
+    saved_message = create_message(db=db, message=MessageCreate(
+        conversation_id=conversation_id,
+        content=CHAT_FALLBACK_RESPONSE,
+        role="assistant"
+    ))
+    print(f"Fallback response saved with ID: {saved_message.id}")
+
+
+async def analyze_entry(db: Session, journal_entry, priority: Priority = Priority.BACKGROUND) -> bool:
+    """Analyze a journal entry and store the analysis on it; the entry is left unchanged on failure"""
+    user_id = str(journal_entry.user_id)
+
+    # Get user context for better AI analysis
+    user_context = await get_user_context_from_db(db, user_id)
+
+    # Analyze journal entry with Ollama (identical text and context is served from cache)
+    model = model_router.choose(JOURNAL_TASK, priority=priority)
+    success, analysis = await try_analyze_journal_entry_cached(
+        db, journal_entry.text_content, user_context, priority=priority, user_id=user_id, model=model
+    )
+    if not success:
+        print(f"Analysis of journal entry {journal_entry.id} failed: {analysis}")
+        return False
+
+    journal_entry.analysis = analysis
+    journal_entry.analysis_model = model
+    journal_entry.analysis_prompt_version = JOURNAL_PROMPT_VERSION
+    journal_entry.analysis_status = ANALYSIS_STATUS_COMPLETE
+    db.commit()
+    publish_analysis_status(journal_entry)
+    return True
+
+
+async def analyze_and_update_journal(db: Session, payload: Dict) -> None:
+    """Analyze a journal entry and store the analysis on it"""
+    entry_id = UUID(payload["entry_id"])
+    print(f"Starting background analysis for journal entry: {entry_id}")
+
+    journal_entry = get_user_journal(db, entry_id)
+    if not journal_entry:
+        print(f"Warning: Journal entry {entry_id} not found for analysis update")
+        return
+
+    if not await analyze_entry(db, journal_entry):
+        # Raise so the job is retried with backoff
+        raise RuntimeError(f"Ollama did not produce an analysis for journal entry {entry_id}")
+    print(f"Journal entry {entry_id} updated with analysis")
+
+
+async def transcribe_and_update_journal(db: Session, payload: Dict) -> None:
+    """Store the transcript of an audio entry as its text, then queue its analysis"""
+    entry_id = UUID(payload["entry_id"])
+    journal_entry = get_user_journal(db, entry_id)
+    if not journal_entry or not journal_entry.audio_path:
+        print(f"Warning: Journal entry {entry_id} has no audio to transcribe")
+        return
+
+    # A retry after the transcript was stored only has to queue the analysis
+    if journal_entry.text_content == TRANSCRIPTION_PENDING_TEXT:
+        print(f"Transcribing audio of journal entry {entry_id}")
+        transcript = await transcription_pool.transcribe(journal_entry.audio_path, journal_entry.audio_duration_seconds)
+        if not transcript:
+            journal_entry.text_content = TRANSCRIPTION_EMPTY_TEXT
+            db.commit()
+            await save_fallback_analysis(db, payload, "No speech detected")
+            return
+        journal_entry.text_content = transcript
+        db.commit()
+        # The owner's app can show the transcript while the analysis runs
+        publish_analysis_status(journal_entry)
+        print(f"Journal entry {entry_id} transcribed ({len(transcript.split())} words)")
+
+    if journal_entry.analysis_status == ANALYSIS_STATUS_PENDING:
+        enqueue_journal_analysis(db, entry_id, journal_entry.user_id)
+
+
+async def save_failed_transcription(db: Session, payload: Dict, error: str) -> None:
+    journal_entry = get_user_journal(db, UUID(payload["entry_id"]))
+    if not journal_entry or journal_entry.text_content != TRANSCRIPTION_PENDING_TEXT:
+        return
+    journal_entry.text_content = TRANSCRIPTION_FAILED_TEXT
+    db.commit()
+    await save_fallback_analysis(db, payload, error)
+
+
+def journal_fallback_analysis(text_content: str) -> str:
+    word_count = len(text_content.split())
+    return f"{ANALYSIS_FALLBACK_PREFIX} Your {word_count}-word entry shows commitment to your mental wellness. Regular journaling is an excellent practice for healthcare professionals to process experiences and maintain emotional balance."
+
+
+async def save_fallback_analysis(db: Session, payload: Dict, error: str) -> None:
+    journal_entry = get_user_journal(db, UUID(payload["entry_id"]))
+    if not journal_entry:
+        return
+    journal_entry.analysis = journal_fallback_analysis(journal_entry.text_content)
+    journal_entry.analysis_model = None
+    journal_entry.analysis_prompt_version = None
+    journal_entry.analysis_status = ANALYSIS_STATUS_FALLBACK
+    db.commit()
+    publish_analysis_status(journal_entry)
+    print(f"Journal entry {payload['entry_id']} updated with fallback analysis")
+
+
+register_job_handler(CHAT_REPLY_JOB, process_ai_response, concurrency=4, on_give_up=save_fallback_response)
+register_job_handler(ANALYZE_JOURNAL_JOB, analyze_and_update_journal, concurrency=2, on_give_up=save_fallback_analysis)
+# The transcription pool bounds CPU use; one recording at a time keeps its windows together
+register_job_handler(TRANSCRIBE_AUDIO_JOB, transcribe_and_update_journal, concurrency=1, on_give_up=save_failed_transcription)
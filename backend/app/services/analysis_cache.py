@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+from app.services.chatbot import try_analyze_journal_entry, OLLAMA_MODEL, JOURNAL_PROMPT_VERSION
+from app.services.llm_scheduler import Priority
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "512"))
+
+
+def normalize_journal_text(text: str) -> str:
+    """Collapse whitespace so trivially different submissions share a cache entry"""
+    return " ".join((text or "").split())
+
+
+def context_fingerprint(user_context: Optional[Dict]) -> str:
+    return json.dumps(user_context or {}, sort_keys=True, default=str)
+
+
+def make_analysis_cache_key(
+    text: str,
+    user_context: Optional[Dict],
+    model_name: str = OLLAMA_MODEL,
+    prompt_version: str = JOURNAL_PROMPT_VERSION
+) -> str:
+    material = "\x1f".join([
+        normalize_journal_text(text),
+        context_fingerprint(user_context),
+        model_name,
+        prompt_version,
+    ])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for journal analyses.
+
+    A bounded in-process LRU sits in front of the `journal_analysis_cache`
+    table, so a hit costs at most one primary-key lookup. Writes to the
+    table (stores and hit counts) use their own short sessions and never
+    commit the caller's transaction.
+    """
+
+    def __init__(self, max_entries: int = ANALYSIS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key: str, analysis: str) -> None:
+        with self._lock:
+            self._entries[key] = analysis
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, db: Session, key: str) -> Optional[str]:
+        with self._lock:
+            analysis = self._entries.get(key)
+            if analysis is not None:
+                self._entries.move_to_end(key)
+        if analysis is not None:
+            metrics.incr("analysis_cache_memory_hits_total")
+            return analysis
+
+        try:
+            row = db.query(models.JournalAnalysisCache).filter(
+                models.JournalAnalysisCache.cache_key == key
+            ).first()
+            if row:
+                self._record_hit(key)
+                self._remember(key, row.analysis)
+                metrics.incr("analysis_cache_db_hits_total")
+                return row.analysis
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.warning(f"Analysis cache lookup failed: {e}")
+
+        metrics.incr("analysis_cache_misses_total")
+        return None
+
+    @staticmethod
+    def _record_hit(key: str) -> None:
+        db = SessionLocal()
+        try:
+            db.query(models.JournalAnalysisCache).filter(
+                models.JournalAnalysisCache.cache_key == key
+            ).update({
+                models.JournalAnalysisCache.hit_count: func.coalesce(models.JournalAnalysisCache.hit_count, 0) + 1,
+                models.JournalAnalysisCache.last_hit_at: datetime.utcnow(),
+            }, synchronize_session=False)
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.warning(f"Analysis cache hit count update failed: {e}")
+        finally:
+            db.close()
+
+    def set(self, key: str, analysis: str, model_name: str, prompt_version: str) -> None:
+        self._remember(key, analysis)
+        db = SessionLocal()
+        try:
+            db.merge(models.JournalAnalysisCache(
+                cache_key=key,
+                model_name=model_name,
+                prompt_version=prompt_version,
+                analysis=analysis,
+                created_at=datetime.utcnow()
+            ))
+            db.commit()
+            metrics.incr("analysis_cache_stores_total")
+        except SQLAlchemyError as e:
+            # Another worker may have stored the same key first; the memory tier still has it
+            db.rollback()
+            logger.warning(f"Analysis cache store failed: {e}")
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            size = len(self._entries)
+        return {"memory_entries": size, "memory_max_entries": self.max_entries}
+
+
+analysis_cache = AnalysisCache()
+metrics.register_collector("analysis_cache", analysis_cache.stats)
+
+
+async def analyze_journal_entry_cached(
+    db: Session,
+    journal_text: str,
+    user_context: Dict = None,
+    priority: Priority = Priority.BACKGROUND,
+    user_id: str = None,
+    model: str = OLLAMA_MODEL
+) -> str:
+    """
+    Analyze a journal entry, reusing a previous analysis of the same text and context.
+    Canned fallback responses are never cached.
+    """
+    _, analysis = await try_analyze_journal_entry_cached(db, journal_text, user_context, priority, user_id, model)
+    return analysis
+
+
+async def try_analyze_journal_entry_cached(
+    db: Session,
+    journal_text: str,
+    user_context: Dict = None,
+    priority: Priority = Priority.BACKGROUND,
+    user_id: str = None,
+    model: str = OLLAMA_MODEL
+) -> Tuple[bool, str]:
+    """Like analyze_journal_entry_cached, but also reports whether a real analysis was produced"""
+    key = make_analysis_cache_key(journal_text, user_context, model_name=model)
+    cached = analysis_cache.get(db, key)
+    if cached is not None:
+        return True, cached
+
+    success, analysis = await try_analyze_journal_entry(journal_text, user_context, priority, user_id, model)
+    if success:
+        analysis_cache.set(key, analysis, model, JOURNAL_PROMPT_VERSION)
+    return success, analysis
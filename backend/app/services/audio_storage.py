@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import os
+import uuid
+import wave
+from typing import Optional
+
+from fastapi import UploadFile
+
+from app.services.metrics import metrics
+from app.utils.sizes import format_size
+
+# Durations of non-WAV audio (m4a, mp3, ogg...) are read with mutagen when it is installed
+if importlib.util.find_spec("mutagen") is not None:
+    import mutagen
+else:
+    mutagen = None
+
+logger = logging.getLogger(__name__)
+
+AUDIO_UPLOAD_DIR = os.getenv("AUDIO_UPLOAD_DIR", "uploads/audio")
+AUDIO_MAX_BYTES = int(os.getenv("AUDIO_MAX_BYTES", str(25 * 1024 * 1024)))
+AUDIO_CHUNK_BYTES = int(os.getenv("AUDIO_CHUNK_BYTES", str(256 * 1024)))
+AUDIO_EXTENSIONS = {".wav", ".m4a", ".mp3", ".aac", ".ogg", ".webm", ".caf"}
+AUDIO_DEFAULT_EXTENSION = ".wav"
+
+
+class AudioTooLarge(Exception):
+    pass
+
+
+class StoredAudio:
+    __slots__ = ("path", "size_bytes", "sha256", "duration_seconds", "deduplicated")
+
+    def __init__(self, path: str, size_bytes: int, sha256: str, duration_seconds: Optional[float], deduplicated: bool):
+        self.path = path
+        self.size_bytes = size_bytes
+        self.sha256 = sha256
+        self.duration_seconds = duration_seconds
+        self.deduplicated = deduplicated
+
+
+def audio_extension(filename: Optional[str]) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    return extension if extension in AUDIO_EXTENSIONS else AUDIO_DEFAULT_EXTENSION
+
+
+def audio_path_for(sha256: str, extension: str) -> str:
+    """Content-addressed path, sharded two levels deep so no directory grows unbounded"""
+    return os.path.join(AUDIO_UPLOAD_DIR, sha256[:2], sha256[2:4], f"{sha256}{extension}")
+
+
+def audio_duration(path: str) -> Optional[float]:
+    """Length in seconds, or None when the format cannot be read"""
+    try:
+        if path.endswith(".wav"):
+            with wave.open(path, "rb") as audio:
+                return round(audio.getnframes() / float(audio.getframerate()), 2)
+        if mutagen is not None:
+            info = getattr(mutagen.File(path), "info", None)
+            if info is not None and getattr(info, "length", None):
+                return round(info.length, 2)
+    except Exception as e:
+        logger.info(f"Could not read duration of {path}: {e}")
+    return None
+
+
+def _append(handle, chunk: bytes) -> None:
+    handle.write(chunk)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def finalize_audio(temp_path: str, sha256: str, size_bytes: int, extension: str) -> StoredAudio:
+    """Move a fully written temp file to its content-addressed path; identical audio is stored once"""
+    path = audio_path_for(sha256, extension)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    deduplicated = os.path.exists(path)
+    if deduplicated:
+        _remove(temp_path)
+        metrics.incr("audio_uploads_deduplicated_total")
+    else:
+        os.replace(temp_path, path)
+    metrics.incr("audio_uploads_total")
+    metrics.incr("audio_upload_bytes_total", size_bytes)
+    return StoredAudio(path, size_bytes, sha256, audio_duration(path), deduplicated)
+
+
+def temp_audio_path(name: Optional[str] = None) -> str:
+    temp_dir = os.path.join(AUDIO_UPLOAD_DIR, "tmp")
+    os.makedirs(temp_dir, exist_ok=True)
+    return os.path.join(temp_dir, f"{name or uuid.uuid4().hex}.part")
+
+
+async def save_audio_upload(upload: UploadFile, max_bytes: int = AUDIO_MAX_BYTES) -> StoredAudio:
+    """
+    Copy an uploaded audio file to storage in AUDIO_CHUNK_BYTES chunks.
+
+    The file is hashed while it is copied and all file operations run in a
+    thread to keep the event loop free. By now the form parser has already
+    spooled the whole upload, so the size cap here only stops it being
+    stored; oversized requests are refused before parsing by
+    BodySizeLimitMiddleware.
+    """
+    temp_path = await asyncio.to_thread(temp_audio_path)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        handle = await asyncio.to_thread(open, temp_path, "wb")
+        try:
+            while True:
+                chunk = await upload.read(AUDIO_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    metrics.incr("audio_uploads_rejected_total")
+                    raise AudioTooLarge(f"Audio exceeds the {format_size(max_bytes)} limit")
+                digest.update(chunk)
+                await asyncio.to_thread(_append, handle, chunk)
+        finally:
+            await asyncio.to_thread(handle.close)
+        return await asyncio.to_thread(
+            finalize_audio, temp_path, digest.hexdigest(), size, audio_extension(upload.filename)
+        )
+    except BaseException:
+        await asyncio.to_thread(_remove, temp_path)
+        raise
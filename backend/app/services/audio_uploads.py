@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+import importlib.util
+import os
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import AudioUpload
+from app.services.audio_storage import (
+    AUDIO_CHUNK_BYTES,
+    AUDIO_MAX_BYTES,
+    AudioTooLarge,
+    StoredAudio,
+    audio_extension,
+    finalize_audio,
+    temp_audio_path,
+    _remove,
+)
+from app.services.metrics import metrics
+from app.utils.sizes import format_size
+
+# Chunk writers share a lock on the upload file and finalize takes it exclusively (POSIX);
+# without fcntl only the status checks keep late chunks out
+if importlib.util.find_spec("fcntl") is not None:
+    import fcntl
+else:
+    fcntl = None
+
+# Unfinished uploads (and their partial files) are discarded after this long
+AUDIO_UPLOAD_TTL_HOURS = float(os.getenv("AUDIO_UPLOAD_TTL_HOURS", "24"))
+# Largest single PUT; clients on poor connections should send much smaller chunks
+AUDIO_UPLOAD_MAX_CHUNK_BYTES = int(os.getenv("AUDIO_UPLOAD_MAX_CHUNK_BYTES", str(8 * 1024 * 1024)))
+
+UPLOAD_OPEN = "open"
+UPLOAD_COMPLETE = "complete"
+UPLOAD_EXPIRED = "expired"
+
+
+class UploadRangeError(Exception):
+    pass
+
+
+class UploadChecksumMismatch(Exception):
+    pass
+
+
+class UploadClosed(Exception):
+    pass
+
+
+def merge_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """Add [start, end) to sorted, non-overlapping ranges, merging neighbours"""
+    merged: List[List[int]] = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+def contiguous_bytes(ranges: List[List[int]]) -> int:
+    """Bytes received without a gap from the start: where a sequential client resumes"""
+    return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+
+def missing_ranges(ranges: List[List[int]], total: int) -> List[List[int]]:
+    missing, position = [], 0
+    for start, end in ranges:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < total:
+        missing.append([position, total])
+    return missing
+
+
+def upload_path(upload: AudioUpload) -> str:
+    return temp_audio_path(f"upload-{upload.id}")
+
+
+def upload_status(upload: AudioUpload) -> Dict:
+    ranges = upload.received_ranges or []
+    return {
+        "id": upload.id,
+        "status": upload.status,
+        "total_bytes": upload.total_bytes,
+        "received_bytes": sum(end - start for start, end in ranges),
+        "offset": contiguous_bytes(ranges),
+        "missing_ranges": missing_ranges(ranges, upload.total_bytes),
+        "expires_at": upload.expires_at,
+        "journal_entry_id": upload.journal_entry_id,
+    }
+
+
+def _preallocate(path: str, size: int) -> None:
+    with open(path, "wb") as handle:
+        handle.truncate(size)
+
+
+def create_upload(db: Session, user_id, total_bytes: int, filename: Optional[str] = None, sha256: Optional[str] = None) -> AudioUpload:
+    """Open an upload session with a file of its final size; the declared size is capped like a single-shot upload"""
+    if total_bytes > AUDIO_MAX_BYTES:
+        metrics.incr("audio_uploads_rejected_total")
+        raise AudioTooLarge(f"Audio exceeds the {format_size(AUDIO_MAX_BYTES)} limit")
+    purge_expired_uploads(db)
+    upload = AudioUpload(
+        user_id=user_id,
+        filename=filename,
+        total_bytes=total_bytes,
+        sha256=sha256.lower() if sha256 else None,
+        received_ranges=[],
+        expires_at=datetime.utcnow() + timedelta(hours=AUDIO_UPLOAD_TTL_HOURS),
+    )
+    db.add(upload)
+    db.flush()
+    # A sparse file of the final size, so chunks can land at any offset
+    _preallocate(upload_path(upload), total_bytes)
+    db.commit()
+    db.refresh(upload)
+    metrics.incr("audio_upload_sessions_total")
+    return upload
+
+
+def _open_for_chunk(path: str):
+    """
+    Open the upload file for a chunk, sharing it with other chunk writers.
+
+    Waits while a finalize holds the file. A finalize that got there first
+    has moved the file into storage, so the path no longer names the file
+    this handle has open and the chunk is refused instead of landing in
+    audio that was already hashed.
+    """
+    try:
+        handle = open(path, "r+b")
+    except FileNotFoundError:
+        raise UploadClosed("Upload is already finalized")
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_SH)
+    try:
+        moved = os.stat(path).st_ino != os.fstat(handle.fileno()).st_ino
+    except FileNotFoundError:
+        moved = True
+    if moved:
+        handle.close()
+        raise UploadClosed("Upload is already finalized")
+    return handle
+
+
+def _lock_for_finalize(path: str):
+    """Exclusive hold on the upload file; waits for chunks being written to finish"""
+    handle = open(path, "rb")
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+    return handle
+
+
+def _write_at(handle, offset: int, chunk: bytes) -> None:
+    handle.seek(offset)
+    handle.write(chunk)
+
+
+def is_expired(upload: AudioUpload) -> bool:
+    return upload.status == UPLOAD_EXPIRED or upload.expires_at < datetime.utcnow()
+
+
+async def write_chunk(upload: AudioUpload, offset: int, body: AsyncIterator[bytes]) -> Dict:
+    """
+    Write a request body into the upload's file at `offset` as it arrives.
+
+    Whatever was written is recorded even when the client drops mid-chunk,
+    so a resume only resends the part that never arrived. Returns the
+    upload status after the chunk; raises UploadClosed once the upload is
+    being finalized or is finalized.
+    """
+    if offset < 0 or offset >= upload.total_bytes:
+        raise UploadRangeError(f"Offset must be between 0 and {upload.total_bytes - 1}")
+
+    written = 0
+    handle = await asyncio.to_thread(_open_for_chunk, upload_path(upload))
+    try:
+        async for piece in body:
+            if not piece:
+                continue
+            if offset + written + len(piece) > upload.total_bytes:
+                raise UploadRangeError("Chunk runs past the declared upload size")
+            if written + len(piece) > AUDIO_UPLOAD_MAX_CHUNK_BYTES:
+                metrics.incr("audio_uploads_rejected_total")
+                raise AudioTooLarge(f"Chunks are limited to {format_size(AUDIO_UPLOAD_MAX_CHUNK_BYTES)}")
+            await asyncio.to_thread(_write_at, handle, offset + written, piece)
+            written += len(piece)
+    finally:
+        await asyncio.to_thread(handle.close)
+        metrics.incr("audio_upload_chunk_bytes_total", written)
+        status = await asyncio.to_thread(record_chunk, upload.id, offset, written)
+    return status
+
+
+def record_chunk(upload_id, offset: int, written: int) -> Dict:
+    """
+    Add a written range to the upload and push its expiry back.
+
+    Uses its own session so the request does not hold a connection while
+    the body streams; the row lock keeps concurrent chunks from losing each
+    other's ranges.
+    """
+    db = SessionLocal()
+    try:
+        upload = db.query(AudioUpload).filter(AudioUpload.id == upload_id).with_for_update().first()
+        if written > 0:
+            upload.received_ranges = merge_range(list(upload.received_ranges or []), offset, offset + written)
+            upload.expires_at = datetime.utcnow() + timedelta(hours=AUDIO_UPLOAD_TTL_HOURS)
+        db.commit()
+        return upload_status(upload)
+    finally:
+        db.close()
+
+
+def claim_upload(db: Session, upload_id) -> bool:
+    """
+    Mark an open upload complete in the caller's transaction.
+
+    The conditional update waits for any other finalize holding the row and
+    then sees its result, so only one caller gets True; it must commit the
+    journal entry in the same transaction, or roll back to reopen the upload.
+    """
+    claimed = db.query(AudioUpload).filter(
+        AudioUpload.id == upload_id,
+        AudioUpload.status == UPLOAD_OPEN
+    ).update({AudioUpload.status: UPLOAD_COMPLETE}, synchronize_session=False)
+    return claimed == 1
+
+
+def reset_upload(db: Session, upload_id) -> None:
+    """Forget every received range, so the whole file is sent again"""
+    db.query(AudioUpload).filter(AudioUpload.id == upload_id).update(
+        {AudioUpload.received_ranges: []}, synchronize_session=False
+    )
+    db.commit()
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(AUDIO_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def assemble_upload(upload: AudioUpload) -> StoredAudio:
+    """Hash the complete file and move it into audio storage; the caller checks that no range is missing"""
+    path = upload_path(upload)
+    # Held until the file is in storage, so no chunk lands after it was hashed
+    lock = await asyncio.to_thread(_lock_for_finalize, path)
+    try:
+        sha256 = await asyncio.to_thread(_hash_file, path)
+        if upload.sha256 and upload.sha256 != sha256:
+            metrics.incr("audio_upload_checksum_mismatches_total")
+            raise UploadChecksumMismatch("Uploaded audio does not match the declared sha256")
+        return await asyncio.to_thread(
+            finalize_audio, path, sha256, upload.total_bytes, audio_extension(upload.filename)
+        )
+    finally:
+        await asyncio.to_thread(lock.close)
+
+
+def purge_expired_uploads(db: Session, limit: int = 100) -> int:
+    """Mark unfinished uploads past their expiry as expired and delete their partial files"""
+    expired = db.query(AudioUpload).filter(
+        AudioUpload.status == UPLOAD_OPEN,
+        AudioUpload.expires_at < datetime.utcnow()
+    ).limit(limit).all()
+    for upload in expired:
+        _remove(upload_path(upload))
+        upload.status = UPLOAD_EXPIRED
+    if expired:
+        db.commit()
+        metrics.incr("audio_uploads_expired_total", len(expired))
+    return len(expired)
@@ -0,0 +1,285 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import or_, tuple_
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import JournalEntry, ReanalysisRun
+from app.services.ai_jobs import (
+    analyze_entry,
+    ANALYSIS_STATUS_PENDING,
+    ANALYSIS_STATUS_FALLBACK,
+    TRANSCRIPTION_PENDING_TEXT,
+)
+from app.services.chatbot import ollama_breaker, JOURNAL_PROMPT_VERSION
+from app.services.job_queue import enqueue_job, register_job_handler
+from app.services.llm_scheduler import Priority
+from app.services.metrics import metrics
+from app.services.model_router import model_router
+
+logger = logging.getLogger(__name__)
+
+BULK_REANALYSIS_JOB = "bulk_reanalysis"
+
+BULK_REANALYSIS_BATCH_SIZE = int(os.getenv("BULK_REANALYSIS_BATCH_SIZE", "25"))
+# Ollama slots a bulk run may hold at once; keep below LLM_SCHEDULER_SLOTS so chat always has room
+BULK_REANALYSIS_CONCURRENCY = int(os.getenv("BULK_REANALYSIS_CONCURRENCY", "2"))
+# Local hours bulk runs may work in, e.g. "22-6"; empty means any time
+BULK_REANALYSIS_HOURS = os.getenv("BULK_REANALYSIS_HOURS", "")
+
+
+def _parse_hours(spec: str) -> Optional[Tuple[int, int]]:
+    if not spec.strip():
+        return None
+    start, end = spec.split("-")
+    return int(start) % 24, int(end) % 24
+
+
+def next_window_start(now: datetime = None) -> Optional[datetime]:
+    """
+    UTC time the off-peak window next opens, or None if it is open now.
+
+    Hours are server-local so "22-6" means nights where the clinic is.
+    """
+    hours = _parse_hours(BULK_REANALYSIS_HOURS)
+    if hours is None:
+        return None
+
+    start, end = hours
+    local_now = now or datetime.now()
+    hour = local_now.hour
+    in_window = start <= hour < end if start < end else hour >= start or hour < end
+    if in_window:
+        return None
+
+    opens = local_now.replace(hour=start, minute=0, second=0, microsecond=0)
+    if opens <= local_now:
+        opens += timedelta(days=1)
+    return datetime.utcnow() + (opens - local_now)
+
+
+def build_reanalysis_query(db: Session, filters: Dict):
+    """
+    Journal entries matching a bulk run's filters.
+
+    Supported filters: created_from / created_to (ISO dates), user_id,
+    placeholder_only (pending or fallback text still shown), stale_only
+    (not produced by the journal model with the current prompt version) and
+    model (produced by this model).
+    """
+    query = db.query(JournalEntry).filter(
+        JournalEntry.created_at.isnot(None),
+        # Audio entries waiting for a transcript are analyzed once it is stored
+        JournalEntry.text_content != TRANSCRIPTION_PENDING_TEXT
+    )
+
+    if filters.get("created_from"):
+        query = query.filter(JournalEntry.created_at >= datetime.fromisoformat(filters["created_from"]))
+    if filters.get("created_to"):
+        query = query.filter(JournalEntry.created_at < datetime.fromisoformat(filters["created_to"]))
+    if filters.get("user_id"):
+        query = query.filter(JournalEntry.user_id == UUID(filters["user_id"]))
+    if filters.get("model"):
+        query = query.filter(JournalEntry.analysis_model == filters["model"])
+    if filters.get("placeholder_only"):
+        query = query.filter(JournalEntry.analysis_status.in_([ANALYSIS_STATUS_PENDING, ANALYSIS_STATUS_FALLBACK]))
+    if filters.get("stale_only"):
+        query = query.filter(or_(
+            JournalEntry.analysis_model.is_(None),
+            JournalEntry.analysis_model != model_router.large_model,
+            JournalEntry.analysis_prompt_version.is_(None),
+            JournalEntry.analysis_prompt_version != JOURNAL_PROMPT_VERSION
+        ))
+    return query
+
+
+def create_reanalysis_run(db: Session, filters: Dict) -> ReanalysisRun:
+    run = ReanalysisRun(filters=filters, total=build_reanalysis_query(db, filters).count())
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def schedule_reanalysis_batch(db: Session, run_id, generation: int = 0) -> None:
+    """Queue the next batch of a run for the job worker, waiting for the off-peak window if needed"""
+    enqueue_job(
+        db,
+        BULK_REANALYSIS_JOB,
+        {"run_id": str(run_id), "generation": generation},
+        priority=Priority.BATCH,
+        max_attempts=10,
+        run_after=next_window_start()
+    )
+
+
+def start_reanalysis_run(db: Session, filters: Dict) -> ReanalysisRun:
+    run = create_reanalysis_run(db, filters)
+    schedule_reanalysis_batch(db, run.id)
+    return run
+
+
+def cancel_reanalysis_run(db: Session, run_id) -> Optional[ReanalysisRun]:
+    """Stop a run; its queued batch job finds it cancelled and does nothing"""
+    run = db.query(ReanalysisRun).filter(ReanalysisRun.id == run_id).first()
+    if run and run.status == "running":
+        run.status = "cancelled"
+        db.commit()
+    return run
+
+
+def resume_reanalysis_run(db: Session, run_id, queue: bool = True) -> Optional[ReanalysisRun]:
+    """
+    Continue a cancelled or failed run from its checkpoint.
+
+    Starts a new generation: a batch job of the old chain still queued (it
+    may be waiting for the off-peak window) would otherwise see the run
+    running again and walk the same cursor as the new one.
+    """
+    run = db.query(ReanalysisRun).filter(ReanalysisRun.id == run_id).first()
+    if not run or run.status in ("running", "done"):
+        return run
+    run.status = "running"
+    run.generation = (run.generation or 0) + 1
+    run.last_error = None
+    run.finished_at = None
+    db.commit()
+    if queue:
+        schedule_reanalysis_batch(db, run.id, run.generation)
+    return run
+
+
+def reanalysis_progress(run: ReanalysisRun) -> Dict:
+    processed = run.processed or 0
+    remaining = max(0, (run.total or 0) - processed)
+    rate = processed / run.active_seconds if run.active_seconds else 0.0
+    return {
+        "run_id": str(run.id),
+        "status": run.status,
+        "filters": run.filters,
+        "total": run.total,
+        "processed": processed,
+        "succeeded": run.succeeded,
+        "failed": run.failed,
+        "percent": round(100.0 * processed / run.total, 1) if run.total else 100.0,
+        "entries_per_minute": round(rate * 60, 2),
+        "eta_seconds": round(remaining / rate) if rate else None,
+        "last_error": run.last_error,
+    }
+
+
+async def _reanalyze_entry(entry_id, semaphore: asyncio.Semaphore) -> bool:
+    async with semaphore:
+        db = SessionLocal()
+        try:
+            entry = db.query(JournalEntry).filter(JournalEntry.id == entry_id).first()
+            if not entry:
+                return True
+            return await analyze_entry(db, entry, priority=Priority.BATCH)
+        except Exception as e:
+            logger.warning(f"Error re-analyzing journal entry {entry_id}: {e}")
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+
+async def run_reanalysis_batch(run_id, generation: int = 0) -> bool:
+    """
+    Re-analyze the next batch of a run and checkpoint it.
+
+    Entries are read with keyset pagination on (created_at, id), so each batch
+    is an index range scan no matter how far the run has progressed, and rows
+    inserted meanwhile never shift the cursor. Returns True while work remains.
+    A batch of an earlier `generation` than the run's does nothing, and one
+    whose run was resumed while it ran does not checkpoint.
+    """
+    if ollama_breaker.state == "open":
+        raise RuntimeError("Ollama is unavailable; batch postponed")
+
+    db = SessionLocal()
+    try:
+        run = db.query(ReanalysisRun).filter(ReanalysisRun.id == run_id).first()
+        if not run or run.status != "running" or (run.generation or 0) != generation:
+            return False
+
+        query = build_reanalysis_query(db, run.filters)
+        if run.last_created_at is not None:
+            query = query.filter(
+                tuple_(JournalEntry.created_at, JournalEntry.id) > tuple_(run.last_created_at, run.last_entry_id)
+            )
+        page = query.order_by(JournalEntry.created_at, JournalEntry.id).with_entities(
+            JournalEntry.id, JournalEntry.created_at
+        ).limit(BULK_REANALYSIS_BATCH_SIZE).all()
+        db.commit()
+
+        if not page:
+            run.status = "done"
+            run.finished_at = datetime.utcnow()
+            db.commit()
+            logger.info(f"Reanalysis run {run.id} finished: {reanalysis_progress(run)}")
+            return False
+
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(max(1, BULK_REANALYSIS_CONCURRENCY))
+        results = await asyncio.gather(*(_reanalyze_entry(entry_id, semaphore) for entry_id, _ in page))
+        elapsed = time.perf_counter() - started
+
+        if ollama_breaker.state == "open" and not all(results):
+            # Ollama went down mid-batch: only checkpoint up to the first failure and retry later
+            cut = results.index(False)
+            page, results = page[:cut], results[:cut]
+            postponed = True
+        else:
+            postponed = False
+
+        db.refresh(run)
+        if (run.generation or 0) != generation:
+            # Cancelled and resumed meanwhile: the new chain owns the cursor and the counts
+            return False
+        if page:
+            run.last_entry_id, run.last_created_at = page[-1]
+        run.processed = (run.processed or 0) + len(results)
+        run.succeeded = (run.succeeded or 0) + sum(results)
+        run.failed = (run.failed or 0) + len(results) - sum(results)
+        run.active_seconds = (run.active_seconds or 0.0) + elapsed
+        db.commit()
+
+        metrics.incr("bulk_reanalysis_entries_total", len(results))
+        metrics.incr("bulk_reanalysis_failures_total", len(results) - sum(results))
+        progress = reanalysis_progress(run)
+        logger.info(
+            f"Reanalysis run {run.id}: {progress['processed']}/{progress['total']} "
+            f"({progress['entries_per_minute']}/min, ETA {progress['eta_seconds']}s)"
+        )
+
+        if postponed:
+            raise RuntimeError("Ollama became unavailable; batch postponed")
+        return True
+    finally:
+        db.close()
+
+
+async def run_reanalysis_job(db: Session, payload: Dict) -> None:
+    run_id = UUID(payload["run_id"])
+    generation = payload.get("generation", 0)
+    if await run_reanalysis_batch(run_id, generation):
+        # One batch per job keeps each job well inside JOB_LOCK_TIMEOUT
+        schedule_reanalysis_batch(db, run_id, generation)
+
+
+async def mark_run_failed(db: Session, payload: Dict, error: str) -> None:
+    run = db.query(ReanalysisRun).filter(ReanalysisRun.id == UUID(payload["run_id"])).first()
+    if run and run.status == "running":
+        run.status = "failed"
+        run.last_error = error
+        db.commit()
+
+
+register_job_handler(BULK_REANALYSIS_JOB, run_reanalysis_job, concurrency=1, on_give_up=mark_run_failed)
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import select
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Notification channels; each is keyed by the id readers wait on
+MESSAGES_CHANNEL = "chat_messages"  # conversation id
+JOURNAL_ANALYSIS_CHANNEL = "journal_analysis"  # user id
+NOTIFY_CHANNELS = (MESSAGES_CHANNEL, JOURNAL_ANALYSIS_CHANNEL)
+
+# Cross-process wake-ups through Postgres LISTEN/NOTIFY; other databases only wake this process
+CHANGE_LISTEN_ENABLED = (
+    os.getenv("CHANGE_LISTEN_ENABLED", "true").lower() == "true"
+    and engine.dialect.name == "postgresql"
+)
+CHANGE_LISTEN_RECONNECT_SECONDS = float(os.getenv("CHANGE_LISTEN_RECONNECT_SECONDS", "5"))
+# Longest a long-poll request may wait for a change
+LONG_POLL_MAX_WAIT = float(os.getenv("LONG_POLL_MAX_WAIT", "30"))
+
+
+class ChangeNotifier:
+    """
+    Wakes long-polling and streaming requests when something they wait on is committed.
+
+    Writers call `publish(channel, key)` after committing. Within a process
+    waiters are woken directly; with Postgres the commit is also announced
+    with NOTIFY, and a listener thread in every API process wakes its own
+    waiters, so a reply or analysis written by a separate job worker reaches
+    the API at once.
+    """
+
+    def __init__(self):
+        self._waiters: Dict[Tuple[str, str], Set[asyncio.Event]] = defaultdict(set)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if CHANGE_LISTEN_ENABLED and self._listener is None:
+            self._stopping.clear()
+            self._listener = threading.Thread(target=self._listen, name="change-listener", daemon=True)
+            self._listener.start()
+
+    async def stop(self) -> None:
+        self._stopping.set()
+        if self._listener is not None:
+            await asyncio.to_thread(self._listener.join, CHANGE_LISTEN_RECONNECT_SECONDS + 1)
+            self._listener = None
+
+    def subscribe(self, channel: str, key) -> asyncio.Event:
+        """Register before reading, so a change committed in between is not missed"""
+        event = asyncio.Event()
+        self._waiters[(channel, str(key))].add(event)
+        return event
+
+    def unsubscribe(self, channel: str, key, event: asyncio.Event) -> None:
+        waiter_key = (channel, str(key))
+        waiters = self._waiters.get(waiter_key)
+        if waiters is not None:
+            waiters.discard(event)
+            if not waiters:
+                del self._waiters[waiter_key]
+
+    async def wait(self, event: asyncio.Event, timeout: float) -> bool:
+        """True if a change arrived within `timeout` seconds; clears the event for the next wait"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            event.clear()
+
+    def _wake(self, channel: str, key: str) -> None:
+        for event in self._waiters.get((channel, key), ()):
+            event.set()
+
+    def notify_local(self, channel: str, key) -> None:
+        """Wake this process's waiters; safe to call from any thread"""
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._wake, channel, str(key))
+
+    def publish(self, channel: str, key) -> None:
+        """Announce a committed change to waiters here and, with Postgres, in every other process"""
+        metrics.incr(f"{channel}_notifications_total")
+        self.notify_local(channel, key)
+        if engine.dialect.name != "postgresql":
+            return
+        try:
+            # Its own short transaction, so the writer's session and objects are left alone
+            with engine.begin() as connection:
+                connection.execute(text("SELECT pg_notify(:channel, :payload)"), {
+                    "channel": channel,
+                    "payload": str(key),
+                })
+        except Exception as e:
+            # Waiters elsewhere still see the change when their wait times out
+            logger.warning(f"Could not NOTIFY {channel}: {e}")
+
+    def _listen(self) -> None:
+        """LISTEN on a dedicated connection and hand notifications to the event loop"""
+        import psycopg2
+
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(dsn)
+                connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with connection.cursor() as cursor:
+                    for channel in NOTIFY_CHANNELS:
+                        cursor.execute(f"LISTEN {channel}")
+                logger.info(f"Listening for changes on {', '.join(NOTIFY_CHANNELS)}")
+
+                while not self._stopping.is_set():
+                    # Wake up now and then to notice stop()
+                    if select.select([connection], [], [], 1.0) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        self.notify_local(notification.channel, notification.payload)
+            except Exception as e:
+                logger.warning(f"Change listener failed, reconnecting: {e}")
+                self._stopping.wait(CHANGE_LISTEN_RECONNECT_SECONDS)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def stats(self) -> Dict:
+        return {
+            "listen": CHANGE_LISTEN_ENABLED,
+            "listener_alive": self._listener is not None and self._listener.is_alive(),
+            "waiting_requests": sum(len(waiters) for waiters in self._waiters.values()),
+        }
+
+
+change_notifier = ChangeNotifier()
+metrics.register_collector("change_notifier", change_notifier.stats)
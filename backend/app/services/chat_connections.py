@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from typing import Awaitable, Dict, Optional, Set
+
+from fastapi import WebSocket
+from fastapi.encoders import jsonable_encoder
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Per-worker limits; each uvicorn worker has its own registry
+WS_MAX_CONNECTIONS = int(os.getenv("WS_MAX_CONNECTIONS", "1000"))
+WS_MAX_CONNECTIONS_PER_USER = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", "5"))
+# Frames waiting to be sent to one socket; a client that falls this far behind is disconnected
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# Largest client frame accepted, in bytes
+WS_MAX_MESSAGE_BYTES = int(os.getenv("WS_MAX_MESSAGE_BYTES", "16384"))
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "25"))
+
+# Close codes
+WS_POLICY_VIOLATION = 1008
+WS_MESSAGE_TOO_BIG = 1009
+WS_TRY_AGAIN_LATER = 1013
+
+
+def format_frame(event: str, data) -> str:
+    """One server frame: the same event names and JSON payloads as the SSE endpoints"""
+    return json.dumps({"event": event, "data": jsonable_encoder(data)})
+
+
+class ChatConnection:
+    """
+    One chat WebSocket.
+
+    Frames go through a bounded queue drained by a sender task, so a slow
+    client costs at most WS_SEND_QUEUE_SIZE frames of memory and never
+    blocks whoever is publishing.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: str, conversation_id: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.conversation_id = conversation_id
+        self.queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+        self.closed = False
+        self.busy = False  # a reply is being generated for this socket
+        self._sender: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        self._sender = asyncio.get_running_loop().create_task(self._send_loop())
+
+    def run(self, work: Awaitable) -> asyncio.Task:
+        """Run work for this socket; referenced until it finishes and cancelled by finish()"""
+        task = asyncio.get_running_loop().create_task(work)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Chat socket task failed for conversation {self.conversation_id}", exc_info=task.exception())
+
+    def send(self, event: str, data) -> bool:
+        """Queue a frame; a client whose queue is full is dropped"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(format_frame(event, data))
+            return True
+        except asyncio.QueueFull:
+            metrics.incr("ws_slow_consumer_disconnects_total")
+            logger.warning(f"Dropping slow chat socket for conversation {self.conversation_id}")
+            self.close(WS_TRY_AGAIN_LATER)
+            return False
+
+    async def _send_loop(self) -> None:
+        try:
+            while True:
+                try:
+                    frame = await asyncio.wait_for(self.queue.get(), timeout=WS_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    frame = format_frame("ping", {})
+                if frame is None:
+                    break
+                await self.websocket.send_text(frame)
+                metrics.incr("ws_frames_sent_total")
+        except Exception:
+            pass  # The receive loop notices the disconnect and unregisters
+        finally:
+            self.closed = True
+
+    def close(self, code: int = 1000) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        # Make room for the sentinel; queued frames are dropped anyway
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+        self._closing = asyncio.get_running_loop().create_task(self._close_socket(code))
+
+    async def _close_socket(self, code: int) -> None:
+        try:
+            if self._sender is not None:
+                await self._sender
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def finish(self) -> None:
+        """Cancel outstanding work and stop the sender once the receive loop has ended, letting a pending close go out first"""
+        self.closed = True
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._closing is not None:
+            await self._closing
+        elif self._sender is not None:
+            self._sender.cancel()
+
+
+class ConnectionRegistry:
+    """
+    Chat sockets of this worker, by conversation.
+
+    Caps total and per-user connections, and lets a reply be pushed to
+    every socket open on a conversation (a user on two devices).
+    """
+
+    def __init__(self, max_connections: int = WS_MAX_CONNECTIONS, max_per_user: int = WS_MAX_CONNECTIONS_PER_USER):
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self._by_conversation: Dict[str, Set[ChatConnection]] = defaultdict(set)
+        self._per_user: Dict[str, int] = defaultdict(int)
+        self._count = 0
+
+    def register(self, connection: ChatConnection) -> Optional[str]:
+        """Add a connection; returns why it was refused, or None"""
+        if self._count >= self.max_connections:
+            metrics.incr("ws_rejected_total")
+            return "Too many connections, try again later"
+        if self._per_user[connection.user_id] >= self.max_per_user:
+            metrics.incr("ws_rejected_total")
+            return "Too many open chat connections for this user"
+
+        self._by_conversation[connection.conversation_id].add(connection)
+        self._per_user[connection.user_id] += 1
+        self._count += 1
+        metrics.incr("ws_connections_total")
+        return None
+
+    def unregister(self, connection: ChatConnection) -> None:
+        connections = self._by_conversation.get(connection.conversation_id)
+        if not connections or connection not in connections:
+            return
+        connections.discard(connection)
+        if not connections:
+            del self._by_conversation[connection.conversation_id]
+        self._per_user[connection.user_id] -= 1
+        if self._per_user[connection.user_id] <= 0:
+            del self._per_user[connection.user_id]
+        self._count -= 1
+
+    def publish(self, conversation_id: str, event: str, data) -> int:
+        """Queue a frame for every socket on the conversation; returns how many got it"""
+        delivered = 0
+        for connection in list(self._by_conversation.get(str(conversation_id), ())):
+            if connection.send(event, data):
+                delivered += 1
+        return delivered
+
+    def stats(self) -> Dict:
+        return {
+            "connections": self._count,
+            "conversations": len(self._by_conversation),
+            "users": len(self._per_user),
+            "max_connections": self.max_connections,
+            "max_per_user": self.max_per_user,
+            "queued_frames": sum(
+                connection.queue.qsize()
+                for connections in self._by_conversation.values()
+                for connection in connections
+            ),
+        }
+
+
+chat_connections = ConnectionRegistry()
+metrics.register_collector("chat_connections", chat_connections.stats)
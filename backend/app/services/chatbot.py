@@ -1,123 +1,162 @@
 import os
-import httpx
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, AsyncIterator
 from sqlalchemy.orm import Session
 from app import models
+from app.services.llm_scheduler import Priority
+from app.services.model_router import model_router, CHAT_TASK, JOURNAL_TASK, SUMMARY_TASK
+from app.services.course_index import retrieve_passages, format_passages
+from app.services.user_context import user_context_cache
+from app.services.inference_gateway import (
+    inference_gateway,
+    OLLAMA_EMBED_MODEL,
+    OLLAMA_MODEL,
+    UNAVAILABLE_RESPONSE as OLLAMA_UNAVAILABLE_RESPONSE,
+)
 
+# Bump whenever the journal analysis prompt changes so cached analyses are not reused
+JOURNAL_PROMPT_VERSION = "2"
 
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma2:2b")
+# Owned by the inference gateway; exposed here so callers can check whether Ollama is up
+ollama_capabilities = inference_gateway.capabilities
+ollama_breaker = inference_gateway.breaker
 
-async def generate_ai_response(message_history: List[Dict[str, str]], user_context: Dict = None) -> str:
+def latest_user_message(message_history: List[Dict[str, str]]) -> str:
+    return next((msg["content"] for msg in reversed(message_history) if msg["role"] == "user"), "")
+
+def build_chat_messages(
+    message_history: List[Dict[str, str]],
+    user_context: Dict = None,
+    summary: str = None,
+    course_material: str = None
+) -> List[Dict[str, str]]:
+    """
+    Assemble chat messages so the prompt prefix stays stable across turns.
+    
+    The system prompt, the rolling summary of older turns and earlier history
+    change rarely between turns, so Ollama can reuse their KV cache. Volatile
+    user context (mood, stress) and the course passages retrieved for this
+    turn go into the newest user turn only.
+    """
+    system_prompt = create_healthcare_system_prompt()
+    if summary:
+        system_prompt += f"\n\nSummary of the earlier conversation:\n{summary}"
+    messages = [{"role": "system", "content": system_prompt}]
+    messages += [dict(msg) for msg in message_history]
+    
+    context_note = "\n\n".join(part for part in (course_material, format_user_context(user_context)) if part)
+    if context_note:
+        if messages[-1]["role"] == "user":
+            messages[-1]["content"] = f"{messages[-1]['content']}\n\n{context_note}"
+        else:
+            messages.append({"role": "user", "content": context_note})
+    
+    return messages
+
+async def generate_ai_response(
+    message_history: List[Dict[str, str]],
+    user_context: Dict = None,
+    priority: Priority = Priority.INTERACTIVE,
+    user_id: str = None,
+    conversation_id: str = None,
+    summary: str = None,
+    model: str = None,
+    task: str = CHAT_TASK
+) -> str:
     """
     Generate AI response using Ollama's API with healthcare-specific context
     
+    Returns:
+        str: The generated AI response, or a canned message if Ollama failed
+    """
+    _, response = await try_generate_ai_response(
+        message_history, user_context, priority, user_id, conversation_id, summary, model, task
+    )
+    return response
+
+async def try_generate_ai_response(
+    message_history: List[Dict[str, str]],
+    user_context: Dict = None,
+    priority: Priority = Priority.INTERACTIVE,
+    user_id: str = None,
+    conversation_id: str = None,
+    summary: str = None,
+    model: str = None,
+    task: str = CHAT_TASK,
+    query_vector=None
+) -> tuple[bool, str]:
+    """
+    Generate AI response, reporting whether the model actually produced it
+    
     Args:
         message_history: List of message dictionaries with 'role' and 'content'
         user_context: Optional context about the user (specialty, recent assessments, etc.)
+        priority: Scheduler priority class for this generation
+        user_id: Used for fair per-user queuing in the scheduler
+        conversation_id: Lets the generate API reuse the conversation's evaluated context
+        summary: Rolling summary of turns that no longer fit in message_history
+        model: Ollama model to use; chosen by the model router when omitted
+        task: Call kind whose timeout and generation options apply (chat or quick)
+        query_vector: Embedding of the latest user message by OLLAMA_EMBED_MODEL, reused for retrieval
     
     Returns:
-        str: The generated AI response
+        tuple[bool, str]: (True, response) on success, (False, canned message) otherwise
     """
+    model = model or model_router.chat_model(message_history, summary)
     
-    # Create healthcare-specific system prompt
-    system_prompt = create_healthcare_system_prompt(user_context)
+    # Stable system prompt and history first, volatile context last
+    course_material = format_passages(await retrieve_passages(
+        latest_user_message(message_history), query_vector=query_vector, query_model=OLLAMA_EMBED_MODEL
+    ))
+    messages = build_chat_messages(message_history, user_context, summary, course_material)
     
-    # Prepare messages with system prompt
-    messages = [{"role": "system", "content": system_prompt}] + message_history
-    
-    # Try the new chat API first, then fall back to generate API
-    success, response = await try_chat_api(messages)
-    if success:
-        return response
-    
-    # Fallback to generate API
-    return await try_generate_api(messages, system_prompt)
-
-async def try_chat_api(messages: List[Dict[str, str]]) -> tuple[bool, str]:
-    """Try the newer chat API endpoint"""
-    payload = {
-        "model": OLLAMA_MODEL,
-        "messages": messages,
-        "stream": False,
-        "options": {
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "num_predict": 800,
-        }
-    }
-    
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/chat",
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code == 200:
-                response_data = response.json()
-                if "message" in response_data and "content" in response_data["message"]:
-                    return True, response_data["message"]["content"].strip()
-            
-            return False, ""
-                
-    except Exception as e:
-        print(f"Chat API failed: {e}")
-        return False, ""
+    return await inference_gateway.complete(
+        messages,
+        task,
+        model,
+        priority=priority,
+        user_id=user_id,
+        conversation_id=conversation_id,
+        message_history=message_history
+    )
 
-async def try_generate_api(messages: List[Dict[str, str]], system_prompt: str) -> str:
-    """Fallback to the generate API for older Ollama versions"""
+async def stream_ai_response(
+    message_history: List[Dict[str, str]],
+    user_context: Dict = None,
+    user_id: str = None,
+    summary: str = None,
+    model: str = None,
+    conversation_id: str = None
+) -> AsyncIterator[str]:
+    """
+    Stream an AI response token by token from Ollama's chat API
     
-    # Convert messages to a single prompt for generate API
-    conversation_text = system_prompt + "\n\n"
-    for msg in messages[1:]:  # Skip system message since we already added it
-        role = "Human" if msg["role"] == "user" else "Assistant"
-        conversation_text += f"{role}: {msg['content']}\n"
-    conversation_text += "Assistant: "
+    Args:
+        message_history: List of message dictionaries with 'role' and 'content'
+        user_context: Optional context about the user
+        user_id: Used for fair per-user queuing in the scheduler
+        summary: Rolling summary of turns that no longer fit in message_history
+        model: Ollama model to use; chosen by the model router when omitted
+        conversation_id: Keeps the conversation on the backend that holds its KV cache
     
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": conversation_text,
-        "stream": False,
-        "options": {
-            "temperature": 0.7,
-            "top_p": 0.9,
-            "num_predict": 800,
-            "stop": ["Human:", "User:"]
-        }
-    }
+    Yields:
+        str: Response text fragments as Ollama produces them
+    """
+    model = model or model_router.chat_model(message_history, summary)
+    course_material = format_passages(await retrieve_passages(latest_user_message(message_history)))
+    messages = build_chat_messages(message_history, user_context, summary, course_material)
     
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/generate",
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-            response_data = response.json()
-            
-            if "response" in response_data:
-                return response_data["response"].strip()
-            else:
-                return "I'm having trouble processing your request right now. Please try again."
-                
-    except httpx.TimeoutException:
-        return "I'm taking longer to respond than usual. Please try again."
-    except httpx.HTTPStatusError as e:
-        print(f"HTTP error occurred: {e}")
-        return "I'm experiencing technical difficulties. Please try again later."
-    except httpx.RequestError as e:
-        print(f"Network error occurred: {e}")
-        return "I'm having trouble connecting. Please check if Ollama is running and try again."
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        return "Something unexpected happened. Please try again."
+    async for content in inference_gateway.stream_chat(
+        messages,
+        CHAT_TASK,
+        model,
+        priority=Priority.INTERACTIVE,
+        user_id=user_id,
+        conversation_id=conversation_id
+    ):
+        yield content
 
-def create_healthcare_system_prompt(user_context: Dict = None) -> str:
-    """Create a healthcare-focused system prompt for the AI"""
+def create_healthcare_system_prompt() -> str:
+    """Create a healthcare-focused system prompt for the AI (identical for every user and turn)"""
     
     base_prompt = """You are Carely, an AI wellness companion specifically designed for healthcare professionals. Your role is to provide emotional support, burnout prevention guidance, and wellness coaching.
 
@@ -130,31 +169,36 @@ Key Guidelines:
 - Encourage professional help when appropriate
 - Keep responses conversational and encouraging
 - Ask follow-up questions to better understand their situation
+- When WellMed course material is included, ground your advice in it and name the module so they can find it
 
 Your expertise areas:
 - Stress management and coping strategies
 - Work-life balance for healthcare workers
 - Burnout recognition and prevention
 - Self-care techniques and mindfulness
-- Emotional processing and support"""
-
-    if user_context:
-        context_addition = f"\n\nUser Context:"
-        if user_context.get('specialty'):
-            context_addition += f"\n- Medical Specialty: {user_context['specialty']}"
-        if user_context.get('recent_mood'):
-            context_addition += f"\n- Recent Mood: {user_context['recent_mood']}"
-        if user_context.get('burnout_risk'):
-            context_addition += f"\n- Burnout Risk Level: {user_context['burnout_risk']}"
-        if user_context.get('stress_level'):
-            context_addition += f"\n- Recent Stress Level: {user_context['stress_level']}/5"
-        
-        base_prompt += context_addition
+- Emotional processing and support
 
-    base_prompt += "\n\nRespond naturally and supportively. Keep responses under 150 words unless more detail is specifically requested."
+Respond naturally and supportively. Keep responses under 150 words unless more detail is specifically requested."""
     
     return base_prompt
 
+def format_user_context(user_context: Dict = None) -> str:
+    """Format the volatile per-user context that is appended to the newest user turn"""
+    if not user_context:
+        return ""
+    
+    context_addition = "User Context:"
+    if user_context.get('specialty'):
+        context_addition += f"\n- Medical Specialty: {user_context['specialty']}"
+    if user_context.get('recent_mood'):
+        context_addition += f"\n- Recent Mood: {user_context['recent_mood']}"
+    if user_context.get('burnout_risk'):
+        context_addition += f"\n- Burnout Risk Level: {user_context['burnout_risk']}"
+    if user_context.get('stress_level'):
+        context_addition += f"\n- Recent Stress Level: {user_context['stress_level']}/5"
+    
+    return context_addition if context_addition != "User Context:" else ""
+
 async def analyze_journal_entry(journal_text: str, user_context: Dict = None) -> str:
     """
     Analyze a journal entry and provide supportive insights
@@ -166,8 +210,26 @@ async def analyze_journal_entry(journal_text: str, user_context: Dict = None) ->
     Returns:
         str: Analysis and supportive response
     """
+    _, analysis = await try_analyze_journal_entry(journal_text, user_context)
+    return analysis
+
+async def try_analyze_journal_entry(
+    journal_text: str,
+    user_context: Dict = None,
+    priority: Priority = Priority.BACKGROUND,
+    user_id: str = None,
+    model: str = None
+) -> tuple[bool, str]:
+    """
+    Analyze a journal entry, reporting whether the model actually produced the analysis
+    
+    The model router picks the model when `model` is omitted.
+    
+    Returns:
+        tuple[bool, str]: (True, analysis) on success, (False, canned fallback) otherwise
+    """
     
-    system_prompt = f"""You are Carely, an AI wellness companion for healthcare professionals. 
+    system_prompt = """You are Carely, an AI wellness companion for healthcare professionals. 
 
 Analyze this journal entry with empathy and provide:
 1. Acknowledgment of their feelings
@@ -175,99 +237,68 @@ Analyze this journal entry with empathy and provide:
 3. Practical wellness suggestions
 4. Encouragement and support
 
-Keep your analysis supportive, non-judgmental, and under 200 words. Focus on their emotional wellbeing and provide actionable advice for healthcare worker burnout prevention.
-
-{f"User Context: {user_context}" if user_context else ""}"""
+Keep your analysis supportive, non-judgmental, and under 200 words. Focus on their emotional wellbeing and provide actionable advice for healthcare worker burnout prevention."""
 
-    # Try chat API first
+    # The system prompt is shared by every analysis; per-user context goes in the user turn
+    context_note = f"User Context: {user_context}\n\n" if user_context else ""
     messages = [
         {"role": "system", "content": system_prompt},
-        {"role": "user", "content": f"Please analyze this journal entry: {journal_text}"}
+        {"role": "user", "content": f"{context_note}Please analyze this journal entry: {journal_text}"}
     ]
     
-    success, response = await try_chat_api(messages)
-    if success:
-        return response
+    model = model or model_router.choose(JOURNAL_TASK, priority=priority)
     
-    # Fallback to generate API
-    prompt = f"{system_prompt}\n\nHuman: Please analyze this journal entry: {journal_text}\nAssistant: "
+    success, analysis = await inference_gateway.complete(messages, JOURNAL_TASK, model, priority=priority, user_id=user_id)
+    if not success:
+        return False, "Thank you for taking time to journal. Reflection is an important part of maintaining mental wellness in healthcare."
+    return True, analysis
+
+async def summarize_conversation(previous_summary: str, messages: List[Dict[str, str]]) -> tuple[bool, str]:
+    """
+    Fold older conversation turns into a compact rolling summary
     
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.8,
-            "top_p": 0.9,
-            "num_predict": 300
-        }
-    }
+    Runs at batch priority so it never delays interactive chat.
     
-    try:
-        async with httpx.AsyncClient(timeout=45.0) as client:
-            response = await client.post(
-                f"{OLLAMA_BASE_URL}/api/generate",
-                json=payload,
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-            response_data = response.json()
-            
-            if "response" in response_data:
-                return response_data["response"].strip()
-            else:
-                return "Thank you for sharing your thoughts. Your reflections are valuable for your wellbeing journey."
-                
-    except Exception as e:
-        print(f"Error analyzing journal entry: {e}")
-        return "Thank you for taking time to journal. Reflection is an important part of maintaining mental wellness in healthcare."
+    Returns:
+        tuple[bool, str]: (True, summary) on success, (False, "") otherwise
+    """
+    transcript = "\n".join(
+        f"{'Clinician' if msg['role'] == 'user' else 'Carely'}: {msg['content']}" for msg in messages
+    )
+    previous = f"Existing summary:\n{previous_summary}\n\n" if previous_summary else ""
+    summary_messages = [
+        {
+            "role": "system",
+            "content": "You summarize conversations between a healthcare professional and Carely, a wellness companion. "
+                       "Keep the main concerns, feelings, circumstances and advice already given. "
+                       "Write at most 120 words in the third person."
+        },
+        {"role": "user", "content": f"{previous}New conversation turns:\n{transcript}\n\nWrite the updated summary."}
+    ]
+    
+    # Batch priority so summaries never delay interactive chat
+    success, summary = await inference_gateway.complete(
+        summary_messages,
+        SUMMARY_TASK,
+        model_router.choose(SUMMARY_TASK),
+        priority=Priority.BATCH
+    )
+    return (True, summary) if success else (False, "")
 
 async def get_user_context_from_db(db: Session, user_id: str) -> Dict:
     """
     Gather user context from database for better AI responses
+
+    Reads the user's context snapshot (kept current when moods and
+    assessments are written) through a short-lived in-process cache.
     """
-    from app import crud
-    
     try:
-        # Get user info
-        user = db.query(models.User).filter(models.User.id == user_id).first()
-        context = {}
-        
-        if user:
-            context['specialty'] = user.specialty
-        
-        # Get recent mood
-        recent_moods = crud.get_user_moods(db, user_id)
-        if recent_moods:
-            context['recent_mood'] = recent_moods[0].mood
-        
-        # Get recent micro assessment
-        recent_micro = crud.get_all_micro_assessment(db, user_id)
-        if recent_micro:
-            latest_micro = recent_micro[0]
-            context['stress_level'] = latest_micro.stress_level
-            context['fatigue_level'] = latest_micro.fatigue_level
-        
-        # Get MBI burnout risk
-        recent_mbi = crud.get_mbi_assessments_by_user(db, user_id)
-        if recent_mbi:
-            latest_mbi = recent_mbi[0]
-            # Calculate simple burnout risk
-            ee_risk = "High" if latest_mbi.emotional_exhaustion > 27 else "Medium" if latest_mbi.emotional_exhaustion > 17 else "Low"
-            context['burnout_risk'] = ee_risk
-        
-        return context
-        
+        return user_context_cache.get(db, user_id)
     except Exception as e:
         print(f"Error getting user context: {e}")
         return {}
 
 # Test Ollama connection
 async def test_ollama_connection() -> bool:
-    """Test if Ollama is running and accessible"""
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{OLLAMA_BASE_URL}/api/tags")
-            return response.status_code == 200
-    except Exception:
-        return False
\ No newline at end of file
+    """Test if at least one Ollama backend is running and accessible"""
+    return await inference_gateway.backend.check_all()
\ No newline at end of file
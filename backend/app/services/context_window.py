@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Token budget for conversation history in one prompt (system prompt and reply not included)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Refresh the rolling summary once this many turns have fallen out of the window unsummarized
+SUMMARY_REFRESH_MESSAGES = int(os.getenv("SUMMARY_REFRESH_MESSAGES", "4"))
+
+# Per-message overhead for role markers and turn separators
+MESSAGE_OVERHEAD_TOKENS = 4
+# Marks where an oversized message was shortened
+TRUNCATION_MARKER = "\n[...]\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast local token estimate.
+
+    SentencePiece/BPE tokenizers average about 4 characters per token on English
+    prose; short words push that up, so take the larger of the two estimates.
+    """
+    if not text:
+        return 0
+    return max(len(text) // 4, int(len(text.split()) * 1.3)) + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Shorten `text` to about `max_tokens`, keeping its start and end.
+
+    A long message usually sets the scene at the start and asks its question
+    at the end, so the middle goes. Cuts fall on whitespace where possible.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    keep = len(text) * max_tokens // estimate_tokens(text)
+    while keep > 1:
+        head = text[:keep // 2]
+        tail = text[len(text) - keep // 2:]
+        head = head[:head.rfind(" ")] if " " in head else head
+        tail = tail[tail.find(" ") + 1:] if " " in tail else tail
+        shortened = head.rstrip() + TRUNCATION_MARKER + tail.lstrip()
+        if estimate_tokens(shortened) <= max_tokens:
+            return shortened
+        keep = int(keep * 0.9)
+    return ""
+
+
+def build_history_window(
+    messages: List[Dict[str, str]],
+    budget: int = HISTORY_TOKEN_BUDGET
+) -> Tuple[List[Dict[str, str]], int]:
+    """
+    Pick the newest messages that fit in `budget` tokens.
+
+    The newest message is always included, truncated if it alone is over
+    budget. Returns the window (oldest first) and the index of its first
+    message in `messages`, i.e. how many older messages were left out.
+    """
+    window = []
+    used = 0
+    for message in reversed(messages):
+        content = message["content"]
+        if not window:
+            content = truncate_to_tokens(content, max(1, budget - MESSAGE_OVERHEAD_TOKENS))
+        cost = estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        if window and used + cost > budget:
+            break
+        window.append({"role": message["role"], "content": content})
+        used += cost
+
+    window.reverse()
+    return window, len(messages) - len(window)
+
+
+def prepare_conversation_history(conversation, messages) -> Tuple[List[Dict[str, str]], Optional[str]]:
+    """
+    Build the prompt history for a conversation from its stored messages.
+
+    Returns the token-budgeted message window plus the conversation's rolling
+    summary when older turns were left out. If enough unsummarized turns have
+    fallen out of the window, a summary refresh covering all of them is
+    started in the background. Until then, the newest of those turns (fewer
+    than SUMMARY_REFRESH_MESSAGES, each shortened to a share of the budget)
+    are kept ahead of the window, so no turn is in neither the summary nor
+    the prompt.
+    """
+    history = [{"role": msg.role, "content": msg.content} for msg in messages]
+    window, first_index = build_history_window(history)
+    if first_index == 0:
+        return window, None
+
+    summarized = conversation.summary_message_count or 0
+    if first_index - summarized >= SUMMARY_REFRESH_MESSAGES:
+        schedule_summary_refresh(conversation.id, first_index)
+
+    carried_from = max(summarized, first_index - SUMMARY_REFRESH_MESSAGES + 1)
+    if carried_from < first_index:
+        share = max(1, HISTORY_TOKEN_BUDGET // SUMMARY_REFRESH_MESSAGES - MESSAGE_OVERHEAD_TOKENS)
+        carried = [
+            {"role": message["role"], "content": truncate_to_tokens(message["content"], share)}
+            for message in history[carried_from:first_index]
+        ]
+        window = carried + window
+
+    return window, conversation.summary
+
+
+# Conversations with a refresh running in this process. Other API workers
+# keep their own set, so two processes can summarize the same turns at once;
+# the database write only lands for the one that still extends the stored
+# summary, and the other's result is dropped.
+_refreshing: Set[str] = set()
+_summary_tasks: Set[asyncio.Task] = set()
+
+
+def schedule_summary_refresh(conversation_id, upto: int) -> None:
+    """Summarize messages up to index `upto` in the background (once per conversation per process)"""
+    key = str(conversation_id)
+    if key in _refreshing:
+        return
+
+    _refreshing.add(key)
+    task = asyncio.get_running_loop().create_task(refresh_conversation_summary(conversation_id, upto))
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
+
+
+async def refresh_conversation_summary(conversation_id, upto: int) -> None:
+    from app import crud
+    from app.database import SessionLocal
+    from app.services.chatbot import summarize_conversation
+
+    db = SessionLocal()
+    try:
+        conversation = crud.get_conversation(db, conversation_id)
+        if not conversation:
+            return
+
+        start = conversation.summary_message_count or 0
+        new_messages = crud.get_conversation_messages_range(db, conversation_id, start, upto - start)
+        if not new_messages:
+            return
+
+        success, summary = await summarize_conversation(
+            conversation.summary,
+            [{"role": msg.role, "content": msg.content} for msg in new_messages]
+        )
+        if not success or not summary:
+            metrics.incr("conversation_summary_failures_total")
+        elif crud.update_conversation_summary(db, conversation_id, summary, start + len(new_messages), summarized_from=start):
+            metrics.incr("conversation_summaries_total")
+        else:
+            metrics.incr("conversation_summary_races_lost_total")
+            logger.info(f"Summary of conversation {conversation_id} was refreshed elsewhere; dropping this one")
+    except Exception as e:
+        logger.warning(f"Error refreshing conversation summary: {e}")
+        metrics.incr("conversation_summary_failures_total")
+    finally:
+        db.close()
+        _refreshing.discard(str(conversation_id))
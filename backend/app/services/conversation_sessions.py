@@ -0,0 +1,75 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.services.metrics import metrics
+
+OLLAMA_CONTEXT_SESSIONS = int(os.getenv("OLLAMA_CONTEXT_SESSIONS", "1024"))
+OLLAMA_CONTEXT_MAX_TOKENS = int(os.getenv("OLLAMA_CONTEXT_MAX_TOKENS", "4096"))
+
+
+def _turn_digest(user_content: str, assistant_content: str) -> str:
+    material = f"{user_content}\x1f{assistant_content.strip()}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ConversationSessions:
+    """
+    Remember the `context` token array /api/generate returns for each conversation.
+
+    The array encodes the prompt and the reply Ollama already evaluated. If the
+    next turn continues exactly from that reply, only the new user message has
+    to be sent and evaluated.
+    """
+
+    def __init__(self, max_sessions: int = OLLAMA_CONTEXT_SESSIONS, max_tokens: int = OLLAMA_CONTEXT_MAX_TOKENS):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self._sessions: "OrderedDict[str, Tuple[str, List[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, conversation_id, message_history: List[Dict[str, str]]) -> Optional[List[int]]:
+        """Return the stored context if `message_history` is the stored turn plus one new user message"""
+        if conversation_id is None or len(message_history) < 3:
+            return None
+
+        previous_user, previous_reply = message_history[-3], message_history[-2]
+        if previous_user["role"] != "user" or previous_reply["role"] != "assistant":
+            return None
+
+        with self._lock:
+            entry = self._sessions.get(str(conversation_id))
+            if entry is not None:
+                self._sessions.move_to_end(str(conversation_id))
+
+        if entry and entry[0] == _turn_digest(previous_user["content"], previous_reply["content"]):
+            metrics.incr("ollama_context_reuse_hits_total")
+            return entry[1]
+
+        metrics.incr("ollama_context_reuse_misses_total")
+        return None
+
+    def store(self, conversation_id, user_content: str, reply: str, context: Optional[List[int]]) -> None:
+        if conversation_id is None:
+            return
+
+        key = str(conversation_id)
+        with self._lock:
+            if not context or len(context) > self.max_tokens:
+                # Too long to keep growing; the next turn rebuilds from the history window
+                self._sessions.pop(key, None)
+                return
+            self._sessions[key] = (_turn_digest(user_content, reply), context)
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions}
+
+
+conversation_sessions = ConversationSessions()
+metrics.register_collector("ollama_context_sessions", conversation_sessions.stats)
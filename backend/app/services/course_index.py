@@ -0,0 +1,339 @@
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import math
+import os
+import random
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Course, CourseModule, CourseChunk
+from app.services.inference_gateway import inference_gateway, OLLAMA_EMBED_MODEL
+from app.services.metrics import metrics
+
+# Vectors are searched as a float32 NumPy matrix when NumPy is installed; plain float32 arrays otherwise
+if importlib.util.find_spec("numpy") is not None:
+    import numpy as np
+else:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+RAG_ENABLED = os.getenv("RAG_ENABLED", "true").lower() == "true"
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+# Passages scoring below this cosine similarity are not worth the prompt space
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.55"))
+RAG_CHUNK_WORDS = int(os.getenv("RAG_CHUNK_WORDS", "120"))
+RAG_EMBED_BATCH = int(os.getenv("RAG_EMBED_BATCH", "16"))
+# The index is reloaded from course_chunks this often, to pick up an offline rebuild
+RAG_INDEX_REFRESH_SECONDS = float(os.getenv("RAG_INDEX_REFRESH_SECONDS", "600"))
+# IVF partitioning (needs NumPy): number of clusters, 0 for brute force, and how many are searched
+RAG_IVF_LISTS = int(os.getenv("RAG_IVF_LISTS", "0"))
+RAG_IVF_PROBES = int(os.getenv("RAG_IVF_PROBES", "4"))
+# Retrieval runs before every chat turn; past this many seconds the reply goes ahead without passages
+RAG_RETRIEVAL_TIMEOUT = float(os.getenv("RAG_RETRIEVAL_TIMEOUT", "0.3"))
+
+
+class Passage:
+    __slots__ = ("course_id", "course_title", "module_id", "module_title", "text", "score")
+
+    def __init__(self, course_id: str, course_title: str, module_id: str, module_title: str, text: str, score: float = 0.0):
+        self.course_id = course_id
+        self.course_title = course_title
+        self.module_id = module_id
+        self.module_title = module_title
+        self.text = text
+        self.score = score
+
+    def with_score(self, score: float) -> "Passage":
+        return Passage(self.course_id, self.course_title, self.module_id, self.module_title, self.text, score)
+
+
+def _normalize(vector: Sequence[float]) -> array:
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return array("f", (value / norm for value in vector))
+
+
+def module_text(module: CourseModule) -> str:
+    parts = [module.title, module.content]
+    if module.key_takeaways:
+        parts.append("Key takeaways:\n" + "\n".join(f"- {item}" for item in module.key_takeaways))
+    return "\n\n".join(part.strip() for part in parts if part)
+
+
+def module_fingerprint(module: CourseModule, embed_model: str = OLLAMA_EMBED_MODEL) -> str:
+    material = "\x1f".join([module_text(module), embed_model, str(RAG_CHUNK_WORDS)])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def chunk_text(text: str, max_words: int = RAG_CHUNK_WORDS) -> List[str]:
+    """
+    Split module text into passages of at most `max_words` words.
+
+    Paragraphs are packed whole where they fit, so a passage rarely stops
+    mid-thought; a paragraph longer than the limit is cut on word boundaries.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_words = 0
+
+    for paragraph in (p.strip() for p in text.split("\n\n")):
+        if not paragraph:
+            continue
+        words = paragraph.split()
+        if current and current_words + len(words) > max_words:
+            chunks.append("\n\n".join(current))
+            current, current_words = [], 0
+        if len(words) > max_words:
+            for start in range(0, len(words), max_words):
+                chunks.append(" ".join(words[start:start + max_words]))
+            continue
+        current.append(paragraph)
+        current_words += len(words)
+
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+async def build_course_index(db: Session, force: bool = False, embed_model: str = OLLAMA_EMBED_MODEL) -> Dict[str, int]:
+    """
+    Chunk and embed every course module into course_chunks.
+
+    Modules whose text (and the embedding model) have not changed since the
+    last build are skipped unless `force`. Chunks of deleted modules are removed.
+    """
+    counts = {"modules": 0, "embedded_modules": 0, "skipped_modules": 0, "chunks": 0, "removed_chunks": 0}
+    modules = db.query(CourseModule).order_by(CourseModule.course_id, CourseModule.sort_order).all()
+    existing = {
+        module_id: content_hash
+        for module_id, content_hash in db.query(CourseChunk.module_id, CourseChunk.content_hash).distinct()
+    }
+
+    for module in modules:
+        counts["modules"] += 1
+        fingerprint = module_fingerprint(module, embed_model)
+        if not force and existing.get(module.id) == fingerprint:
+            counts["skipped_modules"] += 1
+            continue
+
+        chunks = chunk_text(module_text(module))
+        vectors = []
+        for start in range(0, len(chunks), RAG_EMBED_BATCH):
+            batch = await inference_gateway.embed(chunks[start:start + RAG_EMBED_BATCH], embed_model)
+            if batch is None:
+                raise RuntimeError(f"Could not embed module {module.course_id}/{module.module_id}; is {embed_model} pulled?")
+            vectors.extend(batch)
+
+        db.query(CourseChunk).filter(CourseChunk.module_id == module.id).delete(synchronize_session=False)
+        for index, (text, vector) in enumerate(zip(chunks, vectors)):
+            normalized = _normalize(vector)
+            db.add(CourseChunk(
+                module_id=module.id,
+                course_id=module.course_id,
+                chunk_index=index,
+                text=text,
+                embedding=normalized.tobytes(),
+                dimensions=len(normalized),
+                embed_model=embed_model,
+                content_hash=fingerprint,
+            ))
+        db.commit()
+        counts["embedded_modules"] += 1
+        counts["chunks"] += len(chunks)
+        print(f"Indexed {module.course_id}/{module.module_id}: {len(chunks)} chunks")
+
+    module_ids = {module.id for module in modules}
+    orphaned = [module_id for module_id in existing if module_id not in module_ids]
+    if orphaned:
+        counts["removed_chunks"] = db.query(CourseChunk).filter(
+            CourseChunk.module_id.in_(orphaned)
+        ).delete(synchronize_session=False)
+        db.commit()
+    return counts
+
+
+class CourseIndex:
+    """
+    In-memory search over course_chunks.
+
+    Brute force is one matrix-vector product, which is plenty for the
+    course library. With RAG_IVF_LISTS set (and NumPy installed), chunks are
+    partitioned with k-means and only the RAG_IVF_PROBES nearest clusters
+    are scored.
+    """
+
+    def __init__(self):
+        self.passages: List[Passage] = []
+        self.vectors = None  # NumPy matrix or list of arrays, one row per passage
+        self.embed_model: Optional[str] = None
+        self.centroids = None
+        self.lists: List[List[int]] = []
+        self.loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self) -> int:
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(CourseChunk, CourseModule.module_id, CourseModule.title, Course.title)
+                .join(CourseModule, CourseChunk.module_id == CourseModule.id)
+                .join(Course, CourseChunk.course_id == Course.id)
+                .filter(Course.is_active.isnot(False))
+                .order_by(CourseChunk.course_id, CourseModule.sort_order, CourseChunk.chunk_index)
+                .all()
+            )
+        finally:
+            db.close()
+
+        passages, vectors = [], []
+        embed_model = rows[0][0].embed_model if rows else None
+        for chunk, module_slug, module_title, course_title in rows:
+            if chunk.embed_model != embed_model:
+                continue
+            passages.append(Passage(chunk.course_id, course_title, module_slug, module_title, chunk.text))
+            vector = array("f")
+            vector.frombytes(chunk.embedding)
+            vectors.append(vector)
+
+        with self._lock:
+            self.passages = passages
+            self.embed_model = embed_model
+            self.vectors = np.vstack([np.frombuffer(v, dtype=np.float32) for v in vectors]) if np is not None and vectors else vectors
+            self.centroids, self.lists = None, []
+            if np is not None and RAG_IVF_LISTS > 0 and len(passages) > RAG_IVF_LISTS * 4:
+                self._build_ivf(RAG_IVF_LISTS)
+            self.loaded_at = time.monotonic()
+        logger.info(f"Course index loaded: {len(passages)} passages (ivf_lists={len(self.lists)})")
+        return len(passages)
+
+    def _build_ivf(self, lists: int, iterations: int = 10) -> None:
+        """Plain k-means on unit vectors (spherical), seeded deterministically"""
+        rng = random.Random(0)
+        centroids = self.vectors[rng.sample(range(len(self.passages)), lists)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(self.vectors @ centroids.T, axis=1)
+            for cluster in range(lists):
+                members = self.vectors[assignment == cluster]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[cluster] = centroid / (np.linalg.norm(centroid) or 1.0)
+        assignment = np.argmax(self.vectors @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [np.flatnonzero(assignment == cluster).tolist() for cluster in range(lists)]
+
+    def is_stale(self) -> bool:
+        return not self.loaded_at or time.monotonic() - self.loaded_at > RAG_INDEX_REFRESH_SECONDS
+
+    def search(self, query: Sequence[float], k: int = RAG_TOP_K, min_score: float = RAG_MIN_SCORE) -> List[Passage]:
+        with self._lock:
+            if not self.passages:
+                return []
+            if np is not None:
+                vector = np.asarray(query, dtype=np.float32)
+                vector /= np.linalg.norm(vector) or 1.0
+                if self.vectors.shape[1] != len(vector):
+                    return []
+                if self.centroids is not None:
+                    probes = np.argsort(self.centroids @ vector)[::-1][:RAG_IVF_PROBES]
+                    candidates = [index for cluster in probes for index in self.lists[cluster]]
+                else:
+                    candidates = range(len(self.passages))
+                candidates = np.fromiter(candidates, dtype=np.int64)
+                scores = self.vectors[candidates] @ vector
+                top = np.argsort(scores)[::-1][:k]
+                ranked = [(int(candidates[i]), float(scores[i])) for i in top]
+            else:
+                vector = _normalize(query)
+                if len(self.vectors[0]) != len(vector):
+                    return []
+                scores = [sum(a * b for a, b in zip(row, vector)) for row in self.vectors]
+                ranked = sorted(enumerate(scores), key=lambda item: item[1], reverse=True)[:k]
+
+            return [self.passages[index].with_score(score) for index, score in ranked if score >= min_score]
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": RAG_ENABLED,
+            "passages": len(self.passages),
+            "embed_model": self.embed_model,
+            "ivf_lists": len(self.lists),
+            "numpy": np is not None,
+        }
+
+
+course_index = CourseIndex()
+metrics.register_collector("course_index", course_index.stats)
+
+
+_index_refresh: Optional[asyncio.Future] = None
+
+
+def _refresh_index() -> asyncio.Future:
+    """One index reload at a time; turns that time out waiting leave it running for the next"""
+    global _index_refresh
+    if _index_refresh is None or _index_refresh.done():
+        _index_refresh = asyncio.ensure_future(asyncio.to_thread(course_index.load))
+    return _index_refresh
+
+
+async def _search(query: str, k: int, query_vector=None, query_model: Optional[str] = None) -> List[Passage]:
+    if course_index.is_stale():
+        await asyncio.shield(_refresh_index())
+    if not course_index.passages:
+        return []
+    if query_vector is not None and query_model == course_index.embed_model:
+        metrics.incr("rag_query_embeddings_reused_total")
+        return course_index.search(query_vector, k)
+    vectors = await inference_gateway.embed([query], course_index.embed_model)
+    if not vectors:
+        return []
+    return course_index.search(vectors[0], k)
+
+
+async def retrieve_passages(
+    query: str,
+    k: int = RAG_TOP_K,
+    timeout: float = RAG_RETRIEVAL_TIMEOUT,
+    query_vector=None,
+    query_model: Optional[str] = None
+) -> List[Passage]:
+    """
+    Course passages most relevant to `query`; empty when RAG is off, unindexed or nothing is close.
+
+    Gives up after `timeout` seconds with no passages, so a slow or cold
+    embedding model delays the first token by at most that much. A
+    `query_vector` already computed by `query_model` is used instead of
+    embedding the query again when the index was built with that model.
+    """
+    if not RAG_ENABLED or not query.strip():
+        return []
+    try:
+        passages = await asyncio.wait_for(_search(query, k, query_vector, query_model), timeout)
+    except asyncio.TimeoutError:
+        metrics.incr("rag_retrieval_timeouts_total")
+        logger.info(f"Course retrieval took over {timeout}s; answering without course material")
+        return []
+    except Exception as e:
+        logger.warning(f"Course retrieval failed: {e}")
+        return []
+
+    metrics.incr("rag_retrievals_total")
+    metrics.incr("rag_passages_total", len(passages))
+    return passages
+
+
+def format_passages(passages: List[Passage]) -> str:
+    """Prompt section citing each passage's course and module so Carely can point users to it"""
+    if not passages:
+        return ""
+    lines = ["Relevant WellMed course material (suggest the module by name if it helps):"]
+    for passage in passages:
+        lines.append(f'[{passage.course_title} > {passage.module_title}]\n{passage.text}')
+    return "\n\n".join(lines)
@@ -0,0 +1,157 @@
+import importlib.util
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import httpx
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pool sizing for all calls to Ollama
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "20"))
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "10"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "30"))
+OLLAMA_POOL_TIMEOUT = float(os.getenv("OLLAMA_POOL_TIMEOUT", "10"))
+OLLAMA_HTTP2 = os.getenv("OLLAMA_HTTP2", "true").lower() in ("1", "true", "yes")
+
+
+class PooledHTTPClient:
+    """
+    One shared httpx.AsyncClient for every Ollama caller.
+
+    The client is created in the FastAPI startup hook and closed on shutdown.
+    Scripts that never run the app lifespan get a lazily created client.
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self.http2 = False
+        self._in_flight = 0
+        self._requests = 0
+        self._connections_opened = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # HTTP/2 needs the optional `h2` package (pip install httpx[http2])
+        self.http2 = OLLAMA_HTTP2 and importlib.util.find_spec("h2") is not None
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(60.0, pool=OLLAMA_POOL_TIMEOUT),
+            headers={"Content-Type": "application/json"},
+        )
+
+    async def start(self) -> None:
+        """Create the pooled client (called from the startup hook)"""
+        if self._client is None:
+            self._client = self._build_client()
+            logger.info(
+                f"Ollama HTTP pool started (max_connections={OLLAMA_MAX_CONNECTIONS}, "
+                f"keepalive={OLLAMA_MAX_KEEPALIVE_CONNECTIONS}, http2={self.http2})"
+            )
+
+    async def close(self) -> None:
+        """Close the pooled client (called from the shutdown hook)"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.info("Ollama HTTP pool closed")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = self._build_client()
+        return self._client
+
+    def _tracer(self):
+        """
+        Build an httpcore trace hook for one request.
+
+        The time until request headers start going out is the time spent
+        waiting for a usable connection (pool wait plus any TCP/TLS setup).
+        """
+        started = time.perf_counter()
+        state = {"acquired": False}
+
+        async def trace(event_name: str, info: Dict) -> None:
+            if event_name == "connection.connect_tcp.complete":
+                self._connections_opened += 1
+                metrics.incr("ollama_http_connections_opened_total")
+            elif not state["acquired"] and event_name.endswith("send_request_headers.started"):
+                state["acquired"] = True
+                waited = time.perf_counter() - started
+                self._waits += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+        return trace
+
+    def _extensions(self, kwargs: Dict) -> Dict:
+        extensions = dict(kwargs.pop("extensions", None) or {})
+        extensions["trace"] = self._tracer()
+        return extensions
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        extensions = self._extensions(kwargs)
+        self._in_flight += 1
+        self._requests += 1
+        try:
+            return await self.client.request(method, url, extensions=extensions, **kwargs)
+        finally:
+            self._in_flight -= 1
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """Streaming request; the connection is held until the block exits"""
+        extensions = self._extensions(kwargs)
+        self._in_flight += 1
+        self._requests += 1
+        try:
+            async with self.client.stream(method, url, extensions=extensions, **kwargs) as response:
+                yield response
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> Dict:
+        """Live pool statistics for the metrics endpoint"""
+        connections = []
+        if self._client is not None:
+            pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+
+        in_use = sum(1 for connection in connections if not connection.is_idle())
+        return {
+            "started": self._client is not None,
+            "http2": self.http2,
+            "max_connections": OLLAMA_MAX_CONNECTIONS,
+            "max_keepalive_connections": OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+            "keepalive_expiry_seconds": OLLAMA_KEEPALIVE_EXPIRY,
+            "connections_in_use": in_use,
+            "connections_idle": len(connections) - in_use,
+            "requests_in_flight": self._in_flight,
+            "requests_total": self._requests,
+            "connections_opened_total": self._connections_opened,
+            "wait_seconds_avg": round(self._wait_total / self._waits, 4) if self._waits else 0.0,
+            "wait_seconds_max": round(self._wait_max, 4),
+        }
+
+
+# Shared client used by every Ollama caller
+ollama_http = PooledHTTPClient()
+metrics.register_collector("ollama_http_pool", ollama_http.stats)
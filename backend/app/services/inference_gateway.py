@@ -0,0 +1,446 @@
+import importlib
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.services.conversation_sessions import conversation_sessions
+from app.services.llm_scheduler import llm_scheduler, Priority
+from app.services.llm_telemetry import record_llm_call
+from app.services.metrics import metrics
+from app.services.model_residency import model_residency
+from app.services.model_router import model_router, CHAT_TASK, QUICK_TASK, JOURNAL_TASK, SUMMARY_TASK
+from app.services.ollama_health import OllamaCapabilities, CircuitBreaker
+from app.services.ollama_pool import ollama_pool
+from app.services.single_flight import ollama_flight, request_key
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "gemma2:2b")
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+OLLAMA_EMBED_TIMEOUT = float(os.getenv("OLLAMA_EMBED_TIMEOUT", "15"))
+
+# "ollama" for the built-in backend pool, or "package.module:attribute" naming another backend object
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")
+
+UNAVAILABLE_RESPONSE = "I'm having trouble connecting. Please check if Ollama is running and try again."
+TIMEOUT_RESPONSE = "I'm taking longer to respond than usual. Please try again."
+ERROR_RESPONSE = "I'm experiencing technical difficulties. Please try again later."
+
+# Generate API prompts are flattened to Human/Assistant turns; stop before the model writes the next one
+GENERATE_STOP = ["Human:", "User:"]
+
+
+class ChatAPIMissing(Exception):
+    """The server has no /api/chat endpoint (an Ollama release older than the chat API)"""
+
+
+class CallConfig:
+    """
+    Timeout and generation options for one kind of call.
+
+    Each value can be overridden per kind, e.g. LLM_JOURNAL_TIMEOUT=90 or
+    LLM_CHAT_NUM_PREDICT=400.
+    """
+
+    def __init__(self, task: str, timeout: float, temperature: float, top_p: float, num_predict: int):
+        prefix = f"LLM_{task.upper()}_"
+        self.task = task
+        self.timeout = float(os.getenv(f"{prefix}TIMEOUT", str(timeout)))
+        self.options = {
+            "temperature": float(os.getenv(f"{prefix}TEMPERATURE", str(temperature))),
+            "top_p": float(os.getenv(f"{prefix}TOP_P", str(top_p))),
+            "num_predict": int(os.getenv(f"{prefix}NUM_PREDICT", str(num_predict))),
+        }
+
+    def as_dict(self) -> Dict:
+        return {"timeout": self.timeout, **self.options}
+
+
+CALL_CONFIGS = {
+    CHAT_TASK: CallConfig(CHAT_TASK, timeout=60, temperature=0.7, top_p=0.9, num_predict=800),
+    QUICK_TASK: CallConfig(QUICK_TASK, timeout=60, temperature=0.7, top_p=0.9, num_predict=800),
+    JOURNAL_TASK: CallConfig(JOURNAL_TASK, timeout=60, temperature=0.8, top_p=0.9, num_predict=300),
+    SUMMARY_TASK: CallConfig(SUMMARY_TASK, timeout=60, temperature=0.3, top_p=0.9, num_predict=200),
+}
+
+
+def load_backend(spec: str = LLM_BACKEND):
+    """
+    Resolve the inference backend.
+
+    A backend is any object with the OllamaBackendPool interface: get/post,
+    a stream() context manager, check_all() and has_model().
+    """
+    if spec == "ollama":
+        return ollama_pool
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def flatten_messages(messages: List[Dict[str, str]]) -> str:
+    """Render chat messages as a single Human/Assistant prompt for /api/generate"""
+    prompt = ""
+    if messages and messages[0]["role"] == "system":
+        prompt = messages[0]["content"] + "\n\n"
+        messages = messages[1:]
+    for message in messages:
+        role = "Human" if message["role"] == "user" else "Assistant"
+        prompt += f"{role}: {message['content']}\n"
+    return prompt + "Assistant: "
+
+
+class InferenceGateway:
+    """
+    The one path every LLM call takes.
+
+    Owns the backend, per-kind timeouts and generation options, the circuit
+    breaker, chat/generate API detection, request coalescing, scheduling and
+    telemetry. Callers build prompts and pick a task kind, model and priority.
+    """
+
+    def __init__(self, backend=None, default_model: str = OLLAMA_MODEL):
+        self.backend = backend or load_backend()
+        self.capabilities = OllamaCapabilities(default_model, backend=self.backend)
+        self.breaker = CircuitBreaker("ollama")
+
+    @staticmethod
+    def config(task: str) -> CallConfig:
+        return CALL_CONFIGS.get(task, CALL_CONFIGS[CHAT_TASK])
+
+    def record_result(self, status_code: int = None) -> None:
+        """Feed the circuit breaker: no response or a 5xx counts as a failure"""
+        if status_code is None or status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    @staticmethod
+    def record_missing_model(model: str, response: httpx.Response) -> bool:
+        """A 404 naming the model means it is not pulled (as opposed to the endpoint missing)"""
+        if "model" in response.text and "not found" in response.text:
+            model_router.mark_missing(model)
+            return True
+        return False
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        task: str,
+        model: str,
+        conversation_id=None
+    ) -> Tuple[bool, str]:
+        """
+        One non-streaming /api/chat call. Returns (True, reply) or (False, "").
+
+        Raises ChatAPIMissing when the server answers 404 or 405 for the
+        endpoint itself, as opposed to a model that is not pulled.
+        """
+        config = self.config(task)
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": False,
+            "options": dict(config.options),
+            "keep_alive": model_residency.keep_alive(model)
+        }
+
+        started = time.perf_counter()
+        try:
+            response = await self.backend.post(
+                "/api/chat",
+                conversation_id=conversation_id,
+                model=model,
+                json=payload,
+                timeout=config.timeout
+            )
+        except httpx.RequestError as e:
+            self.record_result(None)
+            record_llm_call("chat", model, started)
+            logger.warning(f"Chat API failed: {e}")
+            return False, ""
+
+        self.record_result(response.status_code)
+        try:
+            if response.status_code == 200:
+                response_data = response.json()
+                record_llm_call("chat", model, started, response, response_data)
+                if "message" in response_data and "content" in response_data["message"]:
+                    model_router.observe(model, task, time.perf_counter() - started)
+                    return True, response_data["message"]["content"].strip()
+            else:
+                record_llm_call("chat", model, started, response)
+                if response.status_code == 405 or (response.status_code == 404 and not self.record_missing_model(model, response)):
+                    # Endpoint missing: re-probe capabilities in the background
+                    self.capabilities.mark_stale()
+                    raise ChatAPIMissing()
+                logger.warning(f"Chat API returned HTTP {response.status_code}")
+        except ValueError as e:
+            logger.warning(f"Chat API returned invalid JSON: {e}")
+        return False, ""
+
+    async def generate(
+        self,
+        prompt: str,
+        task: str,
+        model: str,
+        conversation_id=None,
+        context: List[int] = None
+    ) -> Tuple[bool, str, Optional[List[int]]]:
+        """
+        One non-streaming /api/generate call.
+
+        Returns (True, reply, context) on success and (False, canned message,
+        None) otherwise. `context` continues from a previous call's context.
+        """
+        config = self.config(task)
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {**config.options, "stop": GENERATE_STOP},
+            "keep_alive": model_residency.keep_alive(model)
+        }
+        if context:
+            payload["context"] = context
+
+        started = time.perf_counter()
+        try:
+            response = await self.backend.post(
+                "/api/generate",
+                conversation_id=conversation_id,
+                model=model,
+                json=payload,
+                timeout=config.timeout
+            )
+        except httpx.TimeoutException:
+            self.record_result(None)
+            record_llm_call("generate", model, started)
+            return False, TIMEOUT_RESPONSE, None
+        except httpx.RequestError as e:
+            self.record_result(None)
+            record_llm_call("generate", model, started)
+            logger.warning(f"Network error occurred: {e}")
+            return False, UNAVAILABLE_RESPONSE, None
+
+        self.record_result(response.status_code)
+        if response.status_code != 200:
+            record_llm_call("generate", model, started, response)
+            if response.status_code == 404:
+                self.record_missing_model(model, response)
+            logger.warning(f"Generate API returned HTTP {response.status_code}")
+            return False, ERROR_RESPONSE, None
+
+        try:
+            response_data = response.json()
+        except ValueError as e:
+            logger.warning(f"Generate API returned invalid JSON: {e}")
+            return False, ERROR_RESPONSE, None
+        record_llm_call("generate", model, started, response, response_data)
+        if "response" not in response_data:
+            return False, ERROR_RESPONSE, None
+
+        model_router.observe(model, task, time.perf_counter() - started)
+        return True, response_data["response"].strip(), response_data.get("context")
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        task: str,
+        model: str,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id=None,
+        conversation_id=None,
+        message_history: List[Dict[str, str]] = None
+    ) -> Tuple[bool, str]:
+        """
+        Produce one reply: chat API, falling back to generate on older servers.
+
+        Generate is only tried when the server has no chat endpoint; a chat
+        call that timed out or failed returns the unavailable message rather
+        than spending a second full timeout on the same backend.
+
+        Holds a scheduler slot for the whole attempt, and identical concurrent
+        requests for the same conversation share one generation (so each
+        conversation's generate context is stored for it). With `conversation_id` and
+        `message_history`, the generate fallback continues from the context
+        Ollama returned last turn when the history still matches.
+
+        Returns (True, reply) or (False, canned message).
+        """
+        async def run() -> Tuple[bool, str]:
+            if not self.breaker.allow():
+                return False, UNAVAILABLE_RESPONSE
+
+            async with llm_scheduler.slot(priority, user_id):
+                # Go straight to the API this server supports
+                if await self.capabilities.supports_chat():
+                    try:
+                        success, reply = await self.chat(messages, task, model, conversation_id)
+                    except ChatAPIMissing:
+                        metrics.incr("chat_api_missing_fallbacks_total")
+                    else:
+                        return (True, reply) if success else (False, UNAVAILABLE_RESPONSE)
+
+                return await self._generate_turn(messages, task, model, conversation_id, message_history)
+
+        return await ollama_flight.do(request_key(task, model, messages, conversation_id), run)
+
+    async def _generate_turn(
+        self,
+        messages: List[Dict[str, str]],
+        task: str,
+        model: str,
+        conversation_id=None,
+        message_history: List[Dict[str, str]] = None
+    ) -> Tuple[bool, str]:
+        # The context is model-specific, so sessions are keyed by model too
+        session_key = f"{model}:{conversation_id}" if conversation_id and message_history else None
+        reuse_context = conversation_sessions.lookup(session_key, message_history or [])
+        if reuse_context:
+            prompt = f"\nHuman: {messages[-1]['content']}\nAssistant: "
+        else:
+            prompt = flatten_messages(messages)
+
+        success, reply, context = await self.generate(prompt, task, model, conversation_id, reuse_context)
+        if success and session_key:
+            conversation_sessions.store(session_key, message_history[-1]["content"], reply, context)
+        return success, reply
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        task: str,
+        model: str,
+        priority: Priority = Priority.INTERACTIVE,
+        user_id=None,
+        conversation_id=None
+    ) -> AsyncIterator[str]:
+        """Stream a chat reply fragment by fragment; raises if Ollama cannot produce one"""
+        config = self.config(task)
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+            "options": dict(config.options),
+            "keep_alive": model_residency.keep_alive(model)
+        }
+
+        if not self.breaker.allow():
+            raise RuntimeError("Ollama is unavailable (circuit breaker open)")
+
+        async with llm_scheduler.slot(priority, user_id):
+            started = time.perf_counter()
+            first_token_at = None
+            response = None
+            try:
+                async with self.backend.stream(
+                    "POST",
+                    "/api/chat",
+                    conversation_id=conversation_id,
+                    model=model,
+                    json=payload,
+                    timeout=config.timeout
+                ) as response:
+                    self.record_result(response.status_code)
+                    if response.status_code == 404:
+                        await response.aread()
+                        if not self.record_missing_model(model, response):
+                            self.capabilities.mark_stale()
+                    if response.status_code != 200:
+                        record_llm_call("chat", model, started, response)
+                    response.raise_for_status()
+
+                    # Ollama streams one JSON object per line
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        if "error" in chunk:
+                            record_llm_call("chat", model, started, response, status="stream_error")
+                            raise RuntimeError(f"Ollama stream error: {chunk['error']}")
+
+                        content = chunk.get("message", {}).get("content")
+                        if content:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                            yield content
+                        if chunk.get("done"):
+                            record_llm_call("chat", model, started, response, chunk, first_token_at or time.perf_counter())
+                            model_router.observe(model, task, time.perf_counter() - started)
+                            break
+            except httpx.RequestError:
+                self.record_result(None)
+                record_llm_call("chat", model, started, response)
+                raise
+
+    async def embed(self, texts: List[str], model: str = OLLAMA_EMBED_MODEL) -> Optional[List[List[float]]]:
+        """
+        Embedding vectors for `texts`, or None if Ollama cannot produce them.
+
+        Uses /api/embed (batched) and falls back to one /api/embeddings call
+        per text on servers that predate it. Embeddings are short and do not
+        take a generation slot.
+        """
+        if not texts or model_router.is_missing(model) or not self.breaker.allow():
+            return None
+
+        started = time.perf_counter()
+        try:
+            response = await self.backend.post(
+                "/api/embed",
+                model=model,
+                json={"model": model, "input": texts, "keep_alive": model_residency.keep_alive(model)},
+                timeout=OLLAMA_EMBED_TIMEOUT
+            )
+            self.record_result(response.status_code)
+            if response.status_code == 404 and self.record_missing_model(model, response):
+                record_llm_call("embed", model, started, response)
+                return None
+            if response.status_code == 404:
+                vectors = []
+                for text in texts:
+                    response = await self.backend.post(
+                        "/api/embeddings",
+                        model=model,
+                        json={"model": model, "prompt": text},
+                        timeout=OLLAMA_EMBED_TIMEOUT
+                    )
+                    self.record_result(response.status_code)
+                    if response.status_code != 200:
+                        break
+                    vectors.append(response.json().get("embedding"))
+                response_data = {"embeddings": vectors}
+            else:
+                response_data = response.json() if response.status_code == 200 else {}
+        except (httpx.RequestError, ValueError) as e:
+            self.record_result(None)
+            record_llm_call("embed", model, started)
+            logger.warning(f"Embedding failed: {e}")
+            return None
+
+        record_llm_call("embed", model, started, response, response_data)
+        vectors = response_data.get("embeddings")
+        if response.status_code != 200 or not vectors or len(vectors) != len(texts) or not all(vectors):
+            return None
+        return vectors
+
+    async def check_model(self, model: str) -> bool:
+        """Probe the backends and report whether any healthy one has `model`"""
+        await self.backend.check_all()
+        return self.backend.has_model(model)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": LLM_BACKEND,
+            "calls": {task: config.as_dict() for task, config in CALL_CONFIGS.items()},
+        }
+
+
+inference_gateway = InferenceGateway()
+metrics.register_collector("inference_gateway", inference_gateway.stats)
+metrics.register_collector("ollama_capabilities", inference_gateway.capabilities.stats)
+metrics.register_collector("ollama_breaker", inference_gateway.breaker.stats)
@@ -0,0 +1,386 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Job
+from app.services.llm_scheduler import Priority
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# A running job whose lock is older than this is assumed lost (worker crashed) and re-queued;
+# live workers renew their jobs' locks every third of it, however long the job runs
+JOB_LOCK_TIMEOUT = float(os.getenv("JOB_LOCK_TIMEOUT", "600"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "300"))
+JOB_DEFAULT_CONCURRENCY = int(os.getenv("JOB_DEFAULT_CONCURRENCY", "2"))
+
+JobFn = Callable[[Session, Dict], Awaitable[None]]
+GiveUpFn = Callable[[Session, Dict, str], Awaitable[None]]
+
+
+@dataclass
+class JobHandler:
+    fn: JobFn
+    concurrency: int
+    on_give_up: Optional[GiveUpFn] = None
+
+
+@dataclass
+class ClaimedJob:
+    id: str
+    job_type: str
+    payload: Dict
+    attempts: int
+    max_attempts: int
+
+
+_handlers: Dict[str, JobHandler] = {}
+_workers: List["JobWorker"] = []
+
+
+def register_job_handler(
+    job_type: str,
+    fn: JobFn,
+    concurrency: int = JOB_DEFAULT_CONCURRENCY,
+    on_give_up: GiveUpFn = None
+) -> None:
+    """
+    Register the coroutine that runs jobs of `job_type`.
+
+    `fn(db, payload)` gets its own session and should raise to have the job
+    retried. `on_give_up(db, payload, error)` runs once the last attempt failed.
+    Concurrency per worker process can be overridden with JOB_CONCURRENCY_<TYPE>.
+    """
+    concurrency = int(os.getenv(f"JOB_CONCURRENCY_{job_type.upper()}", concurrency))
+    _handlers[job_type] = JobHandler(fn=fn, concurrency=max(1, concurrency), on_give_up=on_give_up)
+
+
+def enqueue_job(
+    db: Session,
+    job_type: str,
+    payload: Dict,
+    priority: Priority = Priority.BACKGROUND,
+    max_attempts: int = 5,
+    run_after: datetime = None
+) -> Job:
+    """Persist a job; it survives API restarts and runs on whichever worker claims it first"""
+    job = Job(
+        job_type=job_type,
+        payload=payload,
+        priority=int(priority),
+        max_attempts=max_attempts,
+        run_after=run_after or datetime.utcnow()
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    metrics.incr("jobs_enqueued_total")
+
+    # Wake workers running in this process instead of waiting for their next poll
+    for worker in _workers:
+        worker.notify()
+    return job
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, so failed jobs don't retry in lockstep"""
+    delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * (2 ** max(0, attempts - 1)))
+    return random.uniform(delay / 2, delay)
+
+
+def claim_job(db: Session, job_type: str, worker_id: str) -> Optional[ClaimedJob]:
+    """
+    Atomically take the next due job of `job_type`.
+
+    FOR UPDATE SKIP LOCKED lets any number of workers poll the same table:
+    each one skips rows another worker is in the middle of claiming.
+    """
+    now = datetime.utcnow()
+    job = db.query(Job).filter(
+        Job.job_type == job_type,
+        Job.status == "queued",
+        Job.run_after <= now
+    ).order_by(Job.priority, Job.created_at).with_for_update(skip_locked=True).first()
+    if not job:
+        db.rollback()
+        return None
+
+    job.status = "running"
+    job.locked_by = worker_id
+    job.locked_at = now
+    job.attempts = (job.attempts or 0) + 1
+    claimed = ClaimedJob(
+        id=str(job.id),
+        job_type=job.job_type,
+        payload=dict(job.payload or {}),
+        attempts=job.attempts,
+        max_attempts=job.max_attempts
+    )
+    db.commit()
+    return claimed
+
+
+def requeue_stale_jobs(db: Session) -> List[ClaimedJob]:
+    """
+    Put jobs whose worker disappeared back in the queue.
+
+    Returns the ones that already used all their attempts; they are marked
+    failed and the caller runs their give-up hooks.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_LOCK_TIMEOUT)
+    stale = db.query(Job).filter(
+        Job.status == "running",
+        Job.locked_at < cutoff
+    ).with_for_update(skip_locked=True).all()
+
+    exhausted = []
+    for job in stale:
+        job.locked_by = None
+        job.locked_at = None
+        job.last_error = "Lock expired before the job finished"
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+            exhausted.append(ClaimedJob(str(job.id), job.job_type, dict(job.payload or {}), job.attempts, job.max_attempts))
+        else:
+            job.status = "queued"
+            job.run_after = datetime.utcnow()
+    db.commit()
+
+    if stale:
+        metrics.incr("jobs_lock_expired_total", len(stale))
+    return exhausted
+
+
+def renew_job_lock(job_id: str, worker_id: str) -> bool:
+    """Push a running job's lock forward; False once the job is no longer this worker's"""
+    db = SessionLocal()
+    try:
+        renewed = db.query(Job).filter(
+            Job.id == uuid.UUID(job_id),
+            Job.status == "running",
+            Job.locked_by == worker_id
+        ).update({Job.locked_at: datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        return renewed == 1
+    finally:
+        db.close()
+
+
+def _requeue_stale() -> List[ClaimedJob]:
+    db = SessionLocal()
+    try:
+        return requeue_stale_jobs(db)
+    finally:
+        db.close()
+
+
+def _finish_job(
+    job_id: str,
+    worker_id: str,
+    status: str,
+    error: str = None,
+    run_after: datetime = None,
+    attempts_delta: int = 0
+) -> bool:
+    """
+    Record the outcome of an attempt, if the job is still this worker's.
+
+    Returns False when the lock was reaped (and the job possibly claimed by
+    another worker) in the meantime; the result is then dropped, not written
+    over the new owner's.
+    """
+    db = SessionLocal()
+    try:
+        values = {
+            Job.status: status,
+            Job.locked_by: None,
+            Job.locked_at: None,
+            Job.attempts: Job.attempts + attempts_delta,
+        }
+        if error is not None:
+            values[Job.last_error] = error[:4000]
+        if run_after is not None:
+            values[Job.run_after] = run_after
+        if status in ("done", "failed"):
+            values[Job.finished_at] = datetime.utcnow()
+        finished = db.query(Job).filter(
+            Job.id == uuid.UUID(job_id),
+            Job.status == "running",
+            Job.locked_by == worker_id
+        ).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+    if finished != 1:
+        metrics.incr("jobs_lost_ownership_total")
+        logger.warning(f"Job {job_id} is no longer held by {worker_id}; dropping its {status} result")
+    return finished == 1
+
+
+class JobWorker:
+    """
+    Runs queued jobs for every registered job type.
+
+    Each job type gets `concurrency` consumer loops in this process, so slow
+    journal analysis cannot occupy the slots chat replies need. Start it inside
+    the API (RUN_JOB_WORKER_IN_API) or as its own process with `python -m app.worker`.
+    """
+
+    def __init__(self, poll_interval: float = JOB_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running: Dict[str, int] = {}
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        for job_type, handler in _handlers.items():
+            self._wakeups[job_type] = asyncio.Event()
+            self._running[job_type] = 0
+            for _ in range(handler.concurrency):
+                self._tasks.append(self._loop.create_task(self._consume(job_type, handler)))
+        self._tasks.append(self._loop.create_task(self._reap_stale()))
+        _workers.append(self)
+        logger.info(f"Job worker {self.worker_id} started for: {', '.join(_handlers) or 'no job types'}")
+
+    async def stop(self) -> None:
+        if self in _workers:
+            _workers.remove(self)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        if self._loop is None or self._loop.is_closed():
+            return
+        for event in self._wakeups.values():
+            self._loop.call_soon_threadsafe(event.set)
+
+    async def _consume(self, job_type: str, handler: JobHandler) -> None:
+        wakeup = self._wakeups[job_type]
+        while True:
+            wakeup.clear()
+            try:
+                job = await asyncio.to_thread(self._claim, job_type)
+            except SQLAlchemyError as e:
+                logger.warning(f"Error claiming {job_type} job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job, handler)
+            except SQLAlchemyError as e:
+                # The lock expires and the job is re-queued by _reap_stale
+                logger.warning(f"Error recording result of job {job.id}: {e}")
+
+    def _claim(self, job_type: str) -> Optional[ClaimedJob]:
+        db = SessionLocal()
+        try:
+            return claim_job(db, job_type, self.worker_id)
+        finally:
+            db.close()
+
+    async def _finish(self, job: ClaimedJob, status: str, **changes) -> bool:
+        return await asyncio.to_thread(_finish_job, job.id, self.worker_id, status, **changes)
+
+    async def _run(self, job: ClaimedJob, handler: JobHandler) -> None:
+        self._running[job.job_type] += 1
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        db = SessionLocal()
+        try:
+            await handler.fn(db, job.payload)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back without spending an attempt
+            db.close()
+            await self._finish(job, "queued", run_after=datetime.utcnow(), attempts_delta=-1)
+            raise
+        except Exception as e:
+            db.rollback()
+            error = f"{type(e).__name__}: {e}"
+            logger.exception(f"Job {job.id} ({job.job_type}) attempt {job.attempts}/{job.max_attempts} failed: {error}")
+
+            if job.attempts < job.max_attempts:
+                delay = retry_delay(job.attempts)
+                if await self._finish(job, "queued", error=error, run_after=datetime.utcnow() + timedelta(seconds=delay)):
+                    metrics.incr("jobs_retried_total")
+            elif await self._finish(job, "failed", error=error):
+                metrics.incr(f"jobs_failed_total_{job.job_type}")
+                await self._give_up(job, handler, error)
+        else:
+            if await self._finish(job, "done"):
+                metrics.incr(f"jobs_done_total_{job.job_type}")
+        finally:
+            heartbeat.cancel()
+            db.close()
+            self._running[job.job_type] -= 1
+
+    async def _heartbeat(self, job: ClaimedJob) -> None:
+        """Keep renewing the lock of a running job, so a long one (a long recording) is not re-queued"""
+        while True:
+            await asyncio.sleep(JOB_LOCK_TIMEOUT / 3)
+            try:
+                if not await asyncio.to_thread(renew_job_lock, job.id, self.worker_id):
+                    return
+            except SQLAlchemyError as e:
+                logger.warning(f"Error renewing lock of job {job.id}: {e}")
+
+    async def _give_up(self, job: ClaimedJob, handler: JobHandler, error: str) -> None:
+        if handler.on_give_up is None:
+            return
+        db = SessionLocal()
+        try:
+            await handler.on_give_up(db, job.payload, error)
+        except Exception as e:
+            logger.warning(f"Error in give-up hook for job {job.id} ({job.job_type}): {e}")
+        finally:
+            db.close()
+
+    async def _reap_stale(self) -> None:
+        while True:
+            await asyncio.sleep(max(self.poll_interval, JOB_LOCK_TIMEOUT / 10))
+            try:
+                exhausted = await asyncio.to_thread(_requeue_stale)
+            except SQLAlchemyError as e:
+                logger.warning(f"Error re-queueing stale jobs: {e}")
+                exhausted = []
+
+            for job in exhausted:
+                handler = _handlers.get(job.job_type)
+                if handler:
+                    await self._give_up(job, handler, "Lock expired before the job finished")
+
+    def stats(self) -> Dict:
+        return {
+            "worker_id": self.worker_id,
+            "started": bool(self._tasks),
+            **{f"running_{job_type}": count for job_type, count in self._running.items()},
+        }
+
+
+job_worker = JobWorker()
+metrics.register_collector("job_worker", job_worker.stats)
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Deque, Dict, Optional
+
+from app.services.metrics import metrics
+
+# Match Ollama's OLLAMA_NUM_PARALLEL so we never queue inside Ollama itself
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+# This process's share of those slots. Every process that calls Ollama (the API, each
+# job worker) has its own scheduler, so when there are several, give each a share and
+# keep the shares summing to OLLAMA_NUM_PARALLEL. Priorities only order calls within a
+# process: the API's share is what keeps interactive chat from waiting on worker jobs.
+LLM_SCHEDULER_SLOTS = int(os.getenv("LLM_SCHEDULER_SLOTS", str(OLLAMA_NUM_PARALLEL)))
+
+# Seconds the current task waited for its slot, for per-call telemetry
+queue_wait: ContextVar[float] = ContextVar("llm_queue_wait", default=0.0)
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # chat turns a user is waiting on
+    BACKGROUND = 1   # journal analysis triggered by a user action
+    BATCH = 2        # bulk jobs (re-analysis, summaries)
+
+
+class LLMScheduler:
+    """
+    Bounded-concurrency gate in front of every Ollama generation.
+
+    Waiters are served strictly by priority class. Inside a class, users are
+    served round-robin so one user submitting many jobs cannot starve others.
+    """
+
+    def __init__(self, max_in_flight: int = LLM_SCHEDULER_SLOTS):
+        self.max_in_flight = max(1, max_in_flight)
+        self._in_flight = 0
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[asyncio.Future]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._wait_stats = {
+            priority: {"count": 0, "total": 0.0, "max": 0.0} for priority in Priority
+        }
+
+    def queue_depth(self, priority: Priority) -> int:
+        return sum(
+            1
+            for waiters in self._queues[priority].values()
+            for future in waiters
+            if not future.done()
+        )
+
+    def _has_waiters(self) -> bool:
+        return any(self._queues[priority] for priority in Priority)
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        for priority in Priority:
+            users = self._queues[priority]
+            while users:
+                user_key, waiters = users.popitem(last=False)
+                future = waiters.popleft()
+                if waiters:
+                    # Re-queue the user at the back for round-robin fairness
+                    users[user_key] = waiters
+                if not future.done():
+                    return future
+        return None
+
+    def _dispatch(self) -> None:
+        while self._in_flight < self.max_in_flight:
+            future = self._next_waiter()
+            if future is None:
+                return
+            self._in_flight += 1
+            future.set_result(None)
+
+    def _record_wait(self, priority: Priority, waited: float) -> None:
+        queue_wait.set(waited)
+        stats = self._wait_stats[priority]
+        stats["count"] += 1
+        stats["total"] += waited
+        stats["max"] = max(stats["max"], waited)
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE, user_id=None) -> None:
+        started = time.perf_counter()
+
+        if self._in_flight < self.max_in_flight and not self._has_waiters():
+            self._in_flight += 1
+            self._record_wait(priority, 0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        user_key = str(user_id) if user_id is not None else "anonymous"
+        self._queues[priority].setdefault(user_key, deque()).append(future)
+        metrics.incr(f"llm_scheduler_queued_total_{priority.name.lower()}")
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before cancellation; give it back
+                self.release()
+            else:
+                self._discard(priority, user_key, future)
+            raise
+
+        self._record_wait(priority, time.perf_counter() - started)
+
+    def _discard(self, priority: Priority, user_key: str, future: asyncio.Future) -> None:
+        waiters = self._queues[priority].get(user_key)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(future)
+        except ValueError:
+            pass
+        if not waiters:
+            del self._queues[priority][user_key]
+
+    def release(self) -> None:
+        self._in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.INTERACTIVE, user_id=None):
+        """Hold one generation slot for the duration of the block"""
+        await self.acquire(priority, user_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict:
+        data = {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+        }
+        for priority in Priority:
+            name = priority.name.lower()
+            wait = self._wait_stats[priority]
+            data[f"queue_depth_{name}"] = self.queue_depth(priority)
+            data[f"wait_seconds_avg_{name}"] = round(wait["total"] / wait["count"], 4) if wait["count"] else 0.0
+            data[f"wait_seconds_max_{name}"] = round(wait["max"], 4)
+        return data
+
+
+llm_scheduler = LLMScheduler()
+metrics.register_collector("llm_scheduler", llm_scheduler.stats)
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import httpx
+
+from app.database import SessionLocal
+from app.models import LLMCall
+from app.services.llm_scheduler import queue_wait
+from app.services.metrics import metrics
+from app.services.model_residency import model_residency
+
+logger = logging.getLogger(__name__)
+
+LLM_LEDGER_ENABLED = os.getenv("LLM_LEDGER_ENABLED", "true").lower() == "true"
+LLM_LEDGER_FLUSH_SECONDS = float(os.getenv("LLM_LEDGER_FLUSH_SECONDS", "5"))
+# Rows kept in memory while the database is unreachable; the oldest are dropped beyond this
+LLM_LEDGER_MAX_BUFFER = int(os.getenv("LLM_LEDGER_MAX_BUFFER", "5000"))
+
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 250)
+TOKEN_COUNT_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+def backend_of(response: Optional[httpx.Response]) -> Optional[str]:
+    """Ollama server that answered, taken from the request the pool sent"""
+    if response is None:
+        return None
+    url = response.request.url
+    return f"{url.scheme}://{url.netloc.decode()}"
+
+
+def _seconds(nanoseconds) -> Optional[float]:
+    return nanoseconds / 1e9 if nanoseconds is not None else None
+
+
+class LLMCallLedger:
+    """
+    Buffer per-call rows and write them to llm_calls in batches.
+
+    Recording happens on the request path, so it only appends to a deque; a
+    background task flushes every LLM_LEDGER_FLUSH_SECONDS.
+    """
+
+    def __init__(self):
+        self._rows: Deque[Dict] = deque(maxlen=LLM_LEDGER_MAX_BUFFER)
+        self._task: Optional[asyncio.Task] = None
+        self.written_total = 0
+
+    def add(self, row: Dict) -> None:
+        if LLM_LEDGER_ENABLED:
+            if len(self._rows) == self._rows.maxlen:
+                metrics.incr("llm_ledger_dropped_total")
+            self._rows.append(row)
+
+    def flush(self) -> int:
+        if not self._rows:
+            return 0
+        rows = list(self._rows)
+        self._rows.clear()
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(LLMCall, rows)
+            db.commit()
+            self.written_total += len(rows)
+            return len(rows)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not write {len(rows)} LLM ledger rows: {e}")
+            # Put them back for the next flush; the deque bound drops the oldest if this keeps failing
+            self._rows.extendleft(reversed(rows))
+            return 0
+        finally:
+            db.close()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(LLM_LEDGER_FLUSH_SECONDS)
+            await asyncio.to_thread(self.flush)
+
+    async def start(self) -> None:
+        if self._task is None and LLM_LEDGER_ENABLED:
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": LLM_LEDGER_ENABLED,
+            "buffered": len(self._rows),
+            "written_total": self.written_total,
+        }
+
+
+llm_ledger = LLMCallLedger()
+metrics.register_collector("llm_ledger", llm_ledger.stats)
+
+
+def record_llm_call(
+    endpoint: str,
+    model: str,
+    started: float,
+    response: Optional[httpx.Response] = None,
+    response_data: Dict = None,
+    first_token_at: float = None,
+    status=None
+) -> None:
+    """
+    Record one Ollama call in the histograms and the ledger.
+
+    `started` is the perf_counter() value taken just before the request.
+    Streaming calls pass the perf_counter() of the first token; for
+    non-streaming calls TTFT is Ollama's own load + prompt eval time, which
+    is what the user would have waited for the first token.
+    """
+    response_data = response_data or {}
+    total = time.perf_counter() - started
+    load = _seconds(response_data.get("load_duration"))
+    prompt_eval = _seconds(response_data.get("prompt_eval_duration"))
+    eval_time = _seconds(response_data.get("eval_duration"))
+    prompt_tokens = response_data.get("prompt_eval_count")
+    eval_tokens = response_data.get("eval_count")
+    waited = queue_wait.get()
+
+    if first_token_at is not None:
+        ttft = first_token_at - started
+    elif load is not None or prompt_eval is not None:
+        ttft = (load or 0.0) + (prompt_eval or 0.0)
+    else:
+        ttft = None
+
+    if status is None:
+        status = response.status_code if response is not None else "error"
+    backend = backend_of(response)
+    labels = {"endpoint": endpoint, "model": model or "", "backend": backend or ""}
+
+    metrics.incr(f"ollama_{endpoint}_calls_total")
+    metrics.observe("llm_total_seconds", total, labels)
+    metrics.observe("llm_queue_wait_seconds", waited, labels)
+    if status == 200:
+        if ttft is not None:
+            metrics.observe("llm_ttft_seconds", ttft, labels)
+        if load is not None:
+            metrics.observe("llm_load_seconds", load, labels)
+            model_residency.record_load(model, load)
+        if prompt_eval is not None:
+            metrics.observe("llm_prompt_eval_seconds", prompt_eval, labels)
+        if eval_time and eval_tokens:
+            metrics.observe("llm_tokens_per_second", eval_tokens / eval_time, labels, TOKEN_RATE_BUCKETS)
+        if prompt_tokens is not None:
+            metrics.incr(f"ollama_{endpoint}_prompt_eval_tokens_total", prompt_tokens)
+            metrics.observe("llm_prompt_tokens", prompt_tokens, labels, TOKEN_COUNT_BUCKETS)
+        if eval_tokens is not None:
+            metrics.incr(f"ollama_{endpoint}_eval_tokens_total", eval_tokens)
+    else:
+        metrics.incr(f"ollama_{endpoint}_errors_total")
+
+    logger.info(
+        f"Ollama /api/{endpoint} {model} on {backend}: status={status}, queue_wait={waited:.2f}s, "
+        f"ttft={ttft or 0:.2f}s, total={total:.2f}s, prompt_eval_count={prompt_tokens}, eval_count={eval_tokens}"
+    )
+    llm_ledger.add({
+        "endpoint": endpoint,
+        "model": model,
+        "backend": backend,
+        "streamed": first_token_at is not None,
+        "status": str(status),
+        "queue_wait_ms": round(waited * 1000, 1),
+        "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+        "total_ms": round(total * 1000, 1),
+        "load_ms": round(load * 1000, 1) if load is not None else None,
+        "prompt_eval_ms": round(prompt_eval * 1000, 1) if prompt_eval is not None else None,
+        "eval_ms": round(eval_time * 1000, 1) if eval_time is not None else None,
+        "prompt_tokens": prompt_tokens,
+        "eval_tokens": eval_tokens,
+    })
@@ -0,0 +1,137 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds, from a cached prompt to a cold model load on CPU
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelSet:
+    return tuple(sorted((key, str(value)) for key, value in (labels or {}).items()))
+
+
+def _format_labels(labels: LabelSet, extra: Dict[str, str] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    body = ",".join(f'{key}="{value}"' for key, value in pairs)
+    return "{" + body + "}"
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+class MetricsRegistry:
+    """Small in-process metrics registry for the AI services"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._histograms: Dict[str, Dict[LabelSet, Histogram]] = defaultdict(dict)
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Increment a named counter"""
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def observe(self, name: str, value: float, labels: Dict[str, str] = None, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        """Add a sample to a labelled histogram"""
+        key = _label_key(labels)
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def register_collector(self, name: str, collector: Callable[[], Dict]) -> None:
+        """Register a callable that returns a dict of live values (gauges, pool stats, ...)"""
+        self._collectors[name] = collector
+
+    def snapshot(self) -> Dict:
+        """Return all counters, histogram summaries and the output of every registered collector"""
+        with self._lock:
+            data = {"counters": dict(self._counters), "histograms": {}}
+            for name, series in self._histograms.items():
+                data["histograms"][name] = [
+                    {
+                        "labels": dict(labels),
+                        "count": histogram.count,
+                        "avg": round(histogram.sum / histogram.count, 4) if histogram.count else 0.0,
+                        "p50": round(histogram.quantile(0.5), 4),
+                        "p95": round(histogram.quantile(0.95), 4),
+                        "p99": round(histogram.quantile(0.99), 4),
+                    }
+                    for labels, histogram in series.items()
+                ]
+
+        for name, collector in self._collectors.items():
+            try:
+                data[name] = collector()
+            except Exception as e:
+                data[name] = {"error": str(e)}
+
+        return data
+
+    def render_prometheus(self) -> str:
+        """Counters and histograms in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                metric = _metric_name(name)
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+
+            for name, series in sorted(self._histograms.items()):
+                metric = _metric_name(name)
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{_format_labels(labels, {'le': str(bound)})} {cumulative}")
+                    lines.append(f"{metric}_bucket{_format_labels(labels, {'le': '+Inf'})} {histogram.count}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
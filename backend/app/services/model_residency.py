@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from app.services.http_client import ollama_http
+from app.services.metrics import metrics
+from app.services.model_router import model_router
+from app.services.ollama_pool import ollama_pool
+
+logger = logging.getLogger(__name__)
+
+RESIDENCY_ENABLED = os.getenv("RESIDENCY_ENABLED", "true").lower() == "true"
+# How long Ollama keeps each model loaded after a request (Ollama duration strings, or -1 for forever)
+OLLAMA_KEEP_ALIVE_SMALL = os.getenv("OLLAMA_KEEP_ALIVE_SMALL", "30m")
+OLLAMA_KEEP_ALIVE_LARGE = os.getenv("OLLAMA_KEEP_ALIVE_LARGE", "15m")
+# Local clinical hours, e.g. "6-22", during which models are kept warm; empty means always
+RESIDENCY_WARM_HOURS = os.getenv("RESIDENCY_WARM_HOURS", "")
+# Keep-warm ping period; must stay below the keep_alive values to have any effect
+RESIDENCY_PING_INTERVAL = float(os.getenv("RESIDENCY_PING_INTERVAL", "240"))
+# Outside warm hours the large model is unloaded and only kept this long after each use
+RESIDENCY_UNLOAD_LARGE_OFF_HOURS = os.getenv("RESIDENCY_UNLOAD_LARGE_OFF_HOURS", "true").lower() == "true"
+RESIDENCY_OFF_HOURS_KEEP_ALIVE = os.getenv("RESIDENCY_OFF_HOURS_KEEP_ALIVE", "2m")
+# A load_duration above this means the request found the model unloaded
+RESIDENCY_COLD_LOAD_SECONDS = float(os.getenv("RESIDENCY_COLD_LOAD_SECONDS", "1.0"))
+RESIDENCY_WARMUP_TIMEOUT = float(os.getenv("RESIDENCY_WARMUP_TIMEOUT", "300"))
+
+
+def _parse_hours(spec: str) -> Optional[Tuple[int, int]]:
+    if not spec.strip():
+        return None
+    start, end = spec.split("-")
+    return int(start) % 24, int(end) % 24
+
+
+class ModelResidency:
+    """
+    Keep the models Ollama serves loaded when clinicians need them.
+
+    At startup every model is loaded on every backend with an empty
+    generation. During warm hours each model is pinged before its keep_alive
+    runs out; outside them the large model is unloaded and, when it is used
+    anyway, given a short keep_alive. Requests carry the per-model keep_alive
+    so Ollama's own idle timer agrees with this schedule.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._large_unloaded = False
+        self.cold_starts: Dict[str, int] = defaultdict(int)
+        self.warmups: Dict[str, int] = defaultdict(int)
+        self.warmup_failures: Dict[str, int] = defaultdict(int)
+        self.unloads: Dict[str, int] = defaultdict(int)
+        self.last_warm_seconds: Dict[str, float] = {}
+        self.resident: Dict[str, List[str]] = {}
+
+    def models(self) -> List[str]:
+        return list(dict.fromkeys([model_router.small_model, model_router.large_model]))
+
+    def in_warm_hours(self, now: datetime = None) -> bool:
+        hours = _parse_hours(RESIDENCY_WARM_HOURS)
+        if hours is None:
+            return True
+        start, end = hours
+        hour = (now or datetime.now()).hour
+        return start <= hour < end if start < end else hour >= start or hour < end
+
+    def keep_alive(self, model: str) -> str:
+        """keep_alive to send with a request for `model`"""
+        if model == model_router.large_model and model != model_router.small_model:
+            if RESIDENCY_UNLOAD_LARGE_OFF_HOURS and not self.in_warm_hours():
+                return RESIDENCY_OFF_HOURS_KEEP_ALIVE
+            return OLLAMA_KEEP_ALIVE_LARGE
+        return OLLAMA_KEEP_ALIVE_SMALL
+
+    def record_load(self, model: str, load_seconds: Optional[float]) -> None:
+        """Called for every completed generation with Ollama's load_duration"""
+        if load_seconds is not None and load_seconds >= RESIDENCY_COLD_LOAD_SECONDS:
+            self.cold_starts[model] += 1
+            metrics.incr("llm_cold_starts_total")
+            logger.info(f"Cold start: {model} took {load_seconds:.1f}s to load")
+
+    async def _load(self, url: str, model: str, keep_alive) -> Optional[float]:
+        """Empty generation: loads (or with keep_alive 0 unloads) the model without generating"""
+        started = time.perf_counter()
+        response = await ollama_http.post(
+            f"{url}/api/generate",
+            json={"model": model, "prompt": "", "stream": False, "keep_alive": keep_alive},
+            timeout=RESIDENCY_WARMUP_TIMEOUT
+        )
+        response.raise_for_status()
+        return time.perf_counter() - started
+
+    async def warm(self, model: str) -> int:
+        """Load `model` on every backend that has it; returns how many succeeded"""
+        warmed = 0
+        for backend in ollama_pool.backends:
+            if not backend.available or not backend.has_model(model):
+                continue
+            try:
+                elapsed = await self._load(backend.url, model, self.keep_alive(model))
+                self.warmups[model] += 1
+                self.last_warm_seconds[model] = round(elapsed, 2)
+                warmed += 1
+            except httpx.HTTPError as e:
+                self.warmup_failures[model] += 1
+                logger.warning(f"Could not warm {model} on {backend.url}: {e}")
+        return warmed
+
+    async def unload(self, model: str) -> None:
+        for backend in ollama_pool.backends:
+            if not backend.available:
+                continue
+            try:
+                await self._load(backend.url, model, 0)
+                self.unloads[model] += 1
+            except httpx.HTTPError as e:
+                logger.warning(f"Could not unload {model} on {backend.url}: {e}")
+        logger.info(f"Unloaded {model} for off hours")
+
+    async def refresh_resident(self) -> None:
+        """Record which models each backend has loaded, from /api/ps"""
+        for backend in ollama_pool.backends:
+            try:
+                response = await ollama_http.get(f"{backend.url}/api/ps", timeout=10.0)
+                if response.status_code == 200:
+                    self.resident[backend.url] = [m.get("name", "") for m in response.json().get("models", [])]
+            except (httpx.HTTPError, ValueError):
+                self.resident.pop(backend.url, None)
+
+    async def tick(self, startup: bool = False) -> None:
+        """
+        One pass of the schedule.
+
+        In warm hours every model is pinged. Outside them nothing is pinged
+        (startup still loads what may stay loaded) and the large model is
+        unloaded once.
+        """
+        large = model_router.large_model
+        off_hours = not self.in_warm_hours()
+        unload_large = RESIDENCY_UNLOAD_LARGE_OFF_HOURS and large != model_router.small_model and off_hours
+
+        for model in self.models():
+            if off_hours and not startup:
+                continue
+            if model == large and unload_large:
+                continue
+            await self.warm(model)
+
+        if unload_large and not self._large_unloaded:
+            await self.unload(large)
+            self._large_unloaded = True
+        elif not unload_large:
+            self._large_unloaded = False
+
+        await self.refresh_resident()
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(RESIDENCY_PING_INTERVAL)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.warning(f"Model residency pass failed: {e}")
+
+    async def start(self) -> None:
+        """Warm up in the background so startup is not held up by model loads"""
+        if self._task is None and RESIDENCY_ENABLED:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            await self.tick(startup=True)
+            logger.info(f"Model warm-up done: {dict(self.last_warm_seconds)}")
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {e}")
+        await self._loop()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "warm_hours": RESIDENCY_WARM_HOURS or "always",
+            "in_warm_hours": self.in_warm_hours(),
+            "keep_alive": {model: self.keep_alive(model) for model in self.models()},
+            "cold_starts": dict(self.cold_starts),
+            "warmups": dict(self.warmups),
+            "warmup_failures": dict(self.warmup_failures),
+            "unloads": dict(self.unloads),
+            "last_warm_seconds": dict(self.last_warm_seconds),
+            "resident": dict(self.resident),
+        }
+
+
+model_residency = ModelResidency()
+metrics.register_collector("model_residency", model_residency.stats)
@@ -0,0 +1,124 @@
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.services.context_window import estimate_tokens
+from app.services.llm_scheduler import llm_scheduler, Priority
+from app.services.metrics import metrics
+
+OLLAMA_SMALL_MODEL = os.getenv("OLLAMA_SMALL_MODEL", os.getenv("OLLAMA_MODEL", "gemma2:2b"))
+OLLAMA_LARGE_MODEL = os.getenv("OLLAMA_LARGE_MODEL", "gemma3:12b")
+
+# Conversations with at least this much prompt history go to the large model
+ROUTER_LONG_CHAT_TOKENS = int(os.getenv("ROUTER_LONG_CHAT_TOKENS", "600"))
+# Recent large-model latency for a task above its SLO sends that task to the small model instead
+ROUTER_CHAT_SLO_SECONDS = float(os.getenv("ROUTER_CHAT_SLO_SECONDS", "10"))
+ROUTER_JOURNAL_SLO_SECONDS = float(os.getenv("ROUTER_JOURNAL_SLO_SECONDS", "45"))
+# Interactive requests already waiting for a slot before chat is sent to the small model
+ROUTER_MAX_INTERACTIVE_QUEUE = int(os.getenv("ROUTER_MAX_INTERACTIVE_QUEUE", "2"))
+# Latency samples older than this are ignored, so a downgraded model gets traffic again
+ROUTER_LATENCY_TTL = float(os.getenv("ROUTER_LATENCY_TTL", "120"))
+# How long a model Ollama reported as not pulled is skipped
+ROUTER_MISSING_MODEL_COOLDOWN = float(os.getenv("ROUTER_MISSING_MODEL_COOLDOWN", "300"))
+
+ROUTER_LATENCY_ALPHA = 0.2
+
+# Kinds of work the router distinguishes
+QUICK_TASK = "quick"
+CHAT_TASK = "chat"
+JOURNAL_TASK = "journal"
+SUMMARY_TASK = "summary"
+
+
+class ModelRouter:
+    """
+    Pick the small or the large Ollama model per request.
+
+    Quick messages, short chats and summaries use the small model; journal
+    analysis and long conversations prefer the large one. Interactive and
+    background work falls back to the small model while the large model's
+    recent latency for that task is over the task's SLO, or (for chat) while
+    interactive requests are queueing. Batch work waits for the large model
+    unless it is not pulled.
+
+    Latency is tracked per (model, task): a journal analysis legitimately
+    takes far longer than a chat turn and must not push chat off the large
+    model, nor fast chat turns hide a slow journal backlog.
+    """
+
+    def __init__(self, small_model: str = OLLAMA_SMALL_MODEL, large_model: str = OLLAMA_LARGE_MODEL):
+        self.small_model = small_model
+        self.large_model = large_model
+        self._latency: Dict[Tuple[str, str], float] = {}
+        self._observed_at: Dict[Tuple[str, str], float] = {}
+        self._missing_until: Dict[str, float] = {}
+
+    def observe(self, model: str, task: str, seconds: float) -> None:
+        """Record the latency of a completed generation of `task` by `model`"""
+        key = (model, task)
+        previous = self.latency(model, task)
+        if previous is None:
+            self._latency[key] = seconds
+        else:
+            self._latency[key] = previous + ROUTER_LATENCY_ALPHA * (seconds - previous)
+        self._observed_at[key] = time.monotonic()
+
+    def latency(self, model: str, task: str) -> Optional[float]:
+        observed_at = self._observed_at.get((model, task))
+        if observed_at is None or time.monotonic() - observed_at > ROUTER_LATENCY_TTL:
+            return None
+        return self._latency.get((model, task))
+
+    def mark_missing(self, model: str) -> None:
+        """Ollama answered 'model not found'; route around it for a while"""
+        print(f"Model {model} is not available on Ollama; routing to {self.small_model}")
+        self._missing_until[model] = time.monotonic() + ROUTER_MISSING_MODEL_COOLDOWN
+
+    def is_missing(self, model: str) -> bool:
+        return time.monotonic() < self._missing_until.get(model, 0.0)
+
+    def choose(self, task: str, history_tokens: int = 0, priority: Priority = Priority.INTERACTIVE) -> str:
+        model, reason = self._choose(task, history_tokens, priority)
+        metrics.incr(f"model_router_{task}_{'large' if model == self.large_model else 'small'}_total")
+        if reason:
+            metrics.incr(f"model_router_downgraded_{reason}_total")
+        return model
+
+    def _choose(self, task: str, history_tokens: int, priority: Priority):
+        wants_large = task == JOURNAL_TASK or (task == CHAT_TASK and history_tokens >= ROUTER_LONG_CHAT_TOKENS)
+        if not wants_large or self.large_model == self.small_model:
+            return self.small_model, None
+        if self.is_missing(self.large_model):
+            return self.small_model, "missing"
+        if priority == Priority.BATCH:
+            return self.large_model, None
+
+        slo = ROUTER_JOURNAL_SLO_SECONDS if task == JOURNAL_TASK else ROUTER_CHAT_SLO_SECONDS
+        latency = self.latency(self.large_model, task)
+        if latency is not None and latency > slo:
+            return self.small_model, "over_slo"
+        if priority == Priority.INTERACTIVE and llm_scheduler.queue_depth(Priority.INTERACTIVE) >= ROUTER_MAX_INTERACTIVE_QUEUE:
+            return self.small_model, "queue"
+        return self.large_model, None
+
+    def chat_model(self, message_history: List[Dict[str, str]], summary: str = None) -> str:
+        """Model for a conversation turn, sized by the history that goes into the prompt"""
+        history_tokens = estimate_tokens(summary or "") + sum(
+            estimate_tokens(message["content"]) for message in message_history
+        )
+        return self.choose(CHAT_TASK, history_tokens)
+
+    def stats(self) -> Dict:
+        stats = {
+            "small_model": self.small_model,
+            "large_model": self.large_model,
+            "large_model_missing": self.is_missing(self.large_model),
+        }
+        for size, model in (("small", self.small_model), ("large", self.large_model)):
+            for task in (QUICK_TASK, CHAT_TASK, JOURNAL_TASK, SUMMARY_TASK):
+                stats[f"latency_seconds_{size}_{task}"] = round(self.latency(model, task) or 0.0, 3)
+        return stats
+
+
+model_router = ModelRouter()
+metrics.register_collector("model_router", model_router.stats)
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from app.services.ollama_pool import ollama_pool
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_CAPABILITY_TTL = float(os.getenv("OLLAMA_CAPABILITY_TTL", "300"))
+OLLAMA_BREAKER_FAILURES = int(os.getenv("OLLAMA_BREAKER_FAILURES", "5"))
+OLLAMA_BREAKER_COOLDOWN = float(os.getenv("OLLAMA_BREAKER_COOLDOWN", "30"))
+
+
+class OllamaCapabilities:
+    """
+    Probe once which generation API an Ollama server supports and cache it.
+
+    /api/version only exists on builds that already have /api/chat. Older
+    servers are checked with an empty /api/chat request (a 404 means the
+    endpoint is missing and calls go straight to /api/generate).
+    """
+
+    def __init__(self, model_name: str, ttl: float = OLLAMA_CAPABILITY_TTL, backend=ollama_pool):
+        self.model_name = model_name
+        self.backend = backend
+        self.ttl = ttl
+        self.chat_api: Optional[bool] = None
+        self.version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def _is_fresh(self) -> bool:
+        return self.chat_api is not None and time.monotonic() - self._checked_at < self.ttl
+
+    async def supports_chat(self) -> bool:
+        if not self._is_fresh():
+            await self.probe()
+        # Until a probe succeeds assume a current Ollama build
+        return self.chat_api is not False
+
+    async def probe(self) -> None:
+        async with self._lock:
+            if self._is_fresh():
+                return
+            try:
+                response = await self.backend.get("/api/version", timeout=5.0)
+                if response.status_code == 200:
+                    self.version = response.json().get("version")
+                    self.chat_api = True
+                else:
+                    response = await self.backend.post(
+                        "/api/chat",
+                        json={"model": self.model_name, "messages": [], "stream": False},
+                        timeout=30.0
+                    )
+                    self.chat_api = response.status_code != 404
+                self._checked_at = time.monotonic()
+                metrics.incr("ollama_capability_probes_total")
+                logger.info(f"Ollama capabilities: version={self.version}, chat_api={self.chat_api}")
+            except httpx.HTTPError as e:
+                # Keep the previous answer; the next call will probe again
+                metrics.incr("ollama_capability_probe_failures_total")
+                logger.warning(f"Ollama capability probe failed: {e}")
+
+    def mark_stale(self) -> None:
+        """Forget the cached answer and re-probe in the background"""
+        self._checked_at = 0.0
+        if self._probe_task is None or self._probe_task.done():
+            try:
+                self._probe_task = asyncio.get_running_loop().create_task(self.probe())
+            except RuntimeError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "chat_api": self.chat_api,
+            "age_seconds": round(time.monotonic() - self._checked_at, 1) if self._checked_at else None,
+        }
+
+
+class CircuitBreaker:
+    """
+    Fail fast while Ollama is down.
+
+    After `failure_threshold` consecutive failures the breaker opens and calls
+    are rejected for `cooldown` seconds. Then one trial call is let through:
+    success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = OLLAMA_BREAKER_FAILURES, cooldown: float = OLLAMA_BREAKER_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_started_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open":
+            # One trial call at a time; a trial that never reported back expires after the cooldown
+            now = time.monotonic()
+            if self._trial_started_at is None or now - self._trial_started_at >= self.cooldown:
+                self._trial_started_at = now
+                return True
+        metrics.incr(f"{self.name}_breaker_rejected_total")
+        return False
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info(f"{self.name} circuit breaker closed")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_started_at = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_started_at = None
+        if self._opened_at is not None or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"{self.name} circuit breaker opened after {self._failures} failures")
+                metrics.incr(f"{self.name}_breaker_opened_total")
+            self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict:
+        return {"state": self.state, "consecutive_failures": self._failures}
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.services.http_client import ollama_http
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated Ollama servers; falls back to the single-server settings
+OLLAMA_BASE_URLS = [
+    url.strip().rstrip("/")
+    for url in os.getenv(
+        "OLLAMA_BASE_URLS",
+        os.getenv("OLLAMA_BASE_URL", os.getenv("OLLAMA_URL", "http://localhost:11434"))
+    ).split(",")
+    if url.strip()
+]
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
+# Consecutive failed requests before a backend is ejected
+OLLAMA_BACKEND_MAX_FAILURES = int(os.getenv("OLLAMA_BACKEND_MAX_FAILURES", "3"))
+OLLAMA_BACKEND_EJECT_SECONDS = float(os.getenv("OLLAMA_BACKEND_EJECT_SECONDS", "30"))
+OLLAMA_BACKEND_MAX_EJECT_SECONDS = float(os.getenv("OLLAMA_BACKEND_MAX_EJECT_SECONDS", "300"))
+# A conversation leaves its backend only if that one has this many more requests than the least busy
+OLLAMA_STICKY_SLACK = int(os.getenv("OLLAMA_STICKY_SLACK", "4"))
+OLLAMA_STICKY_CONVERSATIONS = int(os.getenv("OLLAMA_STICKY_CONVERSATIONS", "4096"))
+
+
+class OllamaBackend:
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.models: Optional[List[str]] = None  # From /api/tags; None until the first health check
+        self.requests_total = 0
+        self.failures_total = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def has_model(self, model: Optional[str]) -> bool:
+        if not model or self.models is None:
+            return True
+        return any(name.startswith(model) for name in self.models)
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self.ejections:
+            logger.info(f"Ollama backend {self.url} re-admitted")
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.failures_total += 1
+        if self.failures >= OLLAMA_BACKEND_MAX_FAILURES:
+            self.eject()
+
+    def eject(self) -> None:
+        # Back off longer each time the same backend is ejected again
+        duration = min(OLLAMA_BACKEND_MAX_EJECT_SECONDS, OLLAMA_BACKEND_EJECT_SECONDS * (2 ** self.ejections))
+        if self.available:
+            logger.warning(f"Ollama backend {self.url} ejected for {duration:.0f}s")
+            metrics.incr("ollama_backend_ejections_total")
+        self.ejections += 1
+        self.failures = 0
+        self.ejected_until = time.monotonic() + duration
+
+
+class OllamaBackendPool:
+    """
+    Spread Ollama calls over several servers.
+
+    New work goes to the available backend with the fewest outstanding
+    requests. A conversation sticks to the backend that served its last turn,
+    where its prompt prefix is still in the KV cache, unless that backend is
+    ejected or much busier than the rest. Backends are ejected after repeated
+    failures (passive check) or a failed /api/tags probe (active check) and
+    re-admitted once a probe or request succeeds.
+    """
+
+    def __init__(self, urls: List[str] = OLLAMA_BASE_URLS):
+        self.backends = [OllamaBackend(url) for url in urls]
+        self._sticky: "OrderedDict[str, OllamaBackend]" = OrderedDict()
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def primary_url(self) -> str:
+        return self.backends[0].url
+
+    def pick(self, conversation_id=None, model: str = None, exclude: OllamaBackend = None) -> OllamaBackend:
+        candidates = [b for b in self.backends if b.available and b is not exclude and b.has_model(model)]
+        if not candidates:
+            candidates = [b for b in self.backends if b.available and b is not exclude]
+        if not candidates:
+            # Everything is ejected: try the one that comes back first rather than failing outright
+            metrics.incr("ollama_backend_none_available_total")
+            return min(self.backends, key=lambda b: b.ejected_until)
+
+        least = min(b.outstanding for b in candidates)
+        key = str(conversation_id) if conversation_id is not None else None
+        if key is not None:
+            sticky = self._sticky.get(key)
+            if sticky in candidates and sticky.outstanding - least <= OLLAMA_STICKY_SLACK:
+                self._sticky.move_to_end(key)
+                metrics.incr("ollama_backend_sticky_hits_total")
+                return sticky
+
+        backend = random.choice([b for b in candidates if b.outstanding == least])
+        if key is not None:
+            self._sticky[key] = backend
+            self._sticky.move_to_end(key)
+            while len(self._sticky) > OLLAMA_STICKY_CONVERSATIONS:
+                self._sticky.popitem(last=False)
+        return backend
+
+    @asynccontextmanager
+    async def lease(self, conversation_id=None, model: str = None, exclude: OllamaBackend = None):
+        """Reserve a backend for one request; outstanding counts drive least-busy routing"""
+        backend = self.pick(conversation_id, model, exclude)
+        backend.outstanding += 1
+        backend.requests_total += 1
+        try:
+            yield backend
+        finally:
+            backend.outstanding -= 1
+
+    @staticmethod
+    def _record(backend: OllamaBackend, status_code: Optional[int]) -> None:
+        if status_code is None or status_code >= 500:
+            backend.record_failure()
+        else:
+            backend.record_success()
+
+    async def request(self, method: str, path: str, conversation_id=None, model: str = None, **kwargs) -> httpx.Response:
+        """
+        Send one request to a backend chosen by the pool.
+
+        A request that could not even connect is retried once on another
+        backend, since it never reached Ollama.
+        """
+        failed = None
+        for attempt in range(2 if len(self.backends) > 1 else 1):
+            async with self.lease(conversation_id, model, exclude=failed) as backend:
+                try:
+                    response = await ollama_http.request(method, f"{backend.url}{path}", **kwargs)
+                except httpx.ConnectError:
+                    self._record(backend, None)
+                    failed = backend
+                    if attempt == 0 and len(self.backends) > 1:
+                        metrics.incr("ollama_backend_retries_total")
+                        continue
+                    raise
+                except httpx.RequestError:
+                    self._record(backend, None)
+                    raise
+                self._record(backend, response.status_code)
+                return response
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, conversation_id=None, model: str = None, **kwargs):
+        async with self.lease(conversation_id, model) as backend:
+            try:
+                async with ollama_http.stream(method, f"{backend.url}{path}", **kwargs) as response:
+                    self._record(backend, response.status_code)
+                    yield response
+            except httpx.RequestError:
+                self._record(backend, None)
+                raise
+
+    async def check_backend(self, backend: OllamaBackend) -> bool:
+        """Active health check: /api/tags answers and lists the pulled models"""
+        try:
+            response = await ollama_http.get(f"{backend.url}/api/tags", timeout=10.0)
+            if response.status_code == 200:
+                backend.models = [model.get("name", "") for model in response.json().get("models", [])]
+                backend.record_success()
+                return True
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Ollama backend {backend.url} health check failed: {e}")
+        backend.eject()
+        return False
+
+    async def check_all(self) -> bool:
+        results = await asyncio.gather(*(self.check_backend(backend) for backend in self.backends))
+        return any(results)
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(OLLAMA_HEALTH_INTERVAL)
+            await self.check_all()
+
+    async def start(self) -> None:
+        if self._health_task is None:
+            await self.check_all()
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+            logger.info(f"Ollama backend pool started with {len(self.backends)} backend(s)")
+
+    async def stop(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+
+    def has_model(self, model: str) -> bool:
+        """Whether any available backend has pulled `model`"""
+        return any(backend.available and backend.has_model(model) for backend in self.backends)
+
+    def stats(self) -> Dict:
+        return {
+            "sticky_conversations": len(self._sticky),
+            "backends": [
+                {
+                    "url": backend.url,
+                    "available": backend.available,
+                    "outstanding": backend.outstanding,
+                    "requests_total": backend.requests_total,
+                    "failures_total": backend.failures_total,
+                    "models": backend.models,
+                }
+                for backend in self.backends
+            ],
+        }
+
+
+ollama_pool = OllamaBackendPool()
+metrics.register_collector("ollama_backends", ollama_pool.stats)
@@ -1,185 +1,84 @@
-import httpx
-import json
-import os
-from typing import List, Dict, Optional
+from typing import List, Dict
 import logging
 
+from app.services.inference_gateway import inference_gateway
+from app.services.llm_scheduler import Priority
+from app.services.model_router import model_router, CHAT_TASK
+from app.services.context_window import build_history_window
+
 logger = logging.getLogger(__name__)
 
 class OllamaService:
+    """
+    Object-style access to the inference gateway.
+
+    Kept for callers that want a service instance; models, timeouts, options,
+    backends and error handling all come from the gateway, so nothing here
+    needs tuning separately.
+    """
+
     def __init__(self):
-        self.base_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
-        self.model_name = os.getenv("OLLAMA_MODEL", "gemma3:12b")  # Using Gemma3:12b
-        self.timeout = 120.0  # Increased timeout for larger model
-        
+        self.gateway = inference_gateway
+
+    @property
+    def model_name(self) -> str:
+        return model_router.small_model
+
     async def generate_response(self, messages: List[Dict[str, str]], context: str = "") -> str:
         """
         Generate AI response using Ollama
-        
+
         Args:
             messages: List of conversation messages
             context: Additional context (like journal analysis, user profile, etc.)
-        
+
         Returns:
             Generated response string
         """
-        try:
-            # Build the prompt with context
-            prompt = self._build_prompt(messages, context)
-            
-            logger.info(f"Generating response with Ollama at {self.base_url}")
-            
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model_name,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.7,
-                            "num_predict": 500,  # Gemma3 uses num_predict instead of max_tokens
-                            "top_p": 0.9,
-                            "top_k": 40,
-                            "repeat_penalty": 1.1
-                        }
-                    }
-                )
-                
-                logger.info(f"Ollama response status: {response.status_code}")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    generated_text = result.get("response", "I'm sorry, I couldn't generate a response.")
-                    logger.info(f"Generated response length: {len(generated_text)}")
-                    return generated_text
-                else:
-                    logger.error(f"Ollama API error: {response.status_code} - {response.text}")
-                    return f"I'm experiencing technical difficulties (HTTP {response.status_code}). Please try again later."
-                    
-        except httpx.ConnectError:
-            logger.error(f"Cannot connect to Ollama at {self.base_url}")
-            return "I'm having trouble connecting to my AI service. Please make sure Ollama is running and try again."
-        except httpx.TimeoutException:
-            logger.error("Ollama request timed out")
-            return "I'm taking longer than usual to respond. Please try again."
-        except Exception as e:
-            logger.error(f"Ollama service error: {str(e)}")
-            return f"I'm experiencing technical difficulties: {str(e)}"
-    
+        chat_messages = self._build_messages(messages, context)
+        _, response = await self.gateway.complete(
+            chat_messages,
+            CHAT_TASK,
+            model_router.chat_model(messages),
+            priority=Priority.INTERACTIVE
+        )
+        return response
+
     async def analyze_journal_entry(self, journal_text: str, user_context: str = "") -> str:
         """
         Analyze journal entry for emotional content, themes, and insights
-        
+
         Args:
             journal_text: The journal entry text
             user_context: User profile context (specialty, previous entries, etc.)
-        
+
         Returns:
             Analysis summary
         """
-        try:
-            prompt = self._build_journal_analysis_prompt(journal_text, user_context)
-            
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/generate",
-                    json={
-                        "model": self.model_name,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": 0.3,  # Lower temperature for more consistent analysis
-                            "num_predict": 300,  # Gemma3 parameter
-                            "top_p": 0.8,
-                            "top_k": 30,
-                            "repeat_penalty": 1.05
-                        }
-                    }
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get("response", "Unable to analyze this entry.")
-                else:
-                    return "Analysis temporarily unavailable."
-                    
-        except Exception as e:
-            logger.error(f"Journal analysis error: {str(e)}")
-            return "Analysis temporarily unavailable."
-    
-    def _build_prompt(self, messages: List[Dict[str, str]], context: str) -> str:
-        """Build conversation prompt optimized for Gemma3"""
-        
-        system_prompt = """You are Carely, a compassionate AI assistant designed to support healthcare professionals with burnout and stress management.
-
-Your role:
-- Provide empathetic, understanding responses
-- Focus on mental health and wellbeing for healthcare workers
-- Offer evidence-based advice and coping strategies
-- Recognize burnout symptoms and stress indicators
-- Encourage professional help when appropriate
-- Keep responses helpful but concise (2-3 paragraphs max)
-- Never provide medical diagnoses or treatment
-- Maintain a supportive, professional tone
-
-Important: You're speaking with a healthcare professional who may be experiencing work-related stress or burnout."""
+        from app.services.chatbot import try_analyze_journal_entry
+
+        success, analysis = await try_analyze_journal_entry(journal_text, user_context or None)
+        return analysis if success else "Analysis temporarily unavailable."
+
+    def _build_messages(self, messages: List[Dict[str, str]], context: str) -> List[Dict[str, str]]:
+        """Same prompt layout as the chatbot: stable system prompt and history first, context in the newest user turn"""
+        from app.services.chatbot import create_healthcare_system_prompt
+
+        window, _ = build_history_window(messages)  # Newest messages within the token budget
+        chat_messages = [{"role": "system", "content": create_healthcare_system_prompt()}]
+        chat_messages += [{"role": message["role"], "content": message["content"]} for message in window]
 
         if context:
-            system_prompt += f"\n\nUser Context: {context}"
-        
-        # Format for Gemma3 (uses <start_of_turn> and <end_of_turn> tokens)
-        conversation = f"<start_of_turn>system\n{system_prompt}<end_of_turn>\n"
-        
-        for message in messages[-10:]:  # Keep last 10 messages for context
-            role = "user" if message["role"] == "user" else "model"
-            conversation += f"<start_of_turn>{role}\n{message['content']}<end_of_turn>\n"
-        
-        conversation += "<start_of_turn>model\n"
-        
-        return conversation
-    
-    def _build_journal_analysis_prompt(self, journal_text: str, user_context: str) -> str:
-        """Build journal analysis prompt optimized for Gemma3"""
-        
-        prompt = f"""<start_of_turn>system
-You are an AI assistant that analyzes journal entries from healthcare professionals to provide supportive insights about emotional wellbeing and stress patterns.
-
-Analyze the journal entry and provide:
-1. Emotional tone (positive/neutral/negative/mixed)
-2. Key themes or concerns
-3. Stress indicators (if present)
-4. Supportive observations
-5. Self-care recommendations
-
-Keep analysis professional, supportive, and concise (2-3 sentences maximum).
-<end_of_turn>
-
-<start_of_turn>user
-{f"User context: {user_context}" if user_context else ""}
-
-Journal entry to analyze:
-{journal_text}
-
-Please provide your analysis:
-<end_of_turn>
-
-<start_of_turn>model
-"""
-        
-        return prompt
-    
+            if chat_messages[-1]["role"] == "user":
+                chat_messages[-1]["content"] += f"\n\nUser Context: {context}"
+            else:
+                chat_messages.append({"role": "user", "content": f"User Context: {context}"})
+
+        return chat_messages
+
     async def check_model_availability(self) -> bool:
-        """Check if Ollama model is available"""
-        try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/api/tags")
-                if response.status_code == 200:
-                    models = response.json().get("models", [])
-                    return any(model.get("name", "").startswith(self.model_name) for model in models)
-                return False
-        except Exception:
-            return False
+        """Check if any Ollama backend has the model"""
+        return await self.gateway.check_model(self.model_name)
 
 # Initialize service
-ollama_service = OllamaService()
\ No newline at end of file
+ollama_service = OllamaService()
@@ -0,0 +1,205 @@
+import asyncio
+import importlib.util
+import math
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from app.services.inference_gateway import inference_gateway, OLLAMA_EMBED_MODEL
+from app.services.metrics import metrics
+
+# Vectors live in a float32 NumPy matrix when NumPy is installed; plain float32 arrays otherwise
+if importlib.util.find_spec("numpy") is not None:
+    import numpy as np
+else:
+    np = None
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity a cached prompt needs to answer a new one
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2000"))
+# Longest a turn waits for its prompt embedding before answering without the cache
+SEMANTIC_CACHE_EMBED_TIMEOUT = float(os.getenv("SEMANTIC_CACHE_EMBED_TIMEOUT", "0.3"))
+
+
+def context_bucket(user_context: Optional[Dict]) -> str:
+    """
+    Answers are only shared between users whose prompt context is identical.
+
+    Every field of the context (specialty, mood, stress, fatigue, burnout
+    risk) goes into the prompt, so every field is part of the key.
+    """
+    user_context = user_context or {}
+    return "|".join(
+        f"{field}={str(value).strip().lower()}"
+        for field, value in sorted(user_context.items())
+        if value is not None
+    )
+
+
+def _normalize(vector: Sequence[float]):
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    if np is not None:
+        return np.asarray(vector, dtype=np.float32) / np.float32(norm)
+    return array("f", (value / norm for value in vector))
+
+
+class _CacheEntry:
+    __slots__ = ("bucket", "prompt", "response", "vector", "created_at")
+
+    def __init__(self, bucket: str, prompt: str, response: str, vector, created_at: float):
+        self.bucket = bucket
+        self.prompt = prompt
+        self.response = response
+        self.vector = vector
+        self.created_at = created_at
+
+
+class _Bucket:
+    """Entry ids of one context bucket and their vectors stacked in one matrix"""
+
+    def __init__(self):
+        self.ids: List[int] = []
+        self.matrix = None
+        self.dirty = True
+
+
+class SemanticCache:
+    """
+    Serve answers to prompts that mean the same as one answered before.
+
+    Prompts are embedded with Ollama's embedding model. Vectors are unit
+    length, so cosine similarity is one matrix-vector product per bucket.
+    Entries expire after SEMANTIC_CACHE_TTL and the least recently used are
+    evicted beyond SEMANTIC_CACHE_SIZE.
+    """
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self._buckets: Dict[str, _Bucket] = {}
+        self._next_id = 0
+        self._dimensions: Optional[int] = None
+        self._lock = threading.Lock()
+
+    async def embed(self, prompt: str, timeout: float = SEMANTIC_CACHE_EMBED_TIMEOUT):
+        """
+        Unit-length embedding of `prompt` by OLLAMA_EMBED_MODEL.
+
+        None when caching is off, embedding failed or took over `timeout`
+        seconds, so a slow embedding model costs a cache miss, not the turn.
+        """
+        if not SEMANTIC_CACHE_ENABLED:
+            return None
+        try:
+            vectors = await asyncio.wait_for(
+                inference_gateway.embed([" ".join(prompt.split())], OLLAMA_EMBED_MODEL), timeout
+            )
+        except asyncio.TimeoutError:
+            metrics.incr("semantic_cache_embed_timeouts_total")
+            return None
+        if not vectors:
+            metrics.incr("semantic_cache_embed_failures_total")
+            return None
+        return _normalize(vectors[0])
+
+    def _rebuild(self, bucket: _Bucket) -> None:
+        if np is not None:
+            bucket.matrix = (
+                np.vstack([self._entries[entry_id].vector for entry_id in bucket.ids])
+                if bucket.ids else None
+            )
+        bucket.dirty = False
+
+    def _scores(self, bucket: _Bucket, vector) -> List[float]:
+        if bucket.dirty:
+            self._rebuild(bucket)
+        if np is not None:
+            return (bucket.matrix @ vector).tolist() if bucket.matrix is not None else []
+        return [
+            sum(a * b for a, b in zip(self._entries[entry_id].vector, vector))
+            for entry_id in bucket.ids
+        ]
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets[entry.bucket]
+        bucket.ids.remove(entry_id)
+        bucket.dirty = True
+        if not bucket.ids:
+            del self._buckets[entry.bucket]
+
+    def match(self, bucket_key: str, vector) -> Optional[str]:
+        """Cached response for the most similar prompt in the bucket, if similar enough"""
+        if vector is None:
+            return None
+
+        started = time.perf_counter()
+        with self._lock:
+            bucket = self._buckets.get(bucket_key)
+            response = None
+            if bucket is not None and len(vector) == self._dimensions:
+                scores = self._scores(bucket, vector)
+                if scores:
+                    best = max(range(len(scores)), key=scores.__getitem__)
+                    entry_id = bucket.ids[best]
+                    entry = self._entries[entry_id]
+                    if time.time() - entry.created_at > self.ttl:
+                        self._remove(entry_id)
+                    elif scores[best] >= self.threshold:
+                        self._entries.move_to_end(entry_id)
+                        response = entry.response
+        metrics.observe("semantic_cache_lookup_seconds", time.perf_counter() - started)
+
+        metrics.incr("semantic_cache_hits_total" if response is not None else "semantic_cache_misses_total")
+        return response
+
+    def store(self, bucket_key: str, vector, prompt: str, response: str) -> None:
+        if vector is None:
+            return
+
+        with self._lock:
+            if self._dimensions != len(vector):
+                # A different embedding model: old vectors are not comparable
+                self._entries.clear()
+                self._buckets.clear()
+                self._dimensions = len(vector)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _CacheEntry(bucket_key, prompt, response, vector, time.time())
+            bucket = self._buckets.setdefault(bucket_key, _Bucket())
+            bucket.ids.append(entry_id)
+            bucket.dirty = True
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                metrics.incr("semantic_cache_evictions_total")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> Dict:
+        hits = metrics.get("semantic_cache_hits_total")
+        misses = metrics.get("semantic_cache_misses_total")
+        return {
+            "enabled": SEMANTIC_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "buckets": len(self._buckets),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "numpy": np is not None,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        }
+
+
+semantic_cache = SemanticCache()
+metrics.register_collector("semantic_cache", semantic_cache.stats)
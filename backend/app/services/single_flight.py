@@ -0,0 +1,55 @@
+import asyncio
+import hashlib
+import json
+from typing import Awaitable, Callable, Dict, TypeVar
+
+from app.services.metrics import metrics
+
+T = TypeVar("T")
+
+
+def request_key(*parts) -> str:
+    """Stable hash of a request payload (prompt, model, options, ...)"""
+    material = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one.
+
+    The first caller for a key starts the work as a task; callers that arrive
+    while it is still running await the same task instead of starting their own.
+    The task is shielded, so a caller disconnecting does not cancel it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is not None:
+            metrics.incr(f"{self.name}_coalesced_total")
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        task.add_done_callback(lambda finished: self._finish(key, finished))
+        metrics.incr(f"{self.name}_leaders_total")
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
+
+    def stats(self) -> Dict:
+        return {"in_flight_keys": len(self._calls)}
+
+
+# Shared by all Ollama generation calls
+ollama_flight = SingleFlight("llm_singleflight")
+metrics.register_collector("llm_singleflight", ollama_flight.stats)
@@ -0,0 +1,261 @@
+import asyncio
+import importlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# "none" to leave audio untranscribed, "whisper" for local CPU transcription with faster-whisper
+# (requirements-worker.txt), "stub" for a deterministic transcript (tests), or "package.module:attribute".
+# Set the same value on the API and the worker: the API decides which entries wait for a transcript.
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "none")
+TRANSCRIPTION_MODEL = os.getenv("TRANSCRIPTION_MODEL", "base")
+TRANSCRIPTION_COMPUTE_TYPE = os.getenv("TRANSCRIPTION_COMPUTE_TYPE", "int8")
+TRANSCRIPTION_LANGUAGE = os.getenv("TRANSCRIPTION_LANGUAGE") or None
+# Worker processes, i.e. chunks transcribed at once; each gets an equal share of the CPU threads
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "2"))
+TRANSCRIPTION_THREADS = int(os.getenv("TRANSCRIPTION_THREADS", str(max(1, (os.cpu_count() or 1) // TRANSCRIPTION_WORKERS))))
+# Long recordings are split into windows of this length and spread over the workers
+TRANSCRIPTION_CHUNK_SECONDS = float(os.getenv("TRANSCRIPTION_CHUNK_SECONDS", "30"))
+# Each window is decoded with this much audio either side, so words at a cut are heard whole
+TRANSCRIPTION_OVERLAP_SECONDS = float(os.getenv("TRANSCRIPTION_OVERLAP_SECONDS", "3"))
+
+TRANSCRIPTION_SAMPLE_RATE = 16000
+
+Window = Tuple[float, Optional[float]]
+
+
+class StubTranscriber:
+    """Deterministic transcript naming the file and window, for tests and development"""
+
+    name = "stub"
+
+    def transcribe(self, path: str, start: float, end: Optional[float]) -> str:
+        until = f"{end:g}s" if end is not None else "the end"
+        return f"Stub transcript of {os.path.basename(path)} from {start:g}s to {until}."
+
+
+class WhisperTranscriber:
+    """
+    Local CPU transcription with faster-whisper (CTranslate2, int8 weights).
+
+    Loaded once per worker process. A recording is decoded once per process
+    and windows are sliced out of it, so a worker handed several windows of
+    the same file does not decode it again.
+    """
+
+    def __init__(self, model: str = TRANSCRIPTION_MODEL, compute_type: str = TRANSCRIPTION_COMPUTE_TYPE):
+        from faster_whisper import WhisperModel, decode_audio
+
+        self.name = f"whisper:{model}"
+        self._decode_audio = decode_audio
+        self._model = WhisperModel(model, device="cpu", compute_type=compute_type, cpu_threads=TRANSCRIPTION_THREADS)
+        self._decoded_path: Optional[str] = None
+        self._decoded = None
+
+    def _samples(self, path: str, start: float, end: Optional[float]):
+        if self._decoded_path != path:
+            self._decoded = self._decode_audio(path, sampling_rate=TRANSCRIPTION_SAMPLE_RATE)
+            self._decoded_path = path
+        first = int(start * TRANSCRIPTION_SAMPLE_RATE)
+        last = int(end * TRANSCRIPTION_SAMPLE_RATE) if end is not None else None
+        return self._decoded[first:last]
+
+    def transcribe(self, path: str, start: float, end: Optional[float]) -> str:
+        padded_start = max(0.0, start - TRANSCRIPTION_OVERLAP_SECONDS)
+        padded_end = end + TRANSCRIPTION_OVERLAP_SECONDS if end is not None else None
+        segments, _ = self._model.transcribe(
+            self._samples(path, padded_start, padded_end),
+            language=TRANSCRIPTION_LANGUAGE,
+            beam_size=1,
+            vad_filter=True
+        )
+        return " ".join(segment.text.strip() for segment in segments_in_window(segments, padded_start, start, end)).strip()
+
+
+def segments_in_window(segments, offset: float, start: float, end: Optional[float]) -> list:
+    """
+    The segments belonging to the [start, end) window.
+
+    Windows are decoded with overlap, so a segment near a cut shows up in
+    both neighbours; each one is kept only by the window holding its
+    midpoint. Segment times are relative to `offset`, where decoding began.
+    """
+    kept = []
+    for segment in segments:
+        midpoint = offset + (segment.start + segment.end) / 2
+        if midpoint >= start and (end is None or midpoint < end):
+            kept.append(segment)
+    return kept
+
+
+def load_transcriber(spec: str = TRANSCRIPTION_BACKEND):
+    """
+    Resolve a transcription backend.
+
+    A backend is any object with a `name` and `transcribe(path, start, end)`
+    returning the text spoken between `start` and `end` seconds (`end` None
+    meaning the end of the file). It is built inside each worker process.
+    """
+    if spec == "whisper":
+        return WhisperTranscriber()
+    if spec == "stub":
+        return StubTranscriber()
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def backend_configured(spec: str = TRANSCRIPTION_BACKEND) -> bool:
+    return bool(spec) and spec != "none"
+
+
+def backend_available(spec: str = TRANSCRIPTION_BACKEND) -> bool:
+    """Whether the backend can run in this process; the API image may lack what the worker has"""
+    if not backend_configured(spec):
+        return False
+    if spec == "whisper":
+        return importlib.util.find_spec("faster_whisper") is not None
+    return True
+
+
+def chunk_windows(duration: Optional[float], chunk_seconds: float = TRANSCRIPTION_CHUNK_SECONDS) -> List[Window]:
+    """[start, end) windows covering a recording; one open-ended window when the duration is unknown"""
+    if not duration or duration <= chunk_seconds:
+        return [(0.0, None)]
+    windows = []
+    start = 0.0
+    while start < duration:
+        end = start + chunk_seconds
+        windows.append((start, end if end < duration else None))
+        start = end
+    return windows
+
+
+# Set in each worker process by _init_worker
+_worker_backend = None
+
+
+def _init_worker(spec: str) -> None:
+    global _worker_backend
+    _worker_backend = load_transcriber(spec)
+
+
+def _transcribe_window(path: str, start: float, end: Optional[float]) -> Tuple[str, float]:
+    """Runs in a worker process; returns the text and the CPU seconds it took"""
+    started = time.process_time()
+    text = _worker_backend.transcribe(path, start, end)
+    return text, time.process_time() - started
+
+
+class TranscriptionPool:
+    """
+    Speech-to-text on a pool of worker processes.
+
+    Transcription is CPU-bound, so it runs outside the event loop and the
+    GIL. Recordings are cut into TRANSCRIPTION_CHUNK_SECONDS windows and at
+    most `workers` windows are handed to the pool at a time; the rest wait
+    here, where a cancelled job can drop them. The pool starts on first use.
+    """
+
+    def __init__(self, spec: str = TRANSCRIPTION_BACKEND, workers: int = TRANSCRIPTION_WORKERS):
+        self.spec = spec
+        self.workers = max(1, workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._recordings = 0
+        self._audio_seconds = 0.0
+        self._wall_seconds = 0.0
+
+    @property
+    def configured(self) -> bool:
+        return backend_configured(self.spec)
+
+    @property
+    def enabled(self) -> bool:
+        return backend_available(self.spec)
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned, not forked: the API process has threads (DB pool, LISTEN) that fork would copy mid-state
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.spec,)
+            )
+            logger.info(f"Transcription pool started: {self.workers} x {self.spec}")
+        return self._executor
+
+    async def _transcribe_window(self, path: str, window: Window) -> str:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        async with self._slots:
+            self._in_flight += 1
+            try:
+                text, cpu_seconds = await asyncio.get_running_loop().run_in_executor(
+                    self._pool(), _transcribe_window, path, window[0], window[1]
+                )
+            except BrokenProcessPool:
+                # A worker died (out of memory, crash in the model); start fresh on the next call
+                self._executor = None
+                metrics.incr("transcription_pool_restarts_total")
+                raise
+            finally:
+                self._in_flight -= 1
+        metrics.incr("transcription_chunks_total")
+        metrics.incr("transcription_cpu_seconds_total", cpu_seconds)
+        return text
+
+    async def transcribe(self, path: str, duration: Optional[float] = None) -> str:
+        """Transcribe a recording, its windows in parallel, and join them in order"""
+        if not self.enabled:
+            raise RuntimeError(f"Transcription backend {self.spec!r} is not available in this process; is requirements-worker.txt installed?")
+        started = time.monotonic()
+        texts = await asyncio.gather(*(self._transcribe_window(path, window) for window in chunk_windows(duration)))
+        elapsed = time.monotonic() - started
+
+        self._recordings += 1
+        metrics.incr("transcription_recordings_total")
+        metrics.observe("transcription_seconds", elapsed)
+        if duration:
+            # Throughput only counts recordings of known length
+            self._audio_seconds += duration
+            self._wall_seconds += elapsed
+            metrics.incr("transcription_audio_seconds_total", duration)
+            metrics.incr("transcription_wall_seconds_total", elapsed)
+        return " ".join(text for text in texts if text).strip()
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.spec,
+            "configured": self.configured,
+            "enabled": self.enabled,
+            "started": self._executor is not None,
+            "workers": self.workers,
+            "chunk_seconds": TRANSCRIPTION_CHUNK_SECONDS,
+            "overlap_seconds": TRANSCRIPTION_OVERLAP_SECONDS,
+            "in_flight_chunks": self._in_flight,
+            "recordings": self._recordings,
+            "audio_seconds": round(self._audio_seconds, 2),
+            "wall_seconds": round(self._wall_seconds, 2),
+            # Above 1 means audio is transcribed faster than real time
+            "audio_seconds_per_wall_second": round(self._audio_seconds / self._wall_seconds, 2) if self._wall_seconds else 0.0,
+        }
+
+
+transcription_pool = TranscriptionPool()
+metrics.register_collector("transcription", transcription_pool.stats)
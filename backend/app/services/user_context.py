@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+from app.services.metrics import metrics
+
+# Each process caches contexts this long; writes in the same process invalidate immediately
+USER_CONTEXT_CACHE_TTL = float(os.getenv("USER_CONTEXT_CACHE_TTL", "30"))
+USER_CONTEXT_CACHE_SIZE = int(os.getenv("USER_CONTEXT_CACHE_SIZE", "4096"))
+
+
+def burnout_risk(emotional_exhaustion: Optional[int]) -> Optional[str]:
+    """Simple burnout risk from the MBI emotional exhaustion subscale"""
+    if emotional_exhaustion is None:
+        return None
+    return "High" if emotional_exhaustion > 27 else "Medium" if emotional_exhaustion > 17 else "Low"
+
+
+def _utc_naive(at: Optional[datetime]) -> Optional[datetime]:
+    # Client-supplied timestamps may carry a timezone; stored ones are naive UTC
+    if at is not None and at.tzinfo is not None:
+        return at.astimezone(timezone.utc).replace(tzinfo=None)
+    return at
+
+
+def _is_newer(at, previous) -> bool:
+    at, previous = _utc_naive(at), _utc_naive(previous)
+    return previous is None or at is None or at >= previous
+
+
+def _find_snapshot(db: Session, user_id, for_update: bool = False) -> Optional[models.UserContextSnapshot]:
+    query = db.query(models.UserContextSnapshot).filter(
+        models.UserContextSnapshot.user_id == user_id
+    )
+    if for_update:
+        query = query.with_for_update().populate_existing()
+    return query.first()
+
+
+def get_snapshot(db: Session, user_id) -> models.UserContextSnapshot:
+    """
+    The user's snapshot row, locked for the rest of the caller's transaction.
+
+    A missing row is inserted with ON CONFLICT DO NOTHING and read back, so
+    two writes racing to create it (a first mood next to a backfill, say)
+    both end up updating the one row instead of one failing on the key.
+    """
+    snapshot = _find_snapshot(db, user_id, for_update=True)
+    if snapshot is None:
+        insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        db.execute(
+            insert(models.UserContextSnapshot)
+            .values(user_id=user_id, updated_at=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=["user_id"])
+        )
+        snapshot = _find_snapshot(db, user_id, for_update=True)
+    return snapshot
+
+
+def _apply_mood(snapshot: models.UserContextSnapshot, mood: models.MoodEntry) -> None:
+    if _is_newer(mood.timestamp, snapshot.mood_at):
+        snapshot.recent_mood = mood.mood
+        snapshot.mood_at = mood.timestamp
+
+
+def _apply_micro_assessment(snapshot: models.UserContextSnapshot, micro: models.MicroAssessment) -> None:
+    if _is_newer(micro.submitted_at, snapshot.micro_at):
+        snapshot.stress_level = micro.stress_level
+        snapshot.fatigue_level = micro.fatigue_level
+        snapshot.micro_at = micro.submitted_at
+
+
+def _apply_mbi_assessment(snapshot: models.UserContextSnapshot, assessment: models.MBIAssessment) -> None:
+    if _is_newer(assessment.submitted_at, snapshot.mbi_at):
+        snapshot.burnout_risk = burnout_risk(assessment.emotional_exhaustion)
+        snapshot.mbi_at = assessment.submitted_at
+
+
+# The record_* helpers run inside the write's transaction, before its commit
+
+def record_specialty(db: Session, user: models.User) -> None:
+    get_snapshot(db, user.id).specialty = user.specialty
+
+
+def record_mood(db: Session, mood: models.MoodEntry) -> None:
+    _apply_mood(get_snapshot(db, mood.user_id), mood)
+
+
+def record_micro_assessment(db: Session, micro: models.MicroAssessment) -> None:
+    _apply_micro_assessment(get_snapshot(db, micro.user_id), micro)
+
+
+def record_mbi_assessment(db: Session, assessment: models.MBIAssessment) -> None:
+    _apply_mbi_assessment(get_snapshot(db, assessment.user_id), assessment)
+
+
+def build_snapshot(user_id) -> Optional[models.UserContextSnapshot]:
+    """
+    Create the snapshot of a user who has none yet, from their latest rows.
+
+    Only needed once per user who predates the snapshot table. Runs in its
+    own session so a cache read never commits the caller's transaction.
+    """
+    db = SessionLocal()
+    try:
+        return _build_snapshot(db, user_id)
+    finally:
+        db.close()
+
+
+def _build_snapshot(db: Session, user_id) -> Optional[models.UserContextSnapshot]:
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if user is None:
+        return None
+
+    snapshot = get_snapshot(db, user.id)
+    snapshot.specialty = user.specialty
+
+    mood = db.query(models.MoodEntry).filter(
+        models.MoodEntry.user_id == user.id
+    ).order_by(models.MoodEntry.timestamp.desc()).first()
+    if mood:
+        _apply_mood(snapshot, mood)
+
+    micro = db.query(models.MicroAssessment).filter(
+        models.MicroAssessment.user_id == user.id
+    ).order_by(models.MicroAssessment.submitted_at.desc()).first()
+    if micro:
+        _apply_micro_assessment(snapshot, micro)
+
+    mbi = db.query(models.MBIAssessment).filter(
+        models.MBIAssessment.user_id == user.id
+    ).order_by(models.MBIAssessment.submitted_at.desc()).first()
+    if mbi:
+        _apply_mbi_assessment(snapshot, mbi)
+
+    db.commit()
+    db.refresh(snapshot)
+    metrics.incr("user_context_backfills_total")
+    return snapshot
+
+
+def snapshot_context(snapshot: models.UserContextSnapshot) -> Dict:
+    """Prompt context dict: specialty always, the rest only once the user has recorded them"""
+    context = {"specialty": snapshot.specialty}
+    if snapshot.recent_mood is not None:
+        context["recent_mood"] = snapshot.recent_mood
+    if snapshot.micro_at is not None:
+        context["stress_level"] = snapshot.stress_level
+        context["fatigue_level"] = snapshot.fatigue_level
+    if snapshot.burnout_risk is not None:
+        context["burnout_risk"] = snapshot.burnout_risk
+    return context
+
+
+class UserContextCache:
+    """
+    Short-lived in-process cache of user contexts in front of user_context_snapshots.
+
+    A miss is one primary-key lookup. Other processes (API workers, the job
+    worker) see a write at most USER_CONTEXT_CACHE_TTL seconds late.
+    """
+
+    def __init__(self, ttl: float = USER_CONTEXT_CACHE_TTL, max_entries: int = USER_CONTEXT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, user_id) -> Dict:
+        key = str(user_id)
+        user_id = UUID(key)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                self._entries.move_to_end(key)
+                metrics.incr("user_context_cache_hits_total")
+                return dict(cached[1])
+
+        metrics.incr("user_context_cache_misses_total")
+        snapshot = _find_snapshot(db, user_id)
+        if snapshot is None:
+            snapshot = build_snapshot(user_id)
+        context = snapshot_context(snapshot) if snapshot is not None else {}
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), context)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return dict(context)
+
+    def invalidate(self, user_id) -> None:
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        hits = metrics.get("user_context_cache_hits_total")
+        misses = metrics.get("user_context_cache_misses_total")
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+        }
+
+
+user_context_cache = UserContextCache()
+metrics.register_collector("user_context_cache", user_context_cache.stats)
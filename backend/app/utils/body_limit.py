@@ -0,0 +1,79 @@
+import json
+from typing import Dict, Optional, Tuple
+
+from app.utils.sizes import format_size
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class BodySizeLimitMiddleware:
+    """
+    Refuse request bodies over a per-route limit before the app reads them.
+
+    Multipart bodies are spooled in full by the form parser before a handler
+    runs, so a size check in the handler comes too late. Here a declared
+    Content-Length over the limit is answered with 413 without reading the
+    body, and a body sent without one is cut off as soon as it crosses it.
+    `limits` maps (method, path) to bytes; paths match with or without a
+    trailing slash.
+    """
+
+    def __init__(self, app, limits: Dict[Tuple[str, str], int]):
+        self.app = app
+        self.limits = {(method.upper(), path.rstrip("/")): max_bytes for (method, path), max_bytes in limits.items()}
+
+    def _limit_for(self, scope) -> Optional[int]:
+        return self.limits.get((scope["method"], scope["path"].rstrip("/")))
+
+    async def __call__(self, scope, receive, send):
+        limit = self._limit_for(scope) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    too_large = True
+                    raise _BodyTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if too_large:
+                # The app's own error for the aborted body is replaced by the 413
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            pass
+        if too_large and not response_started:
+            await self._reject(send, limit)
+
+    @staticmethod
+    async def _reject(send, limit: int) -> None:
+        body = json.dumps({"detail": f"Request body exceeds the {format_size(limit)} limit"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
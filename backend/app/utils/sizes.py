@@ -0,0 +1,3 @@
+def format_size(size: int) -> str:
+    """Human-readable byte count for limits in error messages, e.g. "25 MB" or "512 bytes" """
+    return f"{size / (1024 * 1024):g} MB" if size >= 1024 * 1024 else f"{size} bytes"
@@ -0,0 +1,16 @@
+import json
+from fastapi.encoders import jsonable_encoder
+
+# Headers that stop proxies (nginx) from buffering an event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+# Comment frame that keeps idle streams open through proxies
+SSE_KEEPALIVE = ": keepalive\n\n"
+
+def format_sse(event: str, data) -> str:
+    """Format one Server-Sent Events frame with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
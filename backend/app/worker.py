@@ -0,0 +1,56 @@
+"""
+Standalone job worker.
+
+Runs queued AI jobs (chat replies, journal analysis, audio transcription) outside the API process:
+    python -m app.worker
+Start as many as needed; they share the jobs table safely.
+"""
+import asyncio
+import logging
+import signal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import models
+from app.database import engine
+from app.services import ai_jobs, bulk_reanalysis  # registers the job handlers
+from app.services.http_client import ollama_http
+from app.services.ollama_pool import ollama_pool
+from app.services.llm_telemetry import llm_ledger
+from app.services.job_queue import job_worker
+from app.services.transcription import transcription_pool
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    models.Base.metadata.create_all(bind=engine)
+    await ollama_http.start()
+    await ollama_pool.start()
+    await llm_ledger.start()
+    await job_worker.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    logger.info(f"Job worker {job_worker.worker_id} running")
+    await stop.wait()
+
+    logger.info("Job worker shutting down...")
+    await job_worker.stop()
+    transcription_pool.stop()
+    await ollama_pool.stop()
+    await llm_ledger.stop()
+    await ollama_http.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,305 @@
+"""
+Stand-in Ollama server for benchmarking the API without a GPU.
+
+Implements /api/tags, /api/version, /api/ps, /api/embed, /api/embeddings,
+/api/chat and /api/generate (streaming and non-streaming, plus empty-prompt
+load/unload) with the same response shapes as Ollama, including token counts,
+durations and the generate `context` array. Models stay resident for their
+keep_alive.
+
+    python -m loadtest.fake_ollama --port 11434 --tokens-per-second 40 --ttft 0.5
+
+Every option can also be set with an environment variable (FAKE_OLLAMA_<OPTION>),
+e.g. FAKE_OLLAMA_ERROR_RATE=0.05. Point the API at it with OLLAMA_BASE_URL(S).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def _env(name: str, default: str) -> str:
+    return os.getenv(f"FAKE_OLLAMA_{name}", default)
+
+
+class FakeOllamaConfig:
+    def __init__(self):
+        self.models = [m.strip() for m in _env("MODELS", "gemma2:2b,gemma3:12b,nomic-embed-text").split(",") if m.strip()]
+        self.tokens_per_second = float(_env("TOKENS_PER_SECOND", "30"))
+        self.ttft = float(_env("TTFT", "0.3"))                  # Seconds before the first token
+        self.reply_tokens = int(_env("REPLY_TOKENS", "80"))     # Capped by options.num_predict
+        self.num_parallel = int(_env("NUM_PARALLEL", "4"))      # Like OLLAMA_NUM_PARALLEL; extra requests queue
+        self.error_rate = float(_env("ERROR_RATE", "0"))        # Fraction of requests answered with a 500
+        self.stall_rate = float(_env("STALL_RATE", "0"))        # Fraction of requests that stall mid-reply
+        self.stall_seconds = float(_env("STALL_SECONDS", "10"))
+        self.load_seconds = float(_env("LOAD_SECONDS", "0"))  # Paid by the first request for a model not loaded
+
+
+config = FakeOllamaConfig()
+app = FastAPI(title="Fake Ollama")
+_slots = None
+_loaded = {}  # model -> monotonic time its keep_alive runs out
+
+WORDS = (
+    "rest breathe boundaries support colleagues shift sleep balance reflect gentle "
+    "progress notice energy recover pause care steady routine connect patience"
+).split()
+
+
+def _slots_semaphore() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(max(1, config.num_parallel))
+    return _slots
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _reply_length(options: dict) -> int:
+    limit = (options or {}).get("num_predict") or config.reply_tokens
+    return max(1, min(config.reply_tokens, int(limit)))
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _unknown_model(model: str):
+    if model in config.models or any(name.startswith(model) for name in config.models):
+        return None
+    return JSONResponse(status_code=404, content={"error": f'model "{model}" not found, try pulling it first'})
+
+
+def _keep_alive_seconds(value) -> float:
+    """Ollama keep_alive: seconds as a number, a duration like "5m", or negative for forever"""
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float("inf") if value < 0 else float(value)
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    for suffix in ("ms", "s", "m", "h"):
+        if value.endswith(suffix):
+            amount = float(value[:-len(suffix)])
+            return float("inf") if amount < 0 else amount * units[suffix]
+    return _keep_alive_seconds(float(value))
+
+
+async def _ensure_loaded(model: str, keep_alive) -> float:
+    """Simulate loading the model if it is not resident; returns the load time"""
+    now = time.monotonic()
+    load = 0.0
+    if _loaded.get(model, 0.0) < now:
+        load = config.load_seconds
+        if load:
+            await asyncio.sleep(load)
+    _loaded[model] = time.monotonic() + _keep_alive_seconds(keep_alive)
+    return load
+
+
+def _final_stats(prompt_tokens: int, eval_tokens: int, started: float, first_token_at: float, load: float = 0.0) -> dict:
+    now = time.perf_counter()
+    return {
+        "done": True,
+        "done_reason": "stop",
+        "total_duration": int((now - started) * 1e9),
+        "load_duration": int(load * 1e9),
+        "prompt_eval_count": prompt_tokens,
+        "prompt_eval_duration": int((first_token_at - started - load) * 1e9),
+        "eval_count": eval_tokens,
+        "eval_duration": int((now - first_token_at) * 1e9),
+    }
+
+
+async def _tokens(count: int):
+    """Yield `count` words at the configured rate, optionally stalling once"""
+    stall_at = random.randrange(count) if random.random() < config.stall_rate else None
+    delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+    for index in range(count):
+        if index == stall_at:
+            await asyncio.sleep(config.stall_seconds)
+        if delay:
+            await asyncio.sleep(delay)
+        yield random.choice(WORDS) + " "
+
+
+async def _generate(body: dict, prompt_text: str, kind: str):
+    model = body.get("model", "")
+    missing = _unknown_model(model)
+    if missing is not None:
+        return missing
+
+    prompt_tokens = _count_tokens(prompt_text) + len(body.get("context") or [])
+    reply_tokens = _reply_length(body.get("options"))
+
+    def fragment(text: str) -> dict:
+        base = {"model": model, "created_at": _now()}
+        if kind == "chat":
+            base["message"] = {"role": "assistant", "content": text}
+        else:
+            base["response"] = text
+        return base
+
+    async def run(stream: bool):
+        async with _slots_semaphore():
+            started = time.perf_counter()
+            if random.random() < config.error_rate:
+                yield None
+                return
+            load = await _ensure_loaded(model, body.get("keep_alive"))
+            await asyncio.sleep(config.ttft)
+            first_token_at = time.perf_counter()
+            parts = []
+            async for token in _tokens(reply_tokens):
+                parts.append(token)
+                if stream:
+                    yield fragment(token)
+            final = fragment("" if stream else "".join(parts).strip())
+            final.update(_final_stats(prompt_tokens, reply_tokens, started, first_token_at, load))
+            if kind == "generate":
+                final["context"] = list(range(prompt_tokens + reply_tokens))
+            yield final
+
+    if body.get("stream", True):
+        async def lines():
+            async for chunk in run(True):
+                if chunk is None:
+                    yield json.dumps({"error": "fake ollama: injected failure"}) + "\n"
+                    return
+                yield json.dumps(chunk) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    result = None
+    async for chunk in run(False):
+        result = chunk
+    if result is None:
+        return JSONResponse(status_code=500, content={"error": "fake ollama: injected failure"})
+    return JSONResponse(result)
+
+
+@app.get("/api/version")
+async def version():
+    return {"version": "0.0.0-fake"}
+
+
+@app.get("/api/tags")
+async def tags():
+    return {
+        "models": [
+            {"name": name, "model": name, "modified_at": _now(), "size": 0, "details": {"family": "fake"}}
+            for name in config.models
+        ]
+    }
+
+
+@app.post("/api/chat")
+async def chat(request: Request):
+    body = await request.json()
+    messages = body.get("messages") or []
+    if not messages:
+        # Ollama answers an empty chat with an empty, finished message
+        return {"model": body.get("model"), "created_at": _now(), "message": {"role": "assistant", "content": ""}, "done": True}
+    prompt_text = "".join(message.get("content", "") for message in messages)
+    return await _generate(body, prompt_text, "chat")
+
+
+def _embedding(text: str, dimensions: int = 64) -> list:
+    """Deterministic bag-of-words vector, so reworded prompts land close together"""
+    vector = [0.0] * dimensions
+    for word in text.lower().split():
+        digest = hashlib.md5(word.strip(".,!?").encode("utf-8")).digest()
+        vector[digest[0] % dimensions] += 1.0 if digest[1] % 2 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+@app.post("/api/embed")
+async def embed(request: Request):
+    body = await request.json()
+    missing = _unknown_model(body.get("model", ""))
+    if missing is not None:
+        return missing
+    texts = body.get("input") or []
+    if isinstance(texts, str):
+        texts = [texts]
+    return {"model": body.get("model"), "embeddings": [_embedding(text) for text in texts]}
+
+
+@app.post("/api/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    missing = _unknown_model(body.get("model", ""))
+    if missing is not None:
+        return missing
+    return {"embedding": _embedding(body.get("prompt", ""))}
+
+
+@app.get("/api/ps")
+async def ps():
+    now = time.monotonic()
+    return {"models": [{"name": model, "model": model} for model, expires in _loaded.items() if expires > now]}
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    body = await request.json()
+    model = body.get("model", "")
+    if not body.get("prompt") and not body.get("context"):
+        # An empty prompt only loads the model, or unloads it with keep_alive 0
+        missing = _unknown_model(model)
+        if missing is not None:
+            return missing
+        if body.get("keep_alive") in (0, "0", "0s"):
+            _loaded.pop(model, None)
+            return {"model": model, "created_at": _now(), "response": "", "done": True, "done_reason": "unload"}
+        started = time.perf_counter()
+        load = await _ensure_loaded(model, body.get("keep_alive"))
+        return {
+            "model": model,
+            "created_at": _now(),
+            "response": "",
+            "done": True,
+            "done_reason": "load",
+            "total_duration": int((time.perf_counter() - started) * 1e9),
+            "load_duration": int(load * 1e9),
+        }
+    return await _generate(body, body.get("prompt", ""), "generate")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for load tests")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--models", help="Comma-separated model names to report as pulled")
+    parser.add_argument("--tokens-per-second", type=float)
+    parser.add_argument("--ttft", type=float, help="Seconds before the first token")
+    parser.add_argument("--reply-tokens", type=int)
+    parser.add_argument("--num-parallel", type=int)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--stall-rate", type=float)
+    parser.add_argument("--stall-seconds", type=float)
+    parser.add_argument("--load-seconds", type=float, help="Load time for a model that is not resident")
+    args = parser.parse_args()
+
+    if args.models:
+        config.models = [m.strip() for m in args.models.split(",") if m.strip()]
+    for option in ("tokens_per_second", "ttft", "reply_tokens", "num_parallel", "error_rate", "stall_rate", "stall_seconds", "load_seconds"):
+        value = getattr(args, option)
+        if value is not None:
+            setattr(config, option, value)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
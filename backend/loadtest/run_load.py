@@ -0,0 +1,330 @@
+"""
+End-to-end load test against a running WellMed API.
+
+Each virtual user registers, logs in and then loops over realistic flows
+(mood check-in, micro assessment, journal post, chat turn, course browsing)
+with think time in between. Reports throughput and p50/p95/p99 per route.
+
+    python -m loadtest.run_load --base-url http://localhost:8080 --users 20 --duration 60
+    python -m loadtest.run_load --users 50 --json results.json --baseline last_release.json
+
+With --baseline, routes whose p95 regressed by more than --tolerance fail the
+run (exit code 1), as does an error rate above --max-error-rate. Run the API
+against loadtest.fake_ollama to benchmark without a GPU.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+
+FLOW_WEIGHTS = {
+    "mood": 3,
+    "micro_assessment": 2,
+    "journal": 1,
+    "chat": 2,
+    "courses": 3,
+}
+
+JOURNAL_TEXTS = [
+    "Long night shift today. Two codes back to back and no time to eat. Feeling drained but proud of the team.",
+    "Clinic ran late again. I keep bringing charting home and my family notices. Need better boundaries.",
+    "Good day for once. A patient thanked me and I actually left on time. Went for a walk after work.",
+    "Couldn't sleep after a difficult conversation with a family. Replaying it in my head.",
+]
+
+CHAT_TEXTS = [
+    "I'm exhausted after this week. Any tips for recovering on my day off?",
+    "How do I say no to extra shifts without feeling guilty?",
+    "I snapped at a colleague today and feel bad about it.",
+    "What's a quick breathing exercise I can do between patients?",
+]
+
+
+class Recorder:
+    """Latency samples and status counts per route"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, route: str, seconds: float, ok: bool) -> None:
+        self.samples[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+    async def timed(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.record(route, time.perf_counter() - started, False)
+            return None
+        self.record(route, time.perf_counter() - started, response.status_code < 400)
+        return response
+
+    def report(self) -> Dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            routes[route] = {
+                "count": len(ordered),
+                "errors": self.errors[route],
+                "rps": round(len(ordered) / elapsed, 2),
+                "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+        total = sum(route["count"] for route in routes.values())
+        errors = sum(route["errors"] for route in routes.values())
+        return {
+            "duration_seconds": round(elapsed, 1),
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "routes": routes,
+        }
+
+
+def percentile(ordered: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class VirtualUser:
+    def __init__(self, index: int, args, recorder: Recorder):
+        self.index = index
+        self.args = args
+        self.recorder = recorder
+        self.user_id: Optional[str] = None
+        self.conversation_id: Optional[str] = None
+        self.course_ids: List[str] = []
+
+    async def run(self, client: httpx.AsyncClient, deadline: float) -> None:
+        if not await self.login(client):
+            return
+        flows = list(FLOW_WEIGHTS)
+        weights = [FLOW_WEIGHTS[flow] for flow in flows]
+        while time.perf_counter() < deadline:
+            flow = random.choices(flows, weights)[0]
+            await getattr(self, f"flow_{flow}")(client)
+            await asyncio.sleep(random.expovariate(1.0 / self.args.think_time) if self.args.think_time > 0 else 0)
+
+    async def login(self, client: httpx.AsyncClient) -> bool:
+        email = f"loadtest-{self.args.run_id}-{self.index}@example.com"
+        password = "loadtest-password"
+        await self.recorder.timed(client, "POST /users/register", "POST", "/users/register", json={
+            "email": email,
+            "name": f"Load Test {self.index}",
+            "birthday": None,
+            "specialty": random.choice(["Emergency Medicine", "Nursing", "Pediatrics", "Surgery"]),
+            "created_at": datetime.utcnow().isoformat(),
+            "password": password,
+        })
+        response = await self.recorder.timed(client, "POST /users/login", "POST", "/users/login", data={
+            "username": email,
+            "password": password,
+        })
+        if response is None or response.status_code != 200:
+            return False
+        body = response.json()
+        self.user_id = str(body["user"]["id"])
+        client.headers["Authorization"] = f"Bearer {body['access_token']}"
+        return True
+
+    async def flow_mood(self, client: httpx.AsyncClient) -> None:
+        await self.recorder.timed(client, "POST /moods/", "POST", "/moods/", json={
+            "user_id": self.user_id,
+            "mood": random.choice(["Happy", "Tired", "Stressed", "Calm", "Anxious"]),
+            "reason": "load test",
+            "timestamp": datetime.utcnow().isoformat(),
+        })
+        await self.recorder.timed(client, "GET /moods/user/{id}", "GET", f"/moods/user/{self.user_id}")
+
+    async def flow_micro_assessment(self, client: httpx.AsyncClient) -> None:
+        await self.recorder.timed(client, "POST /micro/", "POST", "/micro/", json={
+            "user_id": self.user_id,
+            "fatigue_level": random.randint(1, 5),
+            "stress_level": random.randint(1, 5),
+            "work_satisfaction": random.randint(1, 5),
+            "sleep_quality": random.randint(1, 5),
+            "support_feeling": random.randint(1, 5),
+            "comments": None,
+            "submitted_at": datetime.utcnow().isoformat(),
+        })
+
+    async def flow_journal(self, client: httpx.AsyncClient) -> None:
+        await self.recorder.timed(client, "POST /journals/", "POST", "/journals/", data={
+            "user_id": self.user_id,
+            "text_content": random.choice(JOURNAL_TEXTS),
+        })
+        await self.recorder.timed(client, "GET /journals/user/{id}", "GET", f"/journals/user/{self.user_id}")
+
+    async def flow_courses(self, client: httpx.AsyncClient) -> None:
+        response = await self.recorder.timed(client, "GET /courses/", "GET", "/courses/")
+        if response is not None and response.status_code == 200:
+            self.course_ids = [course["id"] for course in response.json()]
+        await self.recorder.timed(client, "GET /courses/user/{id}/courses", "GET", f"/courses/user/{self.user_id}/courses")
+        if self.course_ids:
+            course_id = random.choice(self.course_ids)
+            await self.recorder.timed(client, "GET /courses/{id}/modules", "GET", f"/courses/{course_id}/modules")
+
+    async def flow_chat(self, client: httpx.AsyncClient) -> None:
+        if self.conversation_id is None:
+            response = await self.recorder.timed(
+                client, "POST /chatbot/conversations/", "POST", "/chatbot/conversations/",
+                params={"user_id": self.user_id}
+            )
+            if response is None or response.status_code != 200:
+                return
+            self.conversation_id = response.json()["id"]
+
+        message = {"conversation_id": self.conversation_id, "content": random.choice(CHAT_TEXTS), "role": "user"}
+        if self.args.chat_mode == "stream":
+            await self.chat_stream(client, message)
+        else:
+            await self.chat_queued(client, message)
+
+    async def chat_queued(self, client: httpx.AsyncClient, message: Dict) -> None:
+        """Post the turn, then poll like the app does until the assistant reply lands"""
+        started = time.perf_counter()
+        response = await self.recorder.timed(client, "POST /chatbot/messages/", "POST", "/chatbot/messages/", json=message)
+        if response is None or response.status_code != 200:
+            return
+
+        deadline = started + self.args.reply_timeout
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            poll = await self.recorder.timed(
+                client, "GET /chatbot/messages/{id}", "GET", f"/chatbot/messages/{self.conversation_id}"
+            )
+            if poll is not None and poll.status_code == 200:
+                messages = poll.json()
+                if messages and messages[-1]["role"] == "assistant":
+                    self.recorder.record("chat reply (end to end)", time.perf_counter() - started, True)
+                    return
+        self.recorder.record("chat reply (end to end)", time.perf_counter() - started, False)
+
+    async def chat_stream(self, client: httpx.AsyncClient, message: Dict) -> None:
+        started = time.perf_counter()
+        first_token = None
+        ok = False
+        try:
+            async with client.stream("POST", "/chatbot/messages/stream", json=message, timeout=self.args.reply_timeout) as response:
+                async for line in response.aiter_lines():
+                    if line.startswith("event: token") and first_token is None:
+                        first_token = time.perf_counter() - started
+                    elif line.startswith("event: done"):
+                        ok = True
+                    elif line.startswith("event: error"):
+                        ok = False
+                        break
+        except httpx.HTTPError:
+            ok = False
+        if first_token is not None:
+            self.recorder.record("chat stream (first token)", first_token, True)
+        self.recorder.record("chat stream (complete)", time.perf_counter() - started, ok)
+
+
+def print_report(report: Dict) -> None:
+    print()
+    print(f"{'route':<40} {'count':>7} {'errors':>7} {'rps':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for route, stats in report["routes"].items():
+        print(
+            f"{route:<40} {stats['count']:>7} {stats['errors']:>7} {stats['rps']:>7} "
+            f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9} {stats['max_ms']:>9}"
+        )
+    print(
+        f"\n{report['requests']} requests in {report['duration_seconds']}s "
+        f"({report['rps']} req/s), error rate {report['error_rate'] * 100:.2f}%"
+    )
+
+
+def compare_with_baseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions = []
+    for route, stats in report["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous or not previous.get("p95_ms"):
+            continue
+        if stats["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {previous['p95_ms']}ms -> {stats['p95_ms']}ms")
+    return regressions
+
+
+async def run(args) -> Dict:
+    recorder = Recorder()
+    deadline = time.perf_counter() + args.ramp + args.duration
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users)
+
+    async def start_user(index: int):
+        # Spread user start-up over the ramp period
+        await asyncio.sleep(args.ramp * index / max(1, args.users))
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+            await VirtualUser(index, args, recorder).run(client, deadline)
+
+    await asyncio.gather(*(start_user(index) for index in range(args.users)))
+    recorder.finished = time.perf_counter()
+    return recorder.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WellMed end-to-end load test")
+    parser.add_argument("--base-url", default="http://localhost:8080")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds of steady load after ramp-up")
+    parser.add_argument("--ramp", type=float, default=10, help="Seconds over which users start")
+    parser.add_argument("--think-time", type=float, default=2.0, help="Mean pause between flows (seconds)")
+    parser.add_argument("--chat-mode", choices=["queued", "stream"], default="queued")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--reply-timeout", type=float, default=120.0)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Earlier --json report to compare p95 against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 regression vs baseline (0.2 = 20%%)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    args.run_id = uuid.uuid4().hex[:8]
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    if report["error_rate"] > args.max_error_rate:
+        print(f"FAIL: error rate {report['error_rate']:.2%} above {args.max_error_rate:.2%}")
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"FAIL: {regression}")
+        failed = failed or bool(regressions)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
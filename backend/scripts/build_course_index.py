@@ -0,0 +1,65 @@
+# backend/scripts/build_course_index.py
+"""
+Chunk and embed course modules for retrieval in chat.
+
+    python scripts/build_course_index.py            # only modules changed since the last build
+    python scripts/build_course_index.py --force    # re-embed everything (e.g. new embedding model)
+    python scripts/build_course_index.py --search "can't sleep after night shifts"
+
+Run after seeding or editing courses. Running API processes pick up the new
+index within RAG_INDEX_REFRESH_SECONDS.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import os
+
+# Add the parent directory to Python path so we can import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import models
+from app.database import SessionLocal, engine
+from app.services.course_index import build_course_index, course_index, retrieve_passages
+from app.services.http_client import ollama_http
+from app.services.ollama_pool import ollama_pool
+
+
+async def build(force: bool):
+    db = SessionLocal()
+    try:
+        await ollama_pool.check_all()
+        counts = await build_course_index(db, force=force)
+        print(json.dumps(counts))
+    finally:
+        db.close()
+        await ollama_http.close()
+
+
+async def search(query: str, k: int):
+    try:
+        await ollama_pool.check_all()
+        for passage in await retrieve_passages(query, k):
+            print(f"{passage.score:.3f}  {passage.course_title} > {passage.module_title}")
+            print(f"       {passage.text[:160]}...")
+        print(json.dumps(course_index.stats()))
+    finally:
+        await ollama_http.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the course passage index")
+    parser.add_argument("--force", action="store_true", help="Re-embed modules even if unchanged")
+    parser.add_argument("--search", help="Query the index instead of building it")
+    parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    if args.search:
+        asyncio.run(search(args.search, args.k))
+    else:
+        asyncio.run(build(args.force))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# backend/scripts/reanalyze_journals.py
+"""
+Bulk re-analysis of journal entries, e.g. after changing the analysis prompt or model.
+
+    python scripts/reanalyze_journals.py start --stale-only            # queued for the job worker
+    python scripts/reanalyze_journals.py start --placeholder-only --now
+    python scripts/reanalyze_journals.py status <run_id>
+    python scripts/reanalyze_journals.py cancel <run_id>
+    python scripts/reanalyze_journals.py resume <run_id> [--now]
+    python scripts/reanalyze_journals.py list
+
+Queued runs process one batch per job at batch priority and respect
+BULK_REANALYSIS_HOURS; --now runs the batches in this process immediately.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import os
+from uuid import UUID
+
+# Add the parent directory to Python path so we can import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import SessionLocal
+from app.models import ReanalysisRun
+from app.services.bulk_reanalysis import (
+    cancel_reanalysis_run,
+    create_reanalysis_run,
+    reanalysis_progress,
+    resume_reanalysis_run,
+    run_reanalysis_batch,
+    schedule_reanalysis_batch,
+)
+from app.services.http_client import ollama_http
+
+
+async def run_now(run_id, generation: int = 0):
+    try:
+        while True:
+            try:
+                if not await run_reanalysis_batch(run_id, generation):
+                    break
+            except RuntimeError as e:
+                print(f"{e}; retrying in 30s (Ctrl+C to stop, resume later from the checkpoint)")
+                await asyncio.sleep(30)
+    finally:
+        await ollama_http.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk re-analysis of journal entries")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    start = commands.add_parser("start", help="Start a new run")
+    start.add_argument("--from", dest="created_from", help="Entries created on or after this ISO date")
+    start.add_argument("--to", dest="created_to", help="Entries created before this ISO date")
+    start.add_argument("--user", dest="user_id", help="Only this user's entries")
+    start.add_argument("--model", help="Only entries analyzed by this model")
+    start.add_argument("--placeholder-only", action="store_true", help="Only entries still showing pending or fallback text")
+    start.add_argument("--stale-only", action="store_true", help="Only entries not analyzed by the current model and prompt")
+    start.add_argument("--now", action="store_true", help="Run here and now instead of queueing for the worker")
+
+    for name in ("status", "cancel", "resume"):
+        command = commands.add_parser(name)
+        command.add_argument("run_id")
+        if name == "resume":
+            command.add_argument("--now", action="store_true")
+
+    commands.add_parser("list", help="Show recent runs")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == "start":
+            filters = {
+                key: value for key, value in {
+                    "created_from": args.created_from,
+                    "created_to": args.created_to,
+                    "user_id": args.user_id,
+                    "model": args.model,
+                    "placeholder_only": args.placeholder_only,
+                    "stale_only": args.stale_only,
+                }.items() if value
+            }
+            run = create_reanalysis_run(db, filters)
+            print(f"Created reanalysis run {run.id} for {run.total} entries")
+            if args.now:
+                asyncio.run(run_now(run.id))
+            else:
+                schedule_reanalysis_batch(db, run.id)
+                print("Queued for the job worker")
+            run_id = run.id
+        elif args.command == "list":
+            for run in db.query(ReanalysisRun).order_by(ReanalysisRun.created_at.desc()).limit(20):
+                print(json.dumps(reanalysis_progress(run)))
+            return
+        elif args.command == "cancel":
+            run_id = UUID(args.run_id)
+            cancel_reanalysis_run(db, run_id)
+        elif args.command == "resume":
+            run_id = UUID(args.run_id)
+            run = resume_reanalysis_run(db, run_id, queue=not args.now)
+            if args.now and run:
+                asyncio.run(run_now(run_id, run.generation))
+        else:
+            run_id = UUID(args.run_id)
+
+        db.expire_all()
+        run = db.query(ReanalysisRun).filter(ReanalysisRun.id == run_id).first()
+        if not run:
+            print(f"Reanalysis run {run_id} not found")
+            sys.exit(1)
+        print(json.dumps(reanalysis_progress(run), indent=2))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+-- Column additions for databases created before these columns existed.
+-- New tables are created automatically on startup; new columns on existing tables are not.
+-- To run:
+-- docker-compose exec db psql -U myuser -d wellmed_db -f schema_updates.sql
+
+-- Rolling conversation summaries
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summary_message_count INTEGER DEFAULT 0;
+
+-- Which model and prompt version produced each journal analysis
+ALTER TABLE journal_entries ADD COLUMN IF NOT EXISTS analysis_model VARCHAR;
+ALTER TABLE journal_entries ADD COLUMN IF NOT EXISTS analysis_prompt_version VARCHAR;
+CREATE INDEX IF NOT EXISTS ix_journal_entries_created_at ON journal_entries (created_at);
+
+-- Which model generated each assistant message
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS model_name VARCHAR;
+
+-- Since-cursor reads of a conversation's messages
+CREATE INDEX IF NOT EXISTS ix_messages_conversation_created ON messages (conversation_id, created_at);
+
+-- Explicit journal analysis status, backfilled from the placeholder and fallback texts
+ALTER TABLE journal_entries ADD COLUMN IF NOT EXISTS analysis_status VARCHAR NOT NULL DEFAULT 'complete';
+UPDATE journal_entries SET analysis_status = 'pending'
+    WHERE analysis IN (
+        'Your journal entry is being analyzed by Carely. Refresh to see the insights!',
+        'Your journal entry is being re-analyzed by Carely. Refresh to see the updated insights!'
+    );
+UPDATE journal_entries SET analysis_status = 'fallback'
+    WHERE analysis LIKE 'Thank you for taking time to reflect and journal.%';
+CREATE INDEX IF NOT EXISTS ix_journal_entries_user_status ON journal_entries (user_id, analysis_status);
+
+-- Size, content hash and duration of uploaded journal audio
+ALTER TABLE journal_entries ADD COLUMN IF NOT EXISTS audio_size_bytes INTEGER;
+ALTER TABLE journal_entries ADD COLUMN IF NOT EXISTS audio_sha256 VARCHAR(64);
+ALTER TABLE journal_entries ADD COLUMN IF NOT EXISTS audio_duration_seconds DOUBLE PRECISION;
+CREATE INDEX IF NOT EXISTS ix_journal_entries_audio_sha256 ON journal_entries (audio_sha256);
+
+-- Generation of a bulk reanalysis run's batch chain, so a resume cannot run beside the chain it replaced
+ALTER TABLE reanalysis_runs ADD COLUMN IF NOT EXISTS generation INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import uuid
+from datetime import datetime
+
+# The app reads its configuration at import time, so point it at a scratch database first
+_scratch = tempfile.mkdtemp(prefix="wellmed-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_scratch}/test.db")
+os.environ.setdefault("AUDIO_UPLOAD_DIR", os.path.join(_scratch, "audio"))
+os.environ.setdefault("RUN_JOB_WORKER_IN_API", "false")
+os.environ.setdefault("TRANSCRIPTION_BACKEND", "none")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import models
+from app.database import Base, SessionLocal, engine
+from app.utils.token import create_access_token
+
+Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def user(db):
+    db_user = models.User(
+        email=f"{uuid.uuid4().hex}@example.com",
+        name="Test Clinician",
+        specialty="Nursing",
+        password_hash="not-a-real-hash",
+        created_at=datetime.utcnow(),
+    )
+    db.add(db_user)
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
+@pytest.fixture
+def auth_headers(user):
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user.id)})}"}
+
+
+@pytest.fixture
+def client():
+    # No lifespan: startup would probe Ollama and start the job worker
+    from app.main import app
+    return TestClient(app)
@@ -0,0 +1,24 @@
+import uuid
+
+from app import models
+from app.database import SessionLocal
+from app.services.analysis_cache import AnalysisCache
+
+
+def test_cache_hit_is_counted_without_committing_the_callers_session(db, user):
+    key = uuid.uuid4().hex
+    AnalysisCache().set(key, "Rest matters.", "m", "2")
+
+    user.name = "Uncommitted Name"
+    # A fresh instance, so the lookup goes to the table rather than memory
+    assert AnalysisCache().get(db, key) == "Rest matters."
+    db.rollback()
+
+    check = SessionLocal()
+    try:
+        assert check.query(models.User).filter(models.User.id == user.id).one().name == "Test Clinician"
+        row = check.query(models.JournalAnalysisCache).filter(models.JournalAnalysisCache.cache_key == key).one()
+        assert row.hit_count == 1
+        assert row.last_hit_at is not None
+    finally:
+        check.close()
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from app.models import JournalEntry
+from app.services import audio_uploads
+from app.services.audio_uploads import merge_range, missing_ranges, contiguous_bytes
+
+
+def _start(client, headers, data, **extra):
+    response = client.post(
+        "/journals/uploads",
+        json={"total_bytes": len(data), "filename": "memo.wav", **extra},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def _put(client, headers, upload_id, offset, chunk):
+    return client.put(f"/journals/uploads/{upload_id}?offset={offset}", content=chunk, headers=headers)
+
+
+def test_merge_range_joins_overlapping_and_adjacent_ranges():
+    ranges = merge_range([], 10, 20)
+    ranges = merge_range(ranges, 0, 5)
+    ranges = merge_range(ranges, 20, 30)
+    assert ranges == [[0, 5], [10, 30]]
+    assert missing_ranges(ranges, 40) == [[5, 10], [30, 40]]
+    assert contiguous_bytes(ranges) == 5
+    assert contiguous_bytes(merge_range(ranges, 5, 10)) == 30
+
+
+def test_out_of_order_chunks_resume_and_finalize(client, auth_headers):
+    data = os.urandom(5000)
+    upload_id = _start(client, auth_headers, data, sha256=hashlib.sha256(data).hexdigest())
+
+    status = _put(client, auth_headers, upload_id, 3000, data[3000:]).json()
+    assert status["offset"] == 0
+    assert status["missing_ranges"] == [[0, 3000]]
+
+    incomplete = client.post(f"/journals/uploads/{upload_id}/finalize", headers=auth_headers)
+    assert incomplete.status_code == 409
+
+    _put(client, auth_headers, upload_id, 0, data[:1000])
+    status = client.get(f"/journals/uploads/{upload_id}", headers=auth_headers).json()
+    assert status["offset"] == 1000
+    assert status["received_bytes"] == 3000
+    assert status["missing_ranges"] == [[1000, 3000]]
+
+    assert _put(client, auth_headers, upload_id, 1000, data[1000:3000]).json()["missing_ranges"] == []
+
+    entry = client.post(f"/journals/uploads/{upload_id}/finalize", json={"text_content": "Night shift"}, headers=auth_headers)
+    assert entry.status_code == 200
+    assert entry.json()["text_content"] == "Night shift"
+    assert entry.json()["audio_sha256"] == hashlib.sha256(data).hexdigest()
+
+    again = client.post(f"/journals/uploads/{upload_id}/finalize", headers=auth_headers)
+    assert again.status_code == 200
+    assert again.json()["id"] == entry.json()["id"]
+
+
+def test_chunk_past_declared_size_is_rejected(client, auth_headers):
+    upload_id = _start(client, auth_headers, b"0123456789")
+    response = _put(client, auth_headers, upload_id, 8, b"abc")
+    assert response.status_code == 416
+
+
+def test_checksum_mismatch_asks_for_the_whole_file_again(client, auth_headers):
+    data = b"abcd"
+    upload_id = _start(client, auth_headers, data, sha256="0" * 64)
+    _put(client, auth_headers, upload_id, 0, data)
+
+    response = client.post(f"/journals/uploads/{upload_id}/finalize", headers=auth_headers)
+    assert response.status_code == 422
+    status = client.get(f"/journals/uploads/{upload_id}", headers=auth_headers).json()
+    assert status["status"] == "open"
+    assert status["missing_ranges"] == [[0, 4]]
+
+
+def test_concurrent_finalize_creates_one_entry(client, auth_headers, db, user, monkeypatch):
+    data = os.urandom(4096)
+    upload_id = _start(client, auth_headers, data)
+    _put(client, auth_headers, upload_id, 0, data)
+
+    # Slow assembly down so the second finalize arrives while the first holds its claim
+    hash_file = audio_uploads._hash_file
+
+    def slow_hash(path):
+        time.sleep(0.5)
+        return hash_file(path)
+
+    monkeypatch.setattr(audio_uploads, "_hash_file", slow_hash)
+
+    responses = []
+
+    def finalize():
+        responses.append(client.post(f"/journals/uploads/{upload_id}/finalize", headers=auth_headers))
+
+    threads = [threading.Thread(target=finalize) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].json()["id"] == responses[1].json()["id"]
+    entries = db.query(JournalEntry).filter(
+        JournalEntry.user_id == user.id,
+        JournalEntry.audio_sha256 == hashlib.sha256(data).hexdigest()
+    ).count()
+    assert entries == 1
+
+
+def test_chunk_racing_finalize_is_refused_not_written_into_stored_audio(client, auth_headers, db, tmp_path):
+    data = os.urandom(2048)
+    upload_id = _start(client, auth_headers, data)
+    _put(client, auth_headers, upload_id, 0, data)
+    path = audio_uploads.upload_path(db.query(audio_uploads.AudioUpload).filter_by(id=uuid.UUID(upload_id)).one())
+
+    # Finalize holds the file; a late chunk for the still-open upload has to wait
+    lock = audio_uploads._lock_for_finalize(path)
+    responses = []
+    late = threading.Thread(target=lambda: responses.append(_put(client, auth_headers, upload_id, 0, b"x" * 16)))
+    late.start()
+    time.sleep(0.3)
+    assert responses == []
+
+    stored = tmp_path / "stored.wav"
+    os.replace(path, stored)
+    lock.close()
+    late.join()
+
+    assert responses[0].status_code == 409
+    assert stored.read_bytes() == data
+
+
+def test_chunk_after_the_file_was_moved_is_refused(client, auth_headers, db):
+    upload_id = _start(client, auth_headers, b"0123456789")
+    upload = db.query(audio_uploads.AudioUpload).filter_by(id=uuid.UUID(upload_id)).one()
+    os.remove(audio_uploads.upload_path(upload))
+
+    response = _put(client, auth_headers, upload_id, 0, b"0123")
+    assert response.status_code == 409
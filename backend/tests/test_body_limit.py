@@ -0,0 +1,59 @@
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.utils.body_limit import BodySizeLimitMiddleware
+
+
+def _app(calls):
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, limits={("POST", "/upload/"): 1000})
+
+    @app.post("/upload/")
+    async def upload(audio_file: UploadFile = File(...)):
+        calls.append(audio_file.filename)
+        return {"size": len(await audio_file.read())}
+
+    @app.post("/other")
+    async def other(audio_file: UploadFile = File(...)):
+        return {"size": len(await audio_file.read())}
+
+    return TestClient(app)
+
+
+def test_body_within_the_limit_reaches_the_route():
+    calls = []
+    response = _app(calls).post("/upload/", files={"audio_file": ("a.wav", b"x" * 100)})
+    assert response.status_code == 200
+    assert calls == ["a.wav"]
+
+
+def test_declared_length_over_the_limit_is_refused_before_parsing():
+    calls = []
+    response = _app(calls).post("/upload", files={"audio_file": ("a.wav", b"x" * 5000)})
+    assert response.status_code == 413
+    assert "1000 bytes" in response.json()["detail"]
+    assert calls == []
+
+
+def test_streamed_body_is_cut_off_at_the_limit():
+    calls = []
+    chunks_sent = []
+
+    def body():
+        for _ in range(100):
+            chunks_sent.append(1)
+            yield b"y" * 100
+
+    # A generator body goes out chunked, without Content-Length
+    response = _app(calls).post(
+        "/upload/",
+        content=body(),
+        headers={"content-type": "multipart/form-data; boundary=xyz"},
+    )
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_other_routes_are_not_limited():
+    response = _app([]).post("/other", files={"audio_file": ("a.wav", b"x" * 5000)})
+    assert response.status_code == 200
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import JournalEntry, ReanalysisRun
+from app.services import bulk_reanalysis
+from app.services.bulk_reanalysis import (
+    cancel_reanalysis_run,
+    create_reanalysis_run,
+    resume_reanalysis_run,
+    run_reanalysis_batch,
+)
+
+
+@pytest.fixture
+def run(db, user, monkeypatch):
+    base = datetime(2026, 3, 1, 8, 0, 0)
+    for i in range(4):
+        db.add(JournalEntry(user_id=user.id, text_content=f"entry {i}", analysis="old", created_at=base + timedelta(minutes=i)))
+    db.commit()
+
+    analyzed = []
+
+    async def analyze_entry(session, entry, priority=None):
+        analyzed.append(entry.text_content)
+        return True
+
+    monkeypatch.setattr(bulk_reanalysis, "analyze_entry", analyze_entry)
+    monkeypatch.setattr(bulk_reanalysis, "BULK_REANALYSIS_BATCH_SIZE", 2)
+    run = create_reanalysis_run(db, {"user_id": str(user.id)})
+    run.analyzed = analyzed
+    return run
+
+
+def _reload(db, run):
+    db.expire_all()
+    return db.query(ReanalysisRun).filter(ReanalysisRun.id == run.id).first()
+
+
+def test_batch_queued_before_a_cancel_does_nothing_after_resume(db, run):
+    assert asyncio.run(run_reanalysis_batch(run.id, 0))
+
+    cancel_reanalysis_run(db, run.id)
+    resumed = resume_reanalysis_run(db, run.id, queue=False)
+    assert resumed.generation == 1
+
+    # The old chain's next job (generation 0) is stale; only the resumed chain moves the cursor
+    assert not asyncio.run(run_reanalysis_batch(run.id, 0))
+    assert asyncio.run(run_reanalysis_batch(run.id, 1))
+    assert not asyncio.run(run_reanalysis_batch(run.id, 1))
+
+    finished = _reload(db, run)
+    assert finished.status == "done"
+    assert (finished.processed, finished.succeeded) == (4, 4)
+    assert sorted(run.analyzed) == ["entry 0", "entry 1", "entry 2", "entry 3"]
+
+
+def test_batch_running_across_a_resume_does_not_checkpoint(db, run, monkeypatch):
+    async def analyze_while_resumed(session, entry, priority=None):
+        # Cancel and resume land while this batch is being analyzed
+        if entry.text_content == "entry 0":
+            cancel_reanalysis_run(db, run.id)
+            resume_reanalysis_run(db, run.id, queue=False)
+        return True
+
+    monkeypatch.setattr(bulk_reanalysis, "analyze_entry", analyze_while_resumed)
+    assert not asyncio.run(run_reanalysis_batch(run.id, 0))
+
+    resumed = _reload(db, run)
+    assert (resumed.processed, resumed.last_entry_id, resumed.generation) == (0, None, 1)
@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import pytest
+
+from app import crud
+from app.models import Job
+from app.routes import chatbot as chatbot_routes
+from app.services.ai_jobs import CHAT_REPLY_JOB
+from app.utils.token import create_access_token
+
+
+@pytest.fixture
+def conversation(db, user):
+    return crud.create_conversation(db, user.id)
+
+
+def _socket_url(conversation, user):
+    return f"/chatbot/ws/{conversation.id}?token={create_access_token({'sub': str(user.id)})}"
+
+
+def _reply_jobs(db, conversation):
+    db.expire_all()
+    return [
+        job for job in db.query(Job).filter(Job.job_type == CHAT_REPLY_JOB).all()
+        if job.payload["conversation_id"] == str(conversation.id)
+    ]
+
+
+def test_reply_is_streamed_to_the_socket(client, db, user, conversation, monkeypatch):
+    async def fake_stream(*args, **kwargs):
+        for token in ("Take ", "a ", "breath."):
+            yield token
+
+    monkeypatch.setattr(chatbot_routes, "stream_ai_response", fake_stream)
+
+    with client.websocket_connect(_socket_url(conversation, user)) as websocket:
+        websocket.send_json({"type": "message", "content": "Long shift today"})
+        events = []
+        while not events or events[-1]["event"] != "done":
+            events.append(websocket.receive_json())
+
+    assert events[0]["event"] == "user_message"
+    assert "".join(e["data"]["content"] for e in events if e["event"] == "token") == "Take a breath."
+    assert events[-1]["data"]["content"] == "Take a breath."
+    assert _reply_jobs(db, conversation) == []
+
+
+def test_disconnect_mid_reply_hands_the_reply_to_the_job_worker(client, db, user, conversation, monkeypatch):
+    async def stalled_stream(*args, **kwargs):
+        yield "Thinking"
+        await asyncio.sleep(30)
+        yield "never sent"
+
+    monkeypatch.setattr(chatbot_routes, "stream_ai_response", stalled_stream)
+
+    with client.websocket_connect(_socket_url(conversation, user)) as websocket:
+        websocket.send_json({"type": "message", "content": "Can't sleep"})
+        assert websocket.receive_json()["event"] == "user_message"
+        assert websocket.receive_json()["event"] == "token"
+
+    # The reply task is cancelled with the socket; its reply becomes a queued job
+    deadline = time.monotonic() + 5
+    while not _reply_jobs(db, conversation) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(_reply_jobs(db, conversation)) == 1
+    assert [m.role for m in crud.get_conversation_messages(db, conversation.id)] == ["user"]
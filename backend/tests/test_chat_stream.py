@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app import crud
+from app.routes import chatbot as chatbot_routes
+from app.schemas import MessageCreate
+
+
+@pytest.fixture
+def conversation(db, user):
+    return crud.create_conversation(db, user.id)
+
+
+def _assistant_messages(db, conversation):
+    db.expire_all()
+    return [m for m in crud.get_conversation_messages(db, conversation.id) if m.role == "assistant"]
+
+
+def test_broken_stream_saves_the_fallback_not_the_partial_reply(client, db, auth_headers, conversation, monkeypatch):
+    async def broken_stream(*args, **kwargs):
+        yield "You might try "
+        raise ConnectionError("Ollama went away")
+
+    monkeypatch.setattr(chatbot_routes, "stream_ai_response", broken_stream)
+
+    response = client.post(
+        "/chatbot/messages/stream",
+        json={"conversation_id": str(conversation.id), "content": "Any tips?", "role": "user"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 200
+    assert "event: error" in response.text
+
+    saved = _assistant_messages(db, conversation)
+    assert [m.content for m in saved] == [chatbot_routes.FALLBACK_REPLY]
+    assert saved[0].model_name is None
+
+
+def test_client_leaving_mid_stream_hands_the_reply_off(db, user, conversation, monkeypatch):
+    handed_off = []
+
+    async def stalled_stream(*args, **kwargs):
+        yield "Thinking"
+        await asyncio.sleep(30)
+
+    monkeypatch.setattr(chatbot_routes, "stream_ai_response", stalled_stream)
+    monkeypatch.setattr(chatbot_routes, "_hand_off_reply", lambda conversation_id, user_id: handed_off.append(conversation_id))
+
+    async def leave_after_first_token():
+        response = await chatbot_routes.stream_message(
+            MessageCreate(conversation_id=conversation.id, content="Rough night", role="user"), db=db, current_user=user
+        )
+        events = response.body_iterator
+        assert "user_message" in await events.__anext__()
+        assert "token" in await events.__anext__()
+        await events.aclose()
+
+    asyncio.run(leave_after_first_token())
+    assert handed_off == [conversation.id]
+    assert _assistant_messages(db, conversation) == []
@@ -0,0 +1,136 @@
+import asyncio
+from types import SimpleNamespace
+
+from app import crud, schemas
+from app.services import chatbot, context_window
+from app.services.context_window import (
+    HISTORY_TOKEN_BUDGET,
+    TRUNCATION_MARKER,
+    build_history_window,
+    estimate_tokens,
+    prepare_conversation_history,
+    refresh_conversation_summary,
+    truncate_to_tokens,
+)
+
+# About 395 tokens with overhead, so three fit the default 1500-token budget
+LONG = "word " * 300
+
+
+def _messages(count):
+    return [SimpleNamespace(role="user" if i % 2 == 0 else "assistant", content=f"m{i} {LONG}") for i in range(count)]
+
+
+def _record_refreshes(monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(context_window, "schedule_summary_refresh", lambda conversation_id, upto: scheduled.append(upto))
+    return scheduled
+
+
+def test_window_keeps_the_newest_messages_within_budget():
+    messages = [{"role": "user", "content": f"m{i} {LONG}"} for i in range(5)]
+    window, first_index = build_history_window(messages)
+    assert first_index == 2
+    assert [m["content"][:2] for m in window] == ["m2", "m3", "m4"]
+
+
+def test_oversized_newest_message_is_truncated_to_the_budget():
+    text = "Start of the story. " + "filler " * 2000 + "What should I do?"
+    window, first_index = build_history_window([{"role": "user", "content": text}], budget=200)
+    assert first_index == 0
+    content = window[0]["content"]
+    assert estimate_tokens(content) <= 200
+    assert content.startswith("Start of the story.")
+    assert content.endswith("What should I do?")
+    assert TRUNCATION_MARKER in content
+    assert truncate_to_tokens("short", 200) == "short"
+
+
+def test_unsummarized_remainder_stays_in_the_prompt(monkeypatch):
+    scheduled = _record_refreshes(monkeypatch)
+    conversation = SimpleNamespace(id="c", summary=None, summary_message_count=0)
+
+    window, summary = prepare_conversation_history(conversation, _messages(5))
+    # Two messages fell out, fewer than a summary batch: carried ahead of the window, shortened
+    assert scheduled == []
+    assert [m["content"][:2] for m in window] == ["m0", "m1", "m2", "m3", "m4"]
+    share = HISTORY_TOKEN_BUDGET // context_window.SUMMARY_REFRESH_MESSAGES
+    assert all(estimate_tokens(m["content"]) <= share for m in window[:2])
+
+
+def test_full_batch_is_summarized_and_newest_pending_carried(monkeypatch):
+    scheduled = _record_refreshes(monkeypatch)
+    conversation = SimpleNamespace(id="c", summary="Earlier: night shifts.", summary_message_count=1)
+
+    window, summary = prepare_conversation_history(conversation, _messages(9))
+    # Messages 1-5 are unsummarized and out of the window: one refresh covers all of them
+    assert scheduled == [6]
+    assert summary == "Earlier: night shifts."
+    assert [m["content"][:2] for m in window] == ["m3", "m4", "m5", "m6", "m7", "m8"]
+
+
+def test_summarized_messages_are_not_carried(monkeypatch):
+    scheduled = _record_refreshes(monkeypatch)
+    conversation = SimpleNamespace(id="c", summary="Everything so far.", summary_message_count=6)
+
+    window, _ = prepare_conversation_history(conversation, _messages(9))
+    assert scheduled == []
+    assert [m["content"][:2] for m in window] == ["m6", "m7", "m8"]
+
+
+def test_refresh_summarizes_from_the_last_count_and_records_it(db, user, monkeypatch):
+    conversation = crud.create_conversation(db, user.id)
+    for i in range(6):
+        crud.create_message(db, schemas.MessageCreate(conversation_id=conversation.id, content=f"turn {i}", role="user"))
+
+    requests = []
+
+    async def summarize(previous, messages):
+        requests.append((previous, [m["content"] for m in messages]))
+        return True, f"summary of {len(messages)}"
+
+    monkeypatch.setattr(chatbot, "summarize_conversation", summarize)
+
+    asyncio.run(refresh_conversation_summary(conversation.id, 4))
+    asyncio.run(refresh_conversation_summary(conversation.id, 6))
+
+    assert requests == [
+        (None, ["turn 0", "turn 1", "turn 2", "turn 3"]),
+        ("summary of 4", ["turn 4", "turn 5"]),
+    ]
+    db.refresh(conversation)
+    assert conversation.summary == "summary of 2"
+    assert conversation.summary_message_count == 6
+
+
+def test_failed_refresh_leaves_the_count(db, user, monkeypatch):
+    conversation = crud.create_conversation(db, user.id)
+    for i in range(4):
+        crud.create_message(db, schemas.MessageCreate(conversation_id=conversation.id, content=f"turn {i}", role="user"))
+
+    async def summarize(previous, messages):
+        return False, ""
+
+    monkeypatch.setattr(chatbot, "summarize_conversation", summarize)
+    asyncio.run(refresh_conversation_summary(conversation.id, 4))
+
+    db.refresh(conversation)
+    assert not conversation.summary_message_count
+
+
+def test_refresh_that_lost_a_race_to_another_process_is_dropped(db, user, monkeypatch):
+    conversation = crud.create_conversation(db, user.id)
+    for i in range(4):
+        crud.create_message(db, schemas.MessageCreate(conversation_id=conversation.id, content=f"turn {i}", role="user"))
+
+    async def summarize(previous, messages):
+        # Another worker stores its summary of the same turns while this one is generating
+        crud.update_conversation_summary(db, conversation.id, "their summary", 4)
+        return True, "our summary"
+
+    monkeypatch.setattr(chatbot, "summarize_conversation", summarize)
+    asyncio.run(refresh_conversation_summary(conversation.id, 4))
+
+    db.refresh(conversation)
+    assert conversation.summary == "their summary"
+    assert conversation.summary_message_count == 4
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from app.services import chatbot, course_index as course_index_module
+from app.services.course_index import Passage, course_index
+
+
+def _indexed(monkeypatch):
+    # A loaded, fresh index, so retrieval goes straight to the embedding call
+    monkeypatch.setattr(course_index, "passages", [Passage("c", "Course", "m", "Module", "Box breathing")])
+    monkeypatch.setattr(course_index, "embed_model", "embed-test")
+    monkeypatch.setattr(course_index, "loaded_at", time.monotonic())
+
+
+def _reply(monkeypatch):
+    sent = []
+
+    async def stream_chat(messages, task, model, **kwargs):
+        sent.append(messages)
+        yield "Take a breath."
+
+    monkeypatch.setattr(chatbot.inference_gateway, "stream_chat", stream_chat)
+
+    async def collect():
+        history = [{"role": "user", "content": "I can't switch off after nights"}]
+        return [piece async for piece in chatbot.stream_ai_response(history, model="chat-test")]
+
+    return asyncio.run(collect()), sent
+
+
+def test_slow_retrieval_does_not_hold_up_the_reply(monkeypatch):
+    _indexed(monkeypatch)
+
+    async def slow_embed(texts, model):
+        await asyncio.sleep(5)
+        return [[1.0]]
+
+    monkeypatch.setattr(course_index_module.inference_gateway, "embed", slow_embed)
+
+    started = time.monotonic()
+    pieces, sent = _reply(monkeypatch)
+    assert time.monotonic() - started < 1
+    assert pieces == ["Take a breath."]
+    assert "Relevant WellMed course material" not in str(sent[0])
+
+
+def test_failed_retrieval_still_replies(monkeypatch):
+    _indexed(monkeypatch)
+
+    async def broken_embed(texts, model):
+        raise ConnectionError("embedding backend unreachable")
+
+    monkeypatch.setattr(course_index_module.inference_gateway, "embed", broken_embed)
+
+    pieces, sent = _reply(monkeypatch)
+    assert pieces == ["Take a breath."]
+    assert "Relevant WellMed course material" not in str(sent[0])
+
+
+def test_fast_retrieval_adds_course_material(monkeypatch):
+    _indexed(monkeypatch)
+    monkeypatch.setattr(course_index, "vectors", course_index_module.np.ones((1, 1), dtype="float32") if course_index_module.np is not None else [course_index_module._normalize([1.0])])
+
+    async def embed(texts, model):
+        return [[1.0]]
+
+    monkeypatch.setattr(course_index_module.inference_gateway, "embed", embed)
+
+    pieces, sent = _reply(monkeypatch)
+    assert pieces == ["Take a breath."]
+    assert "Course > Module" in str(sent[0])
@@ -0,0 +1,96 @@
+import asyncio
+
+import httpx
+
+from app.services.conversation_sessions import conversation_sessions
+from app.services.inference_gateway import UNAVAILABLE_RESPONSE, InferenceGateway
+
+
+def test_concurrent_identical_turns_keep_each_conversations_context(monkeypatch):
+    gateway = InferenceGateway(backend=object())
+    calls = []
+
+    async def no_chat_api():
+        return False
+
+    async def generate(prompt, task, model, conversation_id=None, context=None):
+        calls.append(conversation_id)
+        await asyncio.sleep(0.05)
+        return True, "Try a short walk.", [len(calls), 2, 3]
+
+    monkeypatch.setattr(gateway.capabilities, "supports_chat", no_chat_api)
+    monkeypatch.setattr(gateway, "generate", generate)
+
+    history = [{"role": "user", "content": "Any tips for a break?"}]
+    messages = [{"role": "system", "content": "You are Carely."}, *history]
+
+    async def both():
+        return await asyncio.gather(
+            gateway.complete(messages, "chat", "m", conversation_id="conv-a", message_history=history),
+            gateway.complete(messages, "chat", "m", conversation_id="conv-b", message_history=history),
+            gateway.complete(messages, "chat", "m", conversation_id="conv-b", message_history=history),
+        )
+
+    replies = asyncio.run(both())
+    assert replies == [(True, "Try a short walk.")] * 3
+    # The two calls for conv-b shared one generation; conv-a got its own
+    assert sorted(calls) == ["conv-a", "conv-b"]
+
+    follow_up = history + [
+        {"role": "assistant", "content": "Try a short walk."},
+        {"role": "user", "content": "And after nights?"},
+    ]
+    assert conversation_sessions.lookup("m:conv-a", follow_up) is not None
+    assert conversation_sessions.lookup("m:conv-b", follow_up) is not None
+
+
+def _response(status, text):
+    return httpx.Response(status, text=text, request=httpx.Request("POST", "http://ollama/api/chat"))
+
+
+class _ChatBackend:
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    async def post(self, path, **kwargs):
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+def _complete_with(monkeypatch, outcome):
+    gateway = InferenceGateway(backend=_ChatBackend(outcome))
+    generated = []
+
+    async def chat_api():
+        return True
+
+    async def generate(prompt, task, model, conversation_id=None, context=None):
+        generated.append(prompt)
+        return True, "From generate.", None
+
+    monkeypatch.setattr(gateway.capabilities, "supports_chat", chat_api)
+    monkeypatch.setattr(gateway.capabilities, "mark_stale", lambda: None)
+    monkeypatch.setattr(gateway, "generate", generate)
+
+    messages = [{"role": "user", "content": f"Any tips? {id(outcome)}"}]
+    return asyncio.run(gateway.complete(messages, "chat", "m")), generated
+
+
+def test_chat_timeout_does_not_retry_on_generate(monkeypatch):
+    reply, generated = _complete_with(monkeypatch, httpx.ReadTimeout("too slow"))
+    assert reply == (False, UNAVAILABLE_RESPONSE)
+    assert generated == []
+
+
+def test_chat_server_error_does_not_retry_on_generate(monkeypatch):
+    reply, generated = _complete_with(monkeypatch, _response(500, "boom"))
+    assert reply == (False, UNAVAILABLE_RESPONSE)
+    assert generated == []
+
+
+def test_missing_chat_endpoint_falls_back_to_generate(monkeypatch):
+    for status in (404, 405):
+        reply, generated = _complete_with(monkeypatch, _response(status, "404 page not found"))
+        assert reply == (True, "From generate.")
+        assert len(generated) == 1
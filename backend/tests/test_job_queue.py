@@ -0,0 +1,151 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import Job
+from app.services import job_queue
+from app.services.job_queue import JobHandler, JobWorker, claim_job, enqueue_job, requeue_stale_jobs, retry_delay
+from app.services.llm_scheduler import Priority
+
+
+# Jobs are claimed as the worker that then runs them
+WORKER_ID = JobWorker().worker_id
+
+
+@pytest.fixture
+def job_type():
+    # Each test gets its own queue, so jobs left by other tests are never claimed
+    return f"test_{uuid.uuid4().hex[:8]}"
+
+
+def _run(job, fn, on_give_up=None):
+    worker = JobWorker()
+    worker._running[job.job_type] = 0
+    asyncio.run(worker._run(job, JobHandler(fn=fn, concurrency=1, on_give_up=on_give_up)))
+
+
+def _reload(db, job_id):
+    db.expire_all()
+    return db.query(Job).filter(Job.id == uuid.UUID(str(job_id))).first()
+
+
+def test_claim_takes_due_jobs_by_priority_then_age(db, job_type):
+    batch = enqueue_job(db, job_type, {"n": "batch"}, priority=Priority.BATCH)
+    enqueue_job(db, job_type, {"n": "later"}, priority=Priority.INTERACTIVE, run_after=datetime.utcnow() + timedelta(hours=1))
+    first = enqueue_job(db, job_type, {"n": "first"}, priority=Priority.BACKGROUND)
+    second = enqueue_job(db, job_type, {"n": "second"}, priority=Priority.BACKGROUND)
+
+    claimed = [claim_job(db, job_type, WORKER_ID) for _ in range(4)]
+    assert [job.payload["n"] if job else None for job in claimed] == ["first", "second", "batch", None]
+    assert [job.id for job in claimed[:3]] == [str(first.id), str(second.id), str(batch.id)]
+
+    row = _reload(db, first.id)
+    assert (row.status, row.locked_by, row.attempts) == ("running", WORKER_ID, 1)
+
+
+def test_failed_attempt_is_retried_later(db, job_type):
+    enqueue_job(db, job_type, {}, max_attempts=3)
+    job = claim_job(db, job_type, WORKER_ID)
+
+    async def fail(session, payload):
+        raise ValueError("Ollama timed out")
+
+    _run(job, fail)
+    row = _reload(db, job.id)
+    assert row.status == "queued"
+    assert row.locked_by is None
+    assert row.last_error == "ValueError: Ollama timed out"
+    assert row.run_after > datetime.utcnow()
+    # Not due yet, so not claimable
+    assert claim_job(db, job_type, WORKER_ID) is None
+
+
+def test_last_failed_attempt_gives_up_once(db, job_type):
+    enqueue_job(db, job_type, {"entry": 1}, max_attempts=1)
+    job = claim_job(db, job_type, WORKER_ID)
+    gave_up = []
+
+    async def fail(session, payload):
+        raise RuntimeError("still down")
+
+    async def give_up(session, payload, error):
+        gave_up.append((payload, error))
+
+    _run(job, fail, on_give_up=give_up)
+    row = _reload(db, job.id)
+    assert row.status == "failed"
+    assert row.finished_at is not None
+    assert gave_up == [({"entry": 1}, "RuntimeError: still down")]
+
+
+def test_successful_job_is_done(db, job_type):
+    enqueue_job(db, job_type, {"x": 1})
+    job = claim_job(db, job_type, WORKER_ID)
+    seen = []
+
+    async def work(session, payload):
+        seen.append(payload)
+
+    _run(job, work)
+    assert seen == [{"x": 1}]
+    assert _reload(db, job.id).status == "done"
+
+
+def test_cancelled_job_goes_back_without_spending_an_attempt(db, job_type):
+    enqueue_job(db, job_type, {})
+    job = claim_job(db, job_type, WORKER_ID)
+
+    async def interrupted(session, payload):
+        raise asyncio.CancelledError()
+
+    with pytest.raises(asyncio.CancelledError):
+        _run(job, interrupted)
+    row = _reload(db, job.id)
+    assert (row.status, row.attempts) == ("queued", 0)
+
+
+def test_result_is_dropped_once_another_worker_owns_the_job(db, job_type):
+    enqueue_job(db, job_type, {}, max_attempts=1)
+    job = claim_job(db, job_type, WORKER_ID)
+    gave_up = []
+
+    async def reaped_then_fail(session, payload):
+        # The lock expired mid-run and another worker re-claimed the job
+        row = session.query(Job).filter(Job.id == uuid.UUID(job.id)).first()
+        row.locked_by = "worker-b"
+        session.commit()
+        raise RuntimeError("too slow")
+
+    async def give_up(session, payload, error):
+        gave_up.append(error)
+
+    _run(job, reaped_then_fail, on_give_up=give_up)
+    row = _reload(db, job.id)
+    assert (row.status, row.locked_by) == ("running", "worker-b")
+    assert gave_up == []
+
+
+def test_stale_locks_are_requeued_or_given_up(db, job_type):
+    expired = datetime.utcnow() - timedelta(seconds=job_queue.JOB_LOCK_TIMEOUT + 60)
+    retryable = Job(job_type=job_type, payload={}, status="running", attempts=1, max_attempts=3,
+                    locked_by="gone", locked_at=expired, run_after=expired)
+    exhausted = Job(job_type=job_type, payload={"last": True}, status="running", attempts=3, max_attempts=3,
+                    locked_by="gone", locked_at=expired, run_after=expired)
+    fresh = Job(job_type=job_type, payload={}, status="running", attempts=1, max_attempts=3,
+                locked_by="alive", locked_at=datetime.utcnow(), run_after=expired)
+    db.add_all([retryable, exhausted, fresh])
+    db.commit()
+
+    given_up = requeue_stale_jobs(db)
+    assert [job.payload for job in given_up if job.job_type == job_type] == [{"last": True}]
+    assert _reload(db, retryable.id).status == "queued"
+    assert _reload(db, exhausted.id).status == "failed"
+    assert _reload(db, fresh.id).status == "running"
+
+
+def test_retry_delay_backs_off_with_jitter_up_to_the_cap():
+    for attempts in range(1, 12):
+        delay = min(job_queue.JOB_RETRY_MAX_SECONDS, job_queue.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        assert delay / 2 <= retry_delay(attempts) <= delay
@@ -0,0 +1,43 @@
+import threading
+import time
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app import crud, schemas
+from app.services.ai_jobs import ANALYSIS_PENDING_TEXT, ANALYSIS_STATUS_COMPLETE, publish_analysis_status
+
+
+def _pending_entry(db, user):
+    entry = schemas.JournalEntryCreate(user_id=user.id, text_content="Tough night", created_at=datetime.utcnow())
+    return crud.create_journal_entry(db, entry, analysis=ANALYSIS_PENDING_TEXT)
+
+
+def test_pending_analysis_is_returned_when_the_wait_ends(client, auth_headers, db, user):
+    entry = _pending_entry(db, user)
+    response = client.get(f"/journals/{entry.id}/analysis?wait=0.3", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["analysis_status"] == "pending"
+
+
+def test_long_poll_returns_the_analysis_once_stored(auth_headers, db, user):
+    from app.main import app
+
+    entry = _pending_entry(db, user)
+
+    def analyze_later():
+        time.sleep(0.3)
+        entry.analysis = "You handled a hard shift."
+        entry.analysis_status = ANALYSIS_STATUS_COMPLETE
+        db.commit()
+        publish_analysis_status(entry)
+
+    with TestClient(app) as client:
+        worker = threading.Thread(target=analyze_later)
+        worker.start()
+        started = time.monotonic()
+        response = client.get(f"/journals/{entry.id}/analysis?wait=10", headers=auth_headers)
+        worker.join()
+
+    assert response.json()["analysis"] == "You handled a hard shift."
+    assert time.monotonic() - started < 5
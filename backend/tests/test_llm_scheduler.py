@@ -0,0 +1,65 @@
+import asyncio
+
+from app.services.llm_scheduler import LLMScheduler, Priority
+
+
+async def _serve_in_order(scheduler, requests):
+    """Queue `requests` (label, priority, user) behind a held slot and return the order they get it"""
+    served = []
+    await scheduler.acquire(Priority.INTERACTIVE, "holder")
+
+    async def request(label, priority, user_id):
+        async with scheduler.slot(priority, user_id):
+            served.append(label)
+
+    tasks = []
+    for label, priority, user_id in requests:
+        tasks.append(asyncio.create_task(request(label, priority, user_id)))
+        await asyncio.sleep(0)  # Queue in submission order
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return served
+
+
+def test_waiters_are_served_by_priority_class():
+    served = asyncio.run(_serve_in_order(LLMScheduler(max_in_flight=1), [
+        ("bulk", Priority.BATCH, "a"),
+        ("journal", Priority.BACKGROUND, "b"),
+        ("chat", Priority.INTERACTIVE, "c"),
+        ("chat-2", Priority.INTERACTIVE, "d"),
+    ]))
+    assert served == ["chat", "chat-2", "journal", "bulk"]
+
+
+def test_users_take_turns_within_a_class():
+    served = asyncio.run(_serve_in_order(LLMScheduler(max_in_flight=1), [
+        ("a1", Priority.BACKGROUND, "a"),
+        ("a2", Priority.BACKGROUND, "a"),
+        ("a3", Priority.BACKGROUND, "a"),
+        ("b1", Priority.BACKGROUND, "b"),
+    ]))
+    assert served == ["a1", "b1", "a2", "a3"]
+
+
+def test_cancelled_waiter_does_not_keep_a_slot():
+    async def scenario():
+        scheduler = LLMScheduler(max_in_flight=1)
+        await scheduler.acquire(Priority.INTERACTIVE, "holder")
+        waiter = asyncio.create_task(scheduler.acquire(Priority.BATCH, "a"))
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth(Priority.BATCH) == 1
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        scheduler.release()
+        assert scheduler.stats()["in_flight"] == 0
+        assert scheduler.queue_depth(Priority.BATCH) == 0
+
+    asyncio.run(scenario())
+
+
+def test_each_process_takes_its_configured_share_of_slots(monkeypatch):
+    from app.services import llm_scheduler
+
+    assert LLMScheduler().max_in_flight == llm_scheduler.LLM_SCHEDULER_SLOTS
+    assert LLMScheduler(max_in_flight=0).max_in_flight == 1
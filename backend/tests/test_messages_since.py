@@ -0,0 +1,81 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import crud, models, schemas
+
+
+@pytest.fixture
+def conversation(db, user):
+    return crud.create_conversation(db, user.id)
+
+
+def _say(db, conversation, content, role="user"):
+    return crud.create_message(db, schemas.MessageCreate(conversation_id=conversation.id, content=content, role=role))
+
+
+def test_id_cursor_returns_messages_sharing_the_anchor_timestamp(db, conversation):
+    stamp = datetime(2026, 1, 1, 8, 0, 0)
+    ids = sorted(uuid.uuid4() for _ in range(3))
+    for message_id, content in zip(ids, ("first", "second", "third")):
+        db.add(models.Message(id=message_id, conversation_id=conversation.id, content=content, role="user", created_at=stamp))
+    db.commit()
+
+    newer = crud.get_conversation_messages_since(db, conversation.id, message_id=ids[0])
+    assert [m.content for m in newer] == ["second", "third"]
+    assert crud.get_conversation_messages_since(db, conversation.id, message_id=ids[2]) == []
+
+
+def test_reply_written_with_a_slow_clock_still_follows_the_cursor(db, conversation, monkeypatch):
+    question = _say(db, conversation, "Is it normal to feel numb after a code?")
+
+    # The job worker's clock runs a minute behind the API's
+    class SlowClock(datetime):
+        @classmethod
+        def utcnow(cls):
+            return datetime.utcnow() - timedelta(minutes=1)
+
+    monkeypatch.setattr(crud, "datetime", SlowClock)
+    reply = _say(db, conversation, "Yes, many clinicians do.", role="assistant")
+
+    assert reply.created_at > question.created_at
+    assert [m.id for m in crud.get_conversation_messages_since(db, conversation.id, message_id=question.id)] == [reply.id]
+
+
+def test_unknown_cursor_returns_everything(db, conversation):
+    _say(db, conversation, "hello")
+    _say(db, conversation, "again")
+    assert len(crud.get_conversation_messages_since(db, conversation.id, message_id=uuid.uuid4())) == 2
+
+
+def test_long_poll_times_out_empty(client, auth_headers, db, conversation):
+    latest = _say(db, conversation, "hello")
+    started = time.monotonic()
+    response = client.get(f"/chatbot/messages/{conversation.id}?since={latest.id}&wait=0.3", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json() == []
+    assert time.monotonic() - started < 5
+
+
+def test_long_poll_wakes_when_a_reply_is_saved(auth_headers, db, conversation):
+    from app.main import app
+
+    latest = _say(db, conversation, "hello")
+
+    def reply_later():
+        time.sleep(0.3)
+        _say(db, conversation, "Hi there", role="assistant")
+
+    with TestClient(app) as client:
+        writer = threading.Thread(target=reply_later)
+        writer.start()
+        started = time.monotonic()
+        response = client.get(f"/chatbot/messages/{conversation.id}?since={latest.id}&wait=10", headers=auth_headers)
+        writer.join()
+
+    assert [m["content"] for m in response.json()] == ["Hi there"]
+    assert time.monotonic() - started < 5
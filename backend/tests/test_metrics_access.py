@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+
+from app.routes import metrics as metrics_routes
+
+
+def test_metrics_are_refused_to_remote_clients_without_a_token(client, monkeypatch):
+    monkeypatch.setattr(metrics_routes, "METRICS_TOKEN", "")
+    monkeypatch.setattr(metrics_routes, "METRICS_ALLOW_LOOPBACK", True)
+    assert client.get("/metrics/").status_code == 403
+    assert client.get("/metrics/prometheus").status_code == 403
+
+
+def test_metrics_are_refused_locally_without_a_token_by_default(monkeypatch):
+    from app.main import app
+    monkeypatch.setattr(metrics_routes, "METRICS_TOKEN", "")
+    monkeypatch.setattr(metrics_routes, "METRICS_ALLOW_LOOPBACK", False)
+    local = TestClient(app, client=("127.0.0.1", 50000))
+    assert local.get("/metrics/").status_code == 403
+
+
+def test_metrics_are_served_locally_when_loopback_is_allowed(monkeypatch):
+    from app.main import app
+    monkeypatch.setattr(metrics_routes, "METRICS_TOKEN", "")
+    monkeypatch.setattr(metrics_routes, "METRICS_ALLOW_LOOPBACK", True)
+    local = TestClient(app, client=("127.0.0.1", 50000))
+    assert local.get("/metrics/").status_code == 200
+
+
+def test_metrics_need_the_bearer_token_when_one_is_set(monkeypatch):
+    from app.main import app
+    monkeypatch.setattr(metrics_routes, "METRICS_TOKEN", "scrape-secret")
+    local = TestClient(app, client=("127.0.0.1", 50000))
+    assert local.get("/metrics/").status_code == 401
+    assert local.get("/metrics/", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = local.get("/metrics/prometheus", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
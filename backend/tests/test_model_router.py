@@ -0,0 +1,27 @@
+from app.services.llm_scheduler import Priority
+from app.services.model_router import (
+    CHAT_TASK,
+    JOURNAL_TASK,
+    ROUTER_CHAT_SLO_SECONDS,
+    ROUTER_JOURNAL_SLO_SECONDS,
+    ROUTER_LONG_CHAT_TOKENS,
+    ModelRouter,
+)
+
+
+def test_slow_journal_analyses_do_not_push_chat_off_the_large_model():
+    router = ModelRouter(small_model="small", large_model="large")
+    router.observe("large", JOURNAL_TASK, ROUTER_JOURNAL_SLO_SECONDS - 1)
+
+    assert router.choose(CHAT_TASK, ROUTER_LONG_CHAT_TOKENS, Priority.BACKGROUND) == "large"
+    assert router.choose(JOURNAL_TASK, priority=Priority.BACKGROUND) == "large"
+
+
+def test_each_task_is_held_to_its_own_slo():
+    router = ModelRouter(small_model="small", large_model="large")
+    router.observe("large", CHAT_TASK, ROUTER_CHAT_SLO_SECONDS + 1)
+    router.observe("large", JOURNAL_TASK, ROUTER_JOURNAL_SLO_SECONDS + 1)
+
+    assert router.choose(CHAT_TASK, ROUTER_LONG_CHAT_TOKENS, Priority.BACKGROUND) == "small"
+    assert router.choose(JOURNAL_TASK, priority=Priority.BACKGROUND) == "small"
+    assert router.latency("large", CHAT_TASK) == ROUTER_CHAT_SLO_SECONDS + 1
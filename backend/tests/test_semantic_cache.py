@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import pytest
+
+from app.routes import chatbot as chatbot_routes
+from app.services import course_index as course_index_module
+from app.services.course_index import Passage, course_index
+from app.services.inference_gateway import OLLAMA_EMBED_MODEL, inference_gateway
+from app.services.semantic_cache import context_bucket, semantic_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    semantic_cache.clear()
+    yield
+    semantic_cache.clear()
+
+
+def test_context_bucket_keys_on_every_prompt_field():
+    calm = {"specialty": "Nursing", "burnout_risk": "Low", "recent_mood": "calm", "stress_level": 1, "fatigue_level": 2}
+    assert context_bucket(calm) == context_bucket(dict(calm))
+    for field, value in (("recent_mood", "overwhelmed"), ("stress_level", 5), ("fatigue_level", 5)):
+        assert context_bucket(calm) != context_bucket({**calm, field: value})
+
+
+def test_slow_prompt_embedding_is_a_cache_miss(client, auth_headers, monkeypatch):
+    async def slow_embed(texts, model):
+        await asyncio.sleep(5)
+        return [[1.0]]
+
+    monkeypatch.setattr(inference_gateway, "embed", slow_embed)
+    monkeypatch.setattr(course_index, "passages", [])
+    monkeypatch.setattr(course_index, "loaded_at", time.monotonic())
+
+    async def complete(messages, task, model, **kwargs):
+        return True, "Take a breath."
+
+    monkeypatch.setattr(inference_gateway, "complete", complete)
+
+    started = time.monotonic()
+    response = client.post("/chatbot/quick-message", params={"message": "Can't sleep"}, headers=auth_headers)
+    assert time.monotonic() - started < 2
+    assert response.json()["ai_response"] == "Take a breath."
+    assert semantic_cache.stats()["entries"] == 0
+
+
+def test_quick_message_embeds_the_prompt_once(client, auth_headers, monkeypatch):
+    embedded = []
+    sent = []
+
+    async def embed(texts, model):
+        embedded.append(texts)
+        return [[1.0]]
+
+    async def complete(messages, task, model, **kwargs):
+        sent.append(messages)
+        return True, "Take a breath."
+
+    monkeypatch.setattr(inference_gateway, "embed", embed)
+    monkeypatch.setattr(inference_gateway, "complete", complete)
+    monkeypatch.setattr(course_index, "passages", [Passage("c", "Course", "m", "Module", "Box breathing")])
+    monkeypatch.setattr(course_index, "embed_model", OLLAMA_EMBED_MODEL)
+    monkeypatch.setattr(course_index, "loaded_at", time.monotonic())
+    monkeypatch.setattr(course_index, "vectors", course_index_module.np.ones((1, 1), dtype="float32") if course_index_module.np is not None else [course_index_module._normalize([1.0])])
+
+    response = client.post("/chatbot/quick-message", params={"message": "Can't sleep"}, headers=auth_headers)
+    assert response.json()["ai_response"] == "Take a breath."
+    assert len(embedded) == 1
+    assert "Course > Module" in str(sent[0])
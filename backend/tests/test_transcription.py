@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from app.models import Job
+from app.services import ai_jobs, job_queue
+from app.services.transcription import TranscriptionPool, chunk_windows, segments_in_window
+
+
+def _segment(start, end, text):
+    return SimpleNamespace(start=start, end=end, text=text)
+
+
+def test_overlapping_windows_keep_each_segment_once():
+    # Window [30, 60) decoded from 27s: times are relative to 27
+    segments = [
+        _segment(0.0, 2.0, "end of the last window"),   # midpoint 28s
+        _segment(2.0, 5.0, "word across the cut"),      # midpoint 30.5s
+        _segment(30.0, 34.0, "next window"),            # midpoint 59s
+        _segment(32.0, 35.0, "past the end"),           # midpoint 60.5s
+    ]
+    kept = segments_in_window(segments, 27.0, 30.0, 60.0)
+    assert [segment.text for segment in kept] == ["word across the cut", "next window"]
+
+    # The final, open-ended window keeps everything after its start
+    assert len(segments_in_window(segments, 27.0, 30.0, None)) == 3
+
+
+def test_windows_cover_the_recording():
+    assert chunk_windows(None) == [(0.0, None)]
+    assert chunk_windows(70, 30) == [(0.0, 30.0), (30.0, 60.0), (60.0, None)]
+
+
+def test_audio_waits_for_a_configured_backend_even_if_not_installed_here(monkeypatch):
+    monkeypatch.setattr(ai_jobs, "transcription_pool", TranscriptionPool("none"))
+    assert not ai_jobs.needs_transcription("", "audio/a.m4a")
+
+    # The API image may not have faster-whisper; the worker does the transcribing
+    pool = TranscriptionPool("whisper")
+    monkeypatch.setattr(ai_jobs, "transcription_pool", pool)
+    assert pool.configured
+    assert ai_jobs.needs_transcription("", "audio/a.m4a")
+    assert not ai_jobs.needs_transcription("Typed too", "audio/a.m4a")
+
+
+def test_renewed_lock_is_not_reaped(db, monkeypatch):
+    locked_at = datetime.utcnow() - timedelta(seconds=job_queue.JOB_LOCK_TIMEOUT + 60)
+    job = Job(job_type="transcribe_audio", payload={}, status="running", attempts=1, max_attempts=3,
+              locked_by="worker-a", locked_at=locked_at, run_after=locked_at)
+    db.add(job)
+    db.commit()
+
+    assert not job_queue.renew_job_lock(str(job.id), "worker-b")
+    assert job_queue.renew_job_lock(str(job.id), "worker-a")
+    job_queue.requeue_stale_jobs(db)
+
+    db.refresh(job)
+    assert job.status == "running"
+    assert job.locked_by == "worker-a"
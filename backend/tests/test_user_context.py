@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from app import models
+from app.database import SessionLocal
+from app.services import user_context
+from app.services.user_context import user_context_cache
+
+
+def _drop_snapshot(db, user):
+    db.query(models.UserContextSnapshot).filter(models.UserContextSnapshot.user_id == user.id).delete()
+    db.commit()
+
+
+def test_snapshot_created_by_another_session_is_updated_not_duplicated(db, user, monkeypatch):
+    _drop_snapshot(db, user)
+    find_snapshot = user_context._find_snapshot
+    lookups = []
+
+    def racing_find(session, user_id, for_update=False):
+        if not lookups:
+            # Another request creates the row between our lookup and our insert
+            lookups.append(user_id)
+            user_context.build_snapshot(user_id)
+            return None
+        return find_snapshot(session, user_id, for_update)
+
+    monkeypatch.setattr(user_context, "_find_snapshot", racing_find)
+
+    snapshot = user_context.get_snapshot(db, user.id)
+    user_context._apply_mood(snapshot, models.MoodEntry(user_id=user.id, mood="tired", timestamp=datetime.utcnow()))
+    db.commit()
+
+    rows = db.query(models.UserContextSnapshot).filter(models.UserContextSnapshot.user_id == user.id).all()
+    assert len(rows) == 1
+    assert rows[0].recent_mood == "tired"
+
+
+def test_backfill_does_not_commit_the_callers_session(db, user):
+    _drop_snapshot(db, user)
+    user_context_cache.invalidate(user.id)
+
+    user.name = "Uncommitted Name"
+    context = user_context_cache.get(db, user.id)
+    db.rollback()
+
+    assert context["specialty"] == "Nursing"
+    check = SessionLocal()
+    try:
+        assert check.query(models.User).filter(models.User.id == user.id).one().name == "Test Clinician"
+        assert check.query(models.UserContextSnapshot).filter(models.UserContextSnapshot.user_id == user.id).count() == 1
+    finally:
+        check.close()
@@ -40,6 +40,7 @@ interface JournalEntry {
   id: string;
   text_content: string;
   analysis: string;
+  analysis_status?: 'pending' | 'complete' | 'fallback';
   created_at: string;
 }
 
@@ -63,6 +64,8 @@ export default function CarelyJournalScreen({ navigation }: any) {
   
   const scrollViewRef = useRef<ScrollView>(null);
   const slideAnimation = useRef(new Animated.Value(0)).current;
+  // Entries whose analysis we are already waiting on
+  const watchedEntries = useRef<Set<string>>(new Set());
 
   useEffect(() => {
     initializeData();
@@ -168,11 +171,36 @@ export default function CarelyJournalScreen({ navigation }: any) {
 
       const response = await api.get(`/journals/user/${userId}`);
       setJournalEntries(response.data);
+      response.data
+        .filter((entry: JournalEntry) => entry.analysis_status === 'pending')
+        .forEach((entry: JournalEntry) => waitForAnalysis(entry.id));
     } catch (error) {
       console.error('Error loading journal entries:', error);
     }
   };
 
+  // Long-poll one entry's analysis instead of re-fetching every entry
+  const waitForAnalysis = async (entryId: string) => {
+    if (watchedEntries.current.has(entryId)) return;
+    watchedEntries.current.add(entryId);
+
+    try {
+      for (let attempt = 0; attempt < 10; attempt++) {
+        const response = await api.get(`/journals/${entryId}/analysis`, { params: { wait: 25 } });
+        if (response.data.analysis_status !== 'pending') {
+          setJournalEntries(prev => prev.map(entry =>
+            entry.id === entryId ? { ...entry, ...response.data } : entry
+          ));
+          return;
+        }
+      }
+    } catch (error) {
+      console.error('Error waiting for journal analysis:', error);
+    } finally {
+      watchedEntries.current.delete(entryId);
+    }
+  };
+
   const switchTab = (tab: 'carely' | 'journal') => {
     Animated.timing(slideAnimation, {
       toValue: tab === 'carely' ? 0 : 1,
@@ -301,10 +329,11 @@ export default function CarelyJournalScreen({ navigation }: any) {
       setJournalEntries(prev => [response.data, ...prev]);
       setJournalContent('');
       setShowJournalForm(false);
+      waitForAnalysis(response.data.id);
       
       Alert.alert(
         'Journal Saved! 📝', 
-        'Your journal entry has been saved successfully! Carely is analyzing it in the background - refresh to see the insights.',
+        'Your journal entry has been saved successfully! Carely is analyzing it in the background - the insights will appear here shortly.',
         [{ text: 'Great!', style: 'default' }]
       );
 
@@ -466,7 +495,9 @@ export default function CarelyJournalScreen({ navigation }: any) {
 
   const renderJournalEntry = (entry: JournalEntry) => {
     const isExpanded = expandedEntries.has(entry.id);
-    const isAnalysisReady = entry.analysis !== "Your journal entry is being analyzed by Carely. Refresh to see the insights!";
+    const isAnalysisReady = entry.analysis_status
+      ? entry.analysis_status !== 'pending'
+      : entry.analysis !== "Your journal entry is being analyzed by Carely. Refresh to see the insights!";
 
     return (
       <View key={entry.id} style={styles.journalEntryCard}>
@@ -490,7 +521,7 @@ export default function CarelyJournalScreen({ navigation }: any) {
             if (!isAnalysisReady) {
               Alert.alert(
                 'Analysis in Progress',
-                'Carely is still analyzing this entry. Please refresh or check back in a moment.',
+                'Carely is still analyzing this entry. The insights will appear here in a moment.',
                 [
                   { text: 'Refresh', onPress: () => loadJournalEntries() },
                   { text: 'OK', style: 'cancel' }